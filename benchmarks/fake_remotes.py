@@ -0,0 +1,169 @@
+"""
+Generators for synthetic remotes and manifests, so benchmarks run
+against local ``file://`` repositories of a known shape instead of
+GitHub. Histories are written with ``git fast-import``, which builds
+hundreds of commits in a fraction of a second.
+"""
+import os
+import subprocess
+
+AUTHOR = b"repoman <repoman@localhost>"
+EPOCH = 1500000000
+PRODUCT = "BenchProduct"
+# Releases commit and tag, which needs an identity
+GIT_ENV = dict(
+    GIT_AUTHOR_NAME="repoman", GIT_AUTHOR_EMAIL="repoman@localhost",
+    GIT_COMMITTER_NAME="repoman", GIT_COMMITTER_EMAIL="repoman@localhost"
+)
+
+
+class RemoteShape:
+    """
+    Shape of the history generated for every package.
+    """
+
+    def __init__(self, depth=20, tags=5, files=50, paths=3):
+        """
+        :param depth: Number of commits on master
+        :param tags: Number of release tags, spread over the history
+        and always including the last commit
+        :param files: Number of files in the tree
+        :param paths: Number of subdirectories the files are spread
+        over. Manifest path entries use these.
+        """
+        self.depth = max(depth, 1)
+        self.tags = max(min(tags, self.depth), 1)
+        self.files = max(files, 1)
+        self.paths = max(paths, 1)
+
+    def tag_commits(self):
+        """
+        Indexes of the commits which are tagged, oldest first.
+        """
+        step = float(self.depth) / self.tags
+        return [int(round(step * (i + 1))) - 1 for i in range(self.tags)]
+
+    def __repr__(self):
+        return repr(self.__dict__)
+
+
+def package_names(count):
+    return ["pkg{:03}".format(i) for i in range(count)]
+
+
+def tag_name(package, index):
+    return "{}-01-{:02}-{:02}".format(package, index // 100, index % 100)
+
+
+def path_name(index):
+    return "sub{}".format(index)
+
+
+def make_remotes(remote_base, packages, shape):
+    """
+    Create a bare repository for each package under remote_base.
+    :returns: Dictionary of package name to its list of tags
+    """
+    tags = {}
+    for package in packages:
+        tags[package] = make_remote(remote_base, package, shape)
+    return tags
+
+
+def make_remote(remote_base, package, shape, extra_files=None):
+    """
+    Create the bare repository ``package.git`` with shape.depth
+    commits. The first commit adds every file, later ones modify one
+    file in each subdirectory.
+    :param extra_files: Optional dictionary of top-level file name to
+    content, added in the first commit
+    :returns: List of tags, oldest first
+    """
+    bare_path = os.path.join(remote_base, package + ".git")
+    subprocess.check_call(["git", "init", "-q", "--bare", bare_path])
+    tag_commits = shape.tag_commits()
+    tags = [tag_name(package, i) for i in range(len(tag_commits))]
+    stream = []
+    for i in range(shape.depth):
+        stream += _commit(i, _changes(package, shape, i, extra_files))
+    for tag, commit in zip(tags, tag_commits):
+        stream += _tag(tag, commit)
+    process = subprocess.Popen(["git", "fast-import", "--quiet"],
+                               cwd=bare_path, stdin=subprocess.PIPE)
+    process.communicate(b"".join(stream))
+    if process.returncode:
+        raise RuntimeError("fast-import failed for " + package)
+    return tags
+
+
+def make_product(remote_base, manifest):
+    """
+    Create a product repository whose packageList.txt is manifest.
+    :returns: List of tags of the product
+    """
+    with open(manifest) as f:
+        content = f.read()
+    return make_remote(remote_base, PRODUCT, RemoteShape(1, 1, 1, 1),
+                       {"packageList.txt": content,
+                        "CHANGELOG.md": "# Changelog\n\n## [01-00-00]\n"})
+
+
+def write_manifest(path, tags, path_entries, shape):
+    """
+    Write a packageList.txt staging every package at its last tag.
+    The first path_entries packages also get a path entry at an
+    older tag, like celestialSources/Pulsar in ScienceTools.
+    """
+    with open(path, "w") as f:
+        f.write("# Synthetic benchmark product\n")
+        for i, package in enumerate(sorted(tags)):
+            package_tags = tags[package]
+            f.write("{} {}\n".format(package, package_tags[-1]))
+            if i < path_entries:
+                f.write("{}/{} {}  # older path\n".format(
+                    package, path_name(i % shape.paths), package_tags[0]))
+
+
+def _changes(package, shape, index, extra_files):
+    if index == 0:
+        files = [_file_path(shape, i) for i in range(shape.files)]
+        changes = [("README", "{} 0\n".format(package))]
+        changes += [(path, "{} 0\n".format(path)) for path in files]
+        changes += sorted((extra_files or {}).items())
+        return changes
+    return [(_file_path(shape, d), "{} {}\n".format(package, index))
+            for d in range(min(shape.paths, shape.files))]
+
+
+def _file_path(shape, index):
+    return "{}/file{}.txt".format(path_name(index % shape.paths), index)
+
+
+def _data(content):
+    if not isinstance(content, bytes):
+        content = content.encode("utf-8")
+    return [b"data ", str(len(content)).encode("ascii"), b"\n", content,
+            b"\n"]
+
+
+def _commit(index, changes):
+    stamp = "{} +0000".format(EPOCH + index * 60).encode("ascii")
+    stream = [b"commit refs/heads/master\n",
+              b"mark :", str(index + 1).encode("ascii"), b"\n",
+              b"author ", AUTHOR, b" ", stamp, b"\n",
+              b"committer ", AUTHOR, b" ", stamp, b"\n"]
+    stream += _data("commit {}".format(index))
+    if index:
+        stream += [b"from :", str(index).encode("ascii"), b"\n"]
+    for path, content in changes:
+        stream += [b"M 100644 inline ", path.encode("utf-8"), b"\n"]
+        stream += _data(content)
+    return stream
+
+
+def _tag(tag, commit):
+    stamp = "{} +0000".format(EPOCH + commit * 60).encode("ascii")
+    stream = [b"tag ", tag.encode("utf-8"), b"\n",
+              b"from :", str(commit + 1).encode("ascii"), b"\n",
+              b"tagger ", AUTHOR, b" ", stamp, b"\n"]
+    return stream + _data(tag)
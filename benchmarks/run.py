@@ -0,0 +1,256 @@
+"""
+Benchmark staging and release operations against synthetic local
+remotes. Results are written as JSON, so runs on two branches can be
+compared with --compare.
+
+Run from a checkout of repoman::
+
+    PYTHONPATH=. python benchmarks/run.py -o master.json
+    git checkout my-branch
+    PYTHONPATH=. python benchmarks/run.py --compare master.json
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict
+from timeit import default_timer
+
+import click
+
+from fake_remotes import RemoteShape, PRODUCT, GIT_ENV, package_names, \
+    make_remotes, make_product, write_manifest
+
+BENCHMARKS = ["checkout_packages", "checkout_packages_unchanged",
+              "read_manifest", "update_manifest", "prepare", "perform"]
+
+
+class Fixture:
+    """
+    Synthetic remotes and a product manifest in a scratch directory.
+    """
+
+    def __init__(self, root, packages, shape, path_entries):
+        self.root = root
+        self.shape = shape
+        self.remote_base = os.path.join(root, "remotes")
+        os.makedirs(self.remote_base)
+        # Remotes are reached over file:// like they would over the
+        # network, rather than with git's local clone shortcuts
+        self.remote_url = "file://" + self.remote_base
+        self.tags = make_remotes(self.remote_base, package_names(packages),
+                                 shape)
+        self.manifest = os.path.join(root, "packageList.txt")
+        write_manifest(self.manifest, self.tags, path_entries, shape)
+        make_product(self.remote_base, self.manifest)
+        self._count = 0
+
+    def workspace_path(self):
+        self._count += 1
+        path = os.path.join(self.root, "workspace{}".format(self._count))
+        os.makedirs(path)
+        return path
+
+
+class Timer:
+
+    def __init__(self, name, repeat, number=1):
+        self.name = name
+        self.repeat = repeat
+        self.number = number
+        self.times = []
+
+    def measure(self, func, *args):
+        start = default_timer()
+        for _ in range(self.number):
+            func(*args)
+        self.times.append((default_timer() - start) / self.number)
+
+    def result(self):
+        times = sorted(self.times)
+        return OrderedDict([
+            ("min", times[0]),
+            ("median", times[len(times) // 2]),
+            ("max", times[-1]),
+            ("repeat", len(times)),
+            ("number", self.number),
+            ("times", self.times)])
+
+
+def bench_checkout_packages(fixture, timer, jobs):
+    from repoman.workspace import Workspace
+    from repoman.manifest import read_manifest
+    specs = read_manifest(fixture.manifest)
+    for _ in range(timer.repeat):
+        workspace = Workspace(fixture.workspace_path(), fixture.remote_url)
+        timer.measure(workspace.checkout_packages, specs, None, False, False,
+                      jobs)
+        shutil.rmtree(workspace.working_path)
+
+
+def bench_checkout_packages_unchanged(fixture, timer, jobs):
+    from repoman.workspace import Workspace
+    from repoman.manifest import read_manifest
+    specs = read_manifest(fixture.manifest)
+    working_path = fixture.workspace_path()
+    state_file = os.path.join(working_path, ".repoman", "state.json")
+    workspace = Workspace(working_path, fixture.remote_url,
+                          state_file=state_file)
+    workspace.checkout_packages(specs, jobs=jobs)
+    workspace.save_state()
+    for _ in range(timer.repeat):
+        workspace = Workspace(working_path, fixture.remote_url,
+                              state_file=state_file)
+        timer.measure(workspace.checkout_packages, specs, None, False, False,
+                      jobs)
+    shutil.rmtree(working_path)
+
+
+def bench_read_manifest(fixture, timer, jobs):
+    from repoman.manifest import read_manifest
+    for _ in range(timer.repeat):
+        timer.measure(read_manifest, fixture.manifest)
+
+
+def bench_update_manifest(fixture, timer, jobs):
+    from repoman.manifest import read_manifest, update_manifest
+    from repoman.package import PackageSpec
+    specs = [PackageSpec(spec.name, spec.ref + "-next", spec.ref_path)
+             for spec in read_manifest(fixture.manifest)]
+    # Every call updates its own copy of the original manifest
+    paths = [os.path.join(fixture.root, "update{}.txt".format(i))
+             for i in range(timer.number)]
+    for _ in range(timer.repeat):
+        for path in paths:
+            shutil.copy(fixture.manifest, path)
+        start = default_timer()
+        for path in paths:
+            update_manifest(path, specs)
+        timer.times.append((default_timer() - start) / timer.number)
+
+
+def bench_release(fixture, prepare_timer, perform_timer):
+    from repoman.workspace import Workspace
+    from repoman.package import Package
+    from repoman.release import prepare, perform
+    workspace = Workspace(fixture.workspace_path(), fixture.remote_url)
+    workspace.checkout(PRODUCT, "master")
+    package = Package(PRODUCT, workspace,
+                      os.path.join(workspace.working_path, PRODUCT))
+    for i in range(prepare_timer.repeat):
+        version = "02-00-{:02}".format(i)
+        prepare_timer.measure(prepare, package, version,
+                              "## [{}]\n- Benchmark".format(version))
+        perform_timer.measure(perform, package, False)
+    shutil.rmtree(workspace.working_path)
+
+
+def environment():
+    from repoman import __version__
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        revision = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=repo_dir).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    git_version = subprocess.check_output(["git", "--version"]).decode()
+    return OrderedDict([
+        ("repoman", __version__),
+        ("revision", revision),
+        ("python", platform.python_version()),
+        ("git", git_version.split()[2]),
+        ("platform", platform.platform())])
+
+
+def compare(old, new):
+    click.echo("{:<30} {:>12} {:>12} {:>8}".format(
+        "benchmark", "old", "new", "ratio"), err=True)
+    for name, result in new["benchmarks"].items():
+        old_result = old["benchmarks"].get(name)
+        if old_result is None:
+            continue
+        ratio = result["median"] / old_result["median"] \
+            if old_result["median"] else float("inf")
+        click.echo("{:<30} {:>11.6f}s {:>11.6f}s {:>7.2f}x".format(
+            name, old_result["median"], result["median"], ratio), err=True)
+
+
+@click.command()
+@click.option('--packages', default=50, type=click.IntRange(1),
+              help="Number of packages in the product")
+@click.option('--depth', default=20, type=click.IntRange(1),
+              help="Commits of history per package")
+@click.option('--tags', default=5, type=click.IntRange(1),
+              help="Release tags per package")
+@click.option('--files', default=50, type=click.IntRange(1),
+              help="Files in the tree of each package")
+@click.option('--paths', default=3, type=click.IntRange(1),
+              help="Subdirectories of each package")
+@click.option('--path-entries', default=5, type=click.IntRange(0),
+              help="Number of packages with a path entry in the manifest")
+@click.option('--jobs', '-j', default=8, type=click.IntRange(1),
+              help="Concurrency for staging")
+@click.option('--repeat', default=3, type=click.IntRange(1),
+              help="Times each benchmark is run")
+@click.option('--only', multiple=True, type=click.Choice(BENCHMARKS),
+              help="Only run these benchmarks")
+@click.option('--output', '-o', type=click.File("w"), default="-",
+              help="Write results to a file")
+@click.option('--compare', 'baseline', type=click.File("r"),
+              help="Print a comparison with earlier results")
+@click.option('--keep', is_flag=True,
+              help="Keep the scratch directory")
+def main(packages, depth, tags, files, paths, path_entries, jobs, repeat,
+         only, output, baseline, keep):
+    """Benchmark repoman against synthetic local remotes."""
+    shape = RemoteShape(depth, tags, files, paths)
+    os.environ.update(GIT_ENV)
+    root = tempfile.mkdtemp(prefix="repoman-bench-")
+    selected = only or BENCHMARKS
+    try:
+        start = default_timer()
+        fixture = Fixture(root, packages, shape, path_entries)
+        setup_time = default_timer() - start
+        timers = OrderedDict()
+        for name in selected:
+            number = 100 if name in ("read_manifest", "update_manifest") \
+                else 1
+            timers[name] = Timer(name, repeat, number)
+        for name in ["checkout_packages", "checkout_packages_unchanged",
+                     "read_manifest", "update_manifest"]:
+            if name in timers:
+                click.echo("Running " + name, err=True)
+                bench = globals()["bench_" + name]
+                bench(fixture, timers[name], jobs)
+        if "prepare" in timers or "perform" in timers:
+            click.echo("Running prepare and perform", err=True)
+            bench_release(fixture,
+                          timers.get("prepare", Timer("prepare", repeat)),
+                          timers.get("perform", Timer("perform", repeat)))
+    finally:
+        if keep:
+            click.echo("Kept " + root, err=True)
+        else:
+            shutil.rmtree(root)
+
+    results = OrderedDict([
+        ("environment", environment()),
+        ("config", OrderedDict([
+            ("packages", packages), ("depth", depth), ("tags", tags),
+            ("files", files), ("paths", paths),
+            ("path_entries", path_entries), ("jobs", jobs),
+            ("repeat", repeat)])),
+        ("setup_time", setup_time),
+        ("benchmarks", OrderedDict(
+            (name, timer.result()) for name, timer in timers.items()))])
+    json.dump(results, output, indent=4, separators=(',', ': '))
+    output.write("\n")
+    if baseline is not None:
+        compare(json.load(baseline), results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
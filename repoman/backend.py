@@ -0,0 +1,249 @@
+from .error import RepomanError
+import os
+import subprocess
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The backend module answers the small, read-only queries staging and
+releasing make: reading a file at a ref, checking an object or tag
+exists, resolving names to commits, and listing tags. Commands which
+change a repository, like checkout, fetch or tag, always run through
+GitPython.
+"""
+
+GITPYTHON = "gitpython"
+CAT_FILE = "cat-file"
+BACKEND_ENV = "REPOMAN_GIT_BACKEND"
+CONFIG_KEY = "git.backend"
+OBJECT_TYPES = ["blob", "tree", "commit", "tag"]
+
+
+class GitBackend:
+    """
+    Object queries against a GitPython Repo. This implementation runs
+    one git process per query.
+    """
+
+    name = GITPYTHON
+
+    def read_file(self, repo, ref, path):
+        """
+        :returns: Content of the file at path in ref, without its final
+        newline like any GitPython output, or None if there is no such
+        file
+        """
+        from git import GitCommandError
+        try:
+            return repo.git.cat_file("blob", "{}:{}".format(ref, path))
+        except GitCommandError:
+            return None
+
+    def has_object(self, repo, name):
+        """
+        Whether a revision, such as a SHA or ``ref:path``, names an
+        object of the repository.
+        """
+        from git import GitCommandError
+        try:
+            repo.git.cat_file("-e", name)
+        except GitCommandError:
+            return False
+        return True
+
+    def has_commit(self, repo, name):
+        return self.has_object(repo, name + "^{commit}")
+
+    def has_tag(self, repo, tag):
+        return self.has_object(repo, "refs/tags/" + tag)
+
+    def tags(self, repo, pattern=None):
+        """
+        :param pattern: Optional glob, e.g. ``astro-*``, tag names must
+        match
+        :returns: List of tag names
+        """
+        output = repo.git.for_each_ref("--format=%(refname)",
+                                       "refs/tags/" + (pattern or ""))
+        return [refname[len("refs/tags/"):]
+                for refname in output.splitlines()]
+
+    def commits(self, repo, names):
+        """
+        Resolve revisions to commit SHAs.
+        :returns: Dictionary of name to SHA for names which resolved
+        """
+        if not names:
+            return {}
+        with tempfile.TemporaryFile() as stdin:
+            stdin.write("".join(name + "^{commit}\n"
+                                for name in names).encode("utf-8"))
+            stdin.seek(0)
+            output = repo.git.cat_file("--batch-check", istream=stdin)
+        commits = {}
+        for name, line in zip(names, output.splitlines()):
+            fields = line.split()
+            if len(fields) == 3 and fields[1] == "commit":
+                commits[name] = fields[0]
+        return commits
+
+    def invalidate(self, repo):
+        """
+        Forget what is known of a repository, after it was fetched
+        into, committed to or tagged.
+        """
+
+    def close(self):
+        """
+        Release the resources held for every repository.
+        """
+
+
+class CatFileBackend(GitBackend):
+    """
+    Object queries answered by a long-lived ``git cat-file --batch``
+    process per repository, so a query costs a pipe round trip instead
+    of starting git. Tags are still listed by running git, which
+    cat-file can't do.
+    """
+
+    name = CAT_FILE
+
+    def __init__(self):
+        self._processes = {}
+        self._lock = threading.Lock()
+
+    def read_file(self, repo, ref, path):
+        found = self._process(repo).get("{}:{}".format(ref, path))
+        if found is None or found[1] != "blob":
+            return None
+        content = found[2].decode("utf-8")
+        return content[:-1] if content.endswith("\n") else content
+
+    def has_object(self, repo, name):
+        return self._process(repo).get(name) is not None
+
+    def commits(self, repo, names):
+        process = self._process(repo)
+        commits = {}
+        for name in names:
+            found = process.get(name + "^{commit}")
+            if found is not None and found[1] == "commit":
+                commits[name] = found[0]
+        return commits
+
+    def invalidate(self, repo):
+        with self._lock:
+            process = self._processes.pop(_git_dir(repo), None)
+        if process is not None:
+            process.close()
+
+    def close(self):
+        with self._lock:
+            processes, self._processes = self._processes, {}
+        for process in processes.values():
+            process.close()
+
+    def _process(self, repo):
+        git_dir = _git_dir(repo)
+        with self._lock:
+            process = self._processes.get(git_dir)
+            if process is None:
+                process = _CatFile(git_dir)
+                self._processes[git_dir] = process
+            return process
+
+
+class _CatFile:
+    """
+    A ``git cat-file --batch`` process, shared by threads one query at
+    a time.
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self._lock = threading.Lock()
+        self._process = None
+
+    def get(self, name):
+        """
+        :returns: Tuple of (SHA, type, content) of the object, or None
+        if name doesn't resolve to one
+        """
+        if "\n" in name:
+            return None
+        with self._lock:
+            try:
+                return self._get(name)
+            except (IOError, OSError, ValueError) as e:
+                # Start a new process for the next query
+                self._stop()
+                raise RepomanError("Unable to read {} from {}".format(
+                    name, self.git_dir), str(e))
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def _get(self, name):
+        if self._process is None:
+            self._process = subprocess.Popen(
+                ["git", "--git-dir", self.git_dir, "cat-file", "--batch"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._process.stdin.write(name.encode("utf-8") + b"\n")
+        self._process.stdin.flush()
+        header = self._process.stdout.readline()
+        if not header:
+            raise IOError("cat-file exited")
+        fields = header.decode("utf-8").split()
+        # Otherwise "<name> missing" or "<name> ambiguous"
+        if len(fields) != 3 or fields[1] not in OBJECT_TYPES:
+            return None
+        sha, object_type, size = fields
+        content = self._read(int(size))
+        # Every object is followed by a newline
+        self._read(1)
+        return sha, object_type, content
+
+    def _read(self, size):
+        chunks = []
+        while size:
+            chunk = self._process.stdout.read(size)
+            if not chunk:
+                raise IOError("cat-file exited")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _stop(self):
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except (IOError, OSError):
+            pass
+        process.wait()
+        process.stdout.close()
+
+
+BACKENDS = {GITPYTHON: GitBackend, CAT_FILE: CatFileBackend}
+
+
+def get_backend(name=None):
+    """
+    Create a backend by name. Without one, ``REPOMAN_GIT_BACKEND`` is
+    read, then the GitPython backend is used.
+    """
+    name = name or os.environ.get(BACKEND_ENV) or GITPYTHON
+    if name not in BACKENDS:
+        raise RepomanError("Unknown git backend: {}. Expected one of: "
+                           "{}".format(name, ", ".join(sorted(BACKENDS))))
+    return BACKENDS[name]()
+
+
+def _git_dir(repo):
+    return os.path.abspath(repo.git_dir)
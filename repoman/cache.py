@@ -0,0 +1,288 @@
+import git
+from git.exc import GitCommandError
+from .error import RepomanError
+import os
+import shutil
+import threading
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+"""
+The cache module keeps one bare mirror per package in a shared
+directory. Workspaces borrow objects from the mirrors through git
+alternates and fetch refs from them, so after the first download
+a new workspace only needs local I/O.
+"""
+
+CACHE_MAX_AGE = 3600
+MIRROR_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+UPDATED_FILE = "repoman_updated"
+# Git directories of the workspace repos borrowing from a mirror
+USERS_FILE = "repoman_users"
+LOCK_FILE = "repoman.lock"
+
+
+class MirrorCache:
+
+    def __init__(self, cache_dir, max_age=CACHE_MAX_AGE):
+        """
+        :param cache_dir: Directory holding the bare mirrors
+        :param max_age: Seconds after which a mirror is refreshed from
+        its remote the next time it is used. If None, mirrors are only
+        refreshed when they are missing a requested ref.
+        """
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def mirror_path(self, package):
+        return os.path.join(self.cache_dir, package + ".git")
+
+    def has_mirror(self, package):
+        return os.path.exists(os.path.join(self.mirror_path(package), "HEAD"))
+
+    def last_updated(self, package):
+        stamp = os.path.join(self.mirror_path(package), UPDATED_FILE)
+        if not os.path.exists(stamp):
+            return None
+        return os.path.getmtime(stamp)
+
+    def is_stale(self, package):
+        if self.max_age is None:
+            return False
+        updated = self.last_updated(package)
+        return updated is None or time.time() - updated > self.max_age
+
+    def has_ref(self, package, ref):
+        mirror = git.Repo(self.mirror_path(package))
+        try:
+            mirror.git.rev_parse("--verify", "-q", ref + "^{commit}")
+            return True
+        except GitCommandError:
+            return False
+
+    def ensure(self, package, repo_url, ref=None, timeout=None):
+        """
+        Make sure a usable mirror exists for package, refreshing it
+        from repo_url if it is missing, stale, or doesn't know ref.
+        :param timeout: Seconds after which a refresh is killed
+        :returns: Path to the mirror
+        """
+        with self._package_lock(package):
+            if not self.has_mirror(package) or self.is_stale(package) or \
+                    (ref and not self.has_ref(package, ref)):
+                self.update(package, repo_url, timeout)
+        return self.mirror_path(package)
+
+    def update(self, package, repo_url, timeout=None):
+        """
+        Create or refresh the mirror for package from repo_url.
+        Callers are expected to hold the package lock.
+        :param timeout: Seconds after which the fetch is killed
+        """
+        mirror_path = self.mirror_path(package)
+        if not self.has_mirror(package):
+            logger.info("Creating mirror for {} in {}".format(package,
+                                                               mirror_path))
+            mirror = git.Repo.init(mirror_path, bare=True)
+            with mirror.config_writer() as config:
+                config.set_value('remote "origin"', "url", repo_url)
+        else:
+            logger.debug("Refreshing mirror for {}".format(package))
+            mirror = git.Repo(mirror_path)
+        _keep_objects(mirror)
+        mirror.git.fetch("--prune", "origin", *MIRROR_REFSPECS,
+                         kill_after_timeout=timeout)
+        with open(os.path.join(mirror_path, UPDATED_FILE), "w"):
+            pass
+
+    def link(self, repo, package):
+        """
+        Borrow objects from the package mirror through git alternates.
+        The repo is recorded as a user of the mirror, so the mirror
+        isn't pruned from under it.
+        """
+        self._add_user(package, os.path.abspath(repo.git_dir))
+        alternates = os.path.join(repo.git_dir, "objects", "info",
+                                  "alternates")
+        objects = os.path.join(self.mirror_path(package), "objects")
+        if os.path.exists(alternates):
+            with open(alternates) as f:
+                if objects in f.read().splitlines():
+                    return
+        if not os.path.isdir(os.path.dirname(alternates)):
+            os.makedirs(os.path.dirname(alternates))
+        with open(alternates, "a") as f:
+            f.write(objects + "\n")
+
+    def mirrors(self):
+        """
+        List the packages which have a mirror in the cache.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return sorted(entry[:-len(".git")]
+                      for entry in os.listdir(self.cache_dir)
+                      if entry.endswith(".git") and
+                      self.has_mirror(entry[:-len(".git")]))
+
+    def size(self, package):
+        """
+        Size in bytes of the package mirror on disk.
+        """
+        total = 0
+        for root, _, files in os.walk(self.mirror_path(package)):
+            for name in files:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    total += os.path.getsize(path)
+        return total
+
+    def users(self, package):
+        """
+        List the repos which still borrow objects from the package
+        mirror.
+        :returns: List of git directories
+        """
+        users_file = os.path.join(self.mirror_path(package), USERS_FILE)
+        if not os.path.exists(users_file):
+            return []
+        objects = os.path.join(self.mirror_path(package), "objects")
+        with open(users_file) as f:
+            return [git_dir for git_dir in f.read().splitlines()
+                    if objects in _alternates(git_dir)]
+
+    def prune(self, packages=None, older_than=None, dissociate=False):
+        """
+        Remove mirrors from the cache. Mirrors which workspace repos
+        still borrow objects from are kept, unless dissociate is set.
+        :param packages: Only consider these packages
+        :param older_than: Only remove mirrors not refreshed in this
+        many seconds
+        :param dissociate: Copy the objects borrowed from a mirror into
+        the repos using it (``git repack -a -d``), and stop borrowing
+        from it, before removing it
+        :returns: List of pruned packages
+        """
+        pruned = []
+        for package in self.mirrors():
+            if packages and package not in packages:
+                continue
+            updated = self.last_updated(package)
+            if older_than is not None and updated is not None and \
+                    time.time() - updated <= older_than:
+                continue
+            with self._package_lock(package):
+                users = self.users(package)
+                if users and not dissociate:
+                    logger.warning("Not pruning {}, {} repos borrow objects "
+                                   "from it: {}".format(package, len(users),
+                                                        ", ".join(users)))
+                    continue
+                for git_dir in users:
+                    self._dissociate(package, git_dir)
+                shutil.rmtree(self.mirror_path(package))
+            pruned.append(package)
+        return pruned
+
+    def _dissociate(self, package, git_dir):
+        logger.info("Dissociating {} from the {} mirror".format(git_dir,
+                                                                 package))
+        objects = os.path.join(self.mirror_path(package), "objects")
+        try:
+            # Without -l, borrowed objects are packed too
+            git.Repo(git_dir).git.repack("-a", "-d", "-q")
+        except GitCommandError as e:
+            raise RepomanError("Unable to dissociate {} from the {} "
+                               "mirror".format(git_dir, package), e.stderr)
+        alternates = os.path.join(git_dir, "objects", "info", "alternates")
+        remaining = [line for line in _alternates(git_dir)
+                     if line != objects]
+        if remaining:
+            with open(alternates, "w") as f:
+                f.write("".join(line + "\n" for line in remaining))
+        else:
+            os.remove(alternates)
+
+    def _add_user(self, package, git_dir):
+        with self._package_lock(package):
+            if not self.has_mirror(package):
+                return
+            users_file = os.path.join(self.mirror_path(package), USERS_FILE)
+            if os.path.exists(users_file):
+                with open(users_file) as f:
+                    if git_dir in f.read().splitlines():
+                        return
+            with open(users_file, "a") as f:
+                f.write(git_dir + "\n")
+
+    def _package_lock(self, package):
+        with self._locks_lock:
+            if package not in self._locks:
+                self._locks[package] = _MirrorLock(
+                    os.path.join(self.cache_dir, package + "." + LOCK_FILE))
+            return self._locks[package]
+
+
+def _keep_objects(mirror):
+    """
+    Workspace repos borrow objects from mirrors, so objects which are
+    no longer referenced, such as those of pruned branches, must never
+    be deleted by gc.
+    """
+    with mirror.config_writer() as config:
+        config.set_value("gc", "auto", "0")
+        config.set_value("gc", "pruneExpire", "never")
+        if git.Git().version_info >= (2, 7):
+            # gc, prune and repack -d refuse to run at all
+            config.set_value("core", "repositoryformatversion", "1")
+            config.set_value("extensions", "preciousObjects", "true")
+
+
+def _alternates(git_dir):
+    alternates = os.path.join(git_dir, "objects", "info", "alternates")
+    if not os.path.exists(alternates):
+        return []
+    with open(alternates) as f:
+        return f.read().splitlines()
+
+
+class _MirrorLock:
+    """
+    Serializes access to one mirror, between threads of this process
+    and, where flock is available, between processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if fcntl is not None:
+                lock_dir = os.path.dirname(self.path)
+                if not os.path.isdir(lock_dir):
+                    os.makedirs(lock_dir)
+                self._file = open(self.path, "w")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+        except (IOError, OSError) as e:
+            self._thread_lock.release()
+            raise RepomanError("Unable to lock mirror", str(e))
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
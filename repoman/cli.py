@@ -1,30 +1,56 @@
 import click
 import os
-import subprocess
 import sys
-import git
 from datetime import datetime
 from .error import RepomanError
-from .workspace import Workspace
+from .fetch import FETCH_STRATEGIES
+from .transport import resolve_remote_base, enable_ssh_multiplexing
+from .timing import Tracer
 from .package import Package, PackageSpec
-from .manifest import find_manifest, read_manifest, read_manifest_file
-from .release import resolve_next_version, prepare, perform
+from .manifest import find_manifest, read_manifest, read_manifest_file, \
+    diff_manifests, _mangle_spec
+from collections import OrderedDict
+from .release import resolve_next_version, prepare, perform, perform_all, \
+    find_prepared, PUSH_CONNECTIONS_PER_HOST
+from .versions import BUMPS
 from . import __version__
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
+# Modules which need GitPython are imported by the commands using them,
+# so startup and --help stay fast.
+
 RELEASE_TEMPLATE = "## [{version}] - {date} @[username]\n### Added\n- "
+SLOWEST_COUNT = 5
 
 
 class RepomanCtx(object):
 
-    def __init__(self, workspace_dir, remote_base):
+    def __init__(self, workspace_dir, remote_base, cache_dir=None):
         self.workspace_dir = workspace_dir
-        self.remote_base = remote_base
+        self.configured_remote_base = remote_base
+        self.cache_dir = cache_dir
         self.config = {}
         self.verbose = False
+        self.workspace = None
+        self.tracer = Tracer()
+        self._remote_base = None
+
+    @property
+    def remote_base(self):
+        """
+        The remote base to fetch from. Transport is only set up, and
+        SSH access probed, by commands which use the network.
+        """
+        if self._remote_base is None:
+            remote_base = resolve_remote_base(self.configured_remote_base)
+            if remote_base != self.configured_remote_base:
+                click.echo("Default SSH remote does not work, falling back "
+                           "to: " + remote_base)
+            self._remote_base = remote_base
+        return self._remote_base
 
     def set_config(self, key, value):
         self.config[key] = value
@@ -47,29 +73,30 @@ pass_ctx = click.make_pass_decorator(RepomanCtx)
 @click.option('--remote-base', envvar='REMOTE_BASE',
               default="git@github.com:fermi-lat",
               help='Github user/organization for repos')
+@click.option('--cache-dir', envvar='REPOMAN_CACHE_DIR', type=click.Path(),
+              metavar='PATH',
+              help='Shared directory of package mirrors to fetch through')
 @click.option('--config', nargs=2, multiple=True,
               metavar='KEY VALUE', help='Overrides a config key/value pair.')
+@click.option('--trace', type=click.Path(dir_okay=False, writable=True),
+              metavar='FILE',
+              help='Write timings of every phase as Chrome trace events')
 @click.version_option(__version__)
 @click.pass_context
-def cli(ctx, workspace, verbose, remote_base, config):
+def cli(ctx, workspace, verbose, remote_base, cache_dir, config, trace):
     """Repoman is a repo and name management tool for
     Fermi's Software configuration.
     """
     # Create a repo object and remember it as as the context object.  From
     # this point onwards other commands can refer to it by using the
     # @pass_repo decorator.
-    
-    # But first, lets see if ssh will work to a github remote_base
-    if "git@github" in remote_base:
-        org_or_user = remote_base.split(":")[-1]
-        devnull = open(os.devnull, 'w')
-        if subprocess.call(["ssh", "git@github.com"], stderr=devnull, stdout=devnull) != 1:
-            remote_base = "https://github.com/" + org_or_user
-            click.echo("Default SSH remote does not work, falling back to: " + remote_base)
-        devnull.close()
-    ctx.obj = RepomanCtx(os.path.abspath(workspace), remote_base)
+    if cache_dir:
+        cache_dir = os.path.abspath(cache_dir)
+    ctx.obj = RepomanCtx(os.path.abspath(workspace), remote_base, cache_dir)
     for key, value in config:
         ctx.obj.set_config(key, value)
+    if trace:
+        ctx.call_on_close(lambda: _write_trace(ctx.obj.tracer, trace))
     if verbose:
         logging.basicConfig(level=logging.DEBUG)
     else:
@@ -89,14 +116,34 @@ def cli(ctx, workspace, verbose, remote_base, config):
               help="Ignore tags in name list and check out development branches")
 @click.option('--bom', is_flag=True,
               help="Provide a JSON bill of materials of the commit SHA's checked out")
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1),
+              help="Number of packages to fetch concurrently")
+@click.option('--checkout-jobs', type=click.IntRange(1),
+              help="Number of fetched packages to check out concurrently. "
+                   "Defaults to --jobs")
+@click.option('--fetch-strategy', type=click.Choice(FETCH_STRATEGIES),
+              help="How much history to fetch. Manifest entries may "
+                   "override this with fetch=STRATEGY")
+@click.option('--sparse/--no-sparse', default=True,
+              help="Only check out the listed paths of packages which have "
+                   "path entries in the manifest")
+@click.option('--since', metavar='MANIFEST-OR-REF',
+              help="Only stage packages which changed since an older "
+                   "manifest file, or the manifest at a ref of the package")
+@click.option('--prune', is_flag=True,
+              help="With --since, remove packages no longer in the manifest")
+@click.option('--recursive', is_flag=True,
+              help="Also stage the packages of products listed in the "
+                   "manifest, and of products they list")
 @pass_ctx
-def checkout(ctx, package, refs, force, in_place, develop, bom):
+def checkout(ctx, package, refs, force, in_place, develop, bom, jobs,
+             checkout_jobs, fetch_strategy, sparse, since, prune, recursive):
     """Stage a Fermi package.
     REFS may be Tags, Branches, or Commits. For more information,
     see help for git-checkout. By default, this will effectively
     perform a recursive checkout if it finds a manifest
     (packageList.txt), checking out """
-    workspace = Workspace(ctx.workspace_dir, ctx.remote_base)
+    workspace = _get_workspace(ctx, fetch_strategy)
     workspace.checkout(package, _dev_branch(package), force=force,
                        refs=refs, in_place=in_place)
 
@@ -106,14 +153,29 @@ def checkout(ctx, package, refs, force, in_place, develop, bom):
     manifest_path = find_manifest(package_dir)
     if manifest_path is not None:
         package_specs = read_manifest(manifest_path)
+        if since:
+            package_specs = _changed_specs(workspace, package, package_dir,
+                                           package_specs, since, prune, force)
         if develop:
             package_specs = [PackageSpec(spec.name, _dev_branch(spec.name))
                              for spec in package_specs]
         try:
-            workspace.checkout_packages(package_specs, refs=refs, force=force)
+            if recursive:
+                from .graph import ProductGraph
+                graph = ProductGraph(workspace, refs=refs, jobs=jobs,
+                                     develop=_dev_branch if develop else None)
+                package_specs = graph.resolve(package, package_specs)
+            workspace.checkout_packages(package_specs, refs=refs, force=force,
+                                        jobs=jobs, sparse=sparse,
+                                        checkout_jobs=checkout_jobs)
         except RepomanError as err:
             _print_err(err)
             sys.exit(1)
+        finally:
+            workspace.save_state()
+            _print_slowest(ctx)
+    else:
+        workspace.save_state()
     if bom:
         with open('repoman_bom.json', 'w') as f:
             json.dump(workspace.bom, f, indent=4, separators=(',', ': '))
@@ -127,16 +189,199 @@ def checkout(ctx, package, refs, force, in_place, develop, bom):
                    "if found")
 @click.option('--develop', is_flag=True,
               help="Ignore tags in name list and check out development branches")
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1),
+              help="Number of packages to fetch concurrently")
+@click.option('--checkout-jobs', type=click.IntRange(1),
+              help="Number of fetched packages to check out concurrently. "
+                   "Defaults to --jobs")
+@click.option('--fetch-strategy', type=click.Choice(FETCH_STRATEGIES),
+              help="How much history to fetch. Manifest entries may "
+                   "override this with fetch=STRATEGY")
+@click.option('--sparse/--no-sparse', default=True,
+              help="Only check out the listed paths of packages which have "
+                   "path entries in the manifest")
 @pass_ctx
-def checkout_list(ctx, package_list, force, develop):
+def checkout_list(ctx, package_list, force, develop, jobs, checkout_jobs,
+                  fetch_strategy, sparse):
     """Stage packages from a package list."""
-    workspace = Workspace(ctx.workspace_dir, ctx.remote_base)
+    workspace = _get_workspace(ctx, fetch_strategy)
     package_specs = read_manifest_file(package_list)
     if develop:
         package_specs = [PackageSpec(spec.name, _dev_branch(spec.name))
                          for spec in package_specs]
     try:
-        workspace.checkout_packages(package_specs, force=force)
+        workspace.checkout_packages(package_specs, force=force, jobs=jobs,
+                                    sparse=sparse,
+                                    checkout_jobs=checkout_jobs)
+    except RepomanError as err:
+        _print_err(err)
+        sys.exit(1)
+    finally:
+        workspace.save_state()
+        _print_slowest(ctx)
+
+
+@cli.command("checkout-lock")
+@click.argument('bom-file', type=click.File("r"))
+@click.option('--force', is_flag=True,
+              help="Force git checkout. This will throw away local changes in "
+                   "your branch")
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1),
+              help="Number of packages to fetch concurrently")
+@click.option('--checkout-jobs', type=click.IntRange(1),
+              help="Number of fetched packages to check out concurrently. "
+                   "Defaults to --jobs")
+@click.option('--fetch-strategy', type=click.Choice(FETCH_STRATEGIES),
+              help="With shallow, only fetch the locked commits themselves")
+@click.option('--sparse/--no-sparse', default=True,
+              help="Only check out the listed paths of packages which have "
+                   "path entries in the bill of materials")
+@pass_ctx
+def checkout_lock(ctx, bom_file, force, jobs, checkout_jobs, fetch_strategy,
+                  sparse):
+    """Stage the exact commits in a bill of materials.
+
+    BOM-FILE is a repoman_bom.json written by checkout --bom, or the
+    output of resolve. Each commit is fetched directly and checked
+    out by SHA, without resolving any tags or branches."""
+    workspace = _get_workspace(ctx, fetch_strategy)
+    try:
+        bom = json.load(bom_file, object_pairs_hook=OrderedDict)
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint="BOM-FILE")
+    try:
+        workspace.checkout_lock(bom, force=force, jobs=jobs, sparse=sparse,
+                                checkout_jobs=checkout_jobs)
+    except RepomanError as err:
+        _print_err(err)
+        sys.exit(1)
+    finally:
+        workspace.save_state()
+        _print_slowest(ctx)
+
+
+@cli.command("resolve")
+@click.argument('package-list', type=click.File("r"))
+@click.argument('refs', nargs=-1, required=False)
+@click.option('--develop', is_flag=True,
+              help="Ignore tags in name list and resolve development branches")
+@click.option('--jobs', '-j', default=8, type=click.IntRange(1),
+              help="Number of remotes to query concurrently")
+@click.option('--refresh', is_flag=True,
+              help="Query remotes even if their cached refs are fresh")
+@click.option('--output', '-o', type=click.File("w"), default="-",
+              help="Write the bill of materials to a file")
+@pass_ctx
+def resolve(ctx, package_list, refs, develop, jobs, refresh, output):
+    """Resolve the commits a package list would stage.
+
+    Remotes are queried with git ls-remote, concurrently, and nothing
+    is fetched or checked out. The result is a JSON bill of materials
+    like the one written by checkout --bom. Remote refs are cached in
+    the workspace, and checkouts run soon after skip fetching packages
+    which already have the resolved commit."""
+    from . import remote
+    workspace = _get_workspace(ctx)
+    package_specs = read_manifest_file(package_list)
+    if develop:
+        package_specs = [PackageSpec(spec.name, _dev_branch(spec.name))
+                         for spec in package_specs]
+    index = workspace.remote_index
+    repo_urls = OrderedDict((spec.name, workspace.repo_url(spec.name))
+                            for spec in package_specs)
+    try:
+        index.update(repo_urls, jobs=jobs, refresh=refresh)
+    except RepomanError as err:
+        _print_err(err)
+        sys.exit(1)
+
+    bom = OrderedDict()
+    unresolved = []
+    for spec in package_specs:
+        candidates = list(refs) + [spec.ref or _dev_branch(spec.name)]
+        resolution = index.resolve(spec.name, repo_urls[spec.name],
+                                   candidates)
+        if resolution is None:
+            unresolved.append(_mangle_spec(spec))
+            continue
+        bom[_mangle_spec(spec)] = remote.bom_entry(resolution)
+    if unresolved:
+        click.echo("Unable to resolve: " + ", ".join(unresolved), err=True)
+        sys.exit(1)
+    json.dump(bom, output, indent=4, separators=(',', ': '))
+    output.write("\n")
+
+
+@cli.command("status")
+@click.argument('package')
+@click.option('--jobs', '-j', default=8, type=click.IntRange(1),
+              help="Number of packages to query concurrently")
+@click.option('--json', 'as_json', is_flag=True,
+              help="Print the status as JSON")
+@pass_ctx
+def status(ctx, package, jobs, as_json):
+    """Show the state of a staged product.
+
+    For the product and every package in its manifest, report whether
+    it is staged at the ref the manifest pins, local changes, commits
+    ahead of or behind its upstream branch, and git describe."""
+    workspace = _get_workspace(ctx, network=False)
+    package_dir = os.path.join(ctx.workspace_dir, package)
+    if not os.path.isdir(package_dir):
+        click.echo("Package isn't staged: " + package, err=True)
+        sys.exit(1)
+    package_specs = [PackageSpec(package)]
+    manifest_path = find_manifest(package_dir)
+    if manifest_path is not None:
+        package_specs += read_manifest(manifest_path)
+    try:
+        statuses = workspace.status(package_specs, jobs=jobs)
+    except RepomanError as err:
+        _print_err(err)
+        sys.exit(1)
+    if as_json:
+        json.dump([OrderedDict(zip(package_status._fields, package_status))
+                   for package_status in statuses],
+                  sys.stdout, indent=4, separators=(',', ': '))
+        click.echo()
+        return
+    for package_status in statuses:
+        click.echo("{:<30} {:<30} {:<40} {}".format(
+            package_status.name, package_status.ref or "",
+            package_status.describe or "", _format_status(package_status)))
+
+
+@cli.command("versions")
+@click.argument('package')
+@click.option('--latest', is_flag=True,
+              help="Only print the newest release")
+@click.option('--next', 'bump', type=click.Choice(BUMPS),
+              help="Print the version following the newest release")
+@click.option('--exists', 'version',
+              help="Exit with 1 unless this version was released")
+@pass_ctx
+def versions(ctx, package, latest, bump, version):
+    """List the releases of a staged package.
+
+    Release tags are read from a sorted index kept in the repository,
+    which is updated with the tags fetched since it was last used."""
+    from .versions import format_tag
+    package = _get_package(ctx, package)
+    index = package.versions
+    try:
+        if version:
+            if not index.exists("-".join([package.name, version])):
+                sys.exit(1)
+        elif bump:
+            click.echo(index.next_version(bump))
+        elif latest:
+            tag = index.latest()
+            if tag is None:
+                raise RepomanError("No valid tag found")
+            click.echo(tag)
+        else:
+            for release_version in index.versions:
+                click.echo(format_tag(package.name, release_version))
     except RepomanError as err:
         _print_err(err)
         sys.exit(1)
@@ -212,25 +457,254 @@ def release_prepare(ctx, package, release_message, version,
 
 
 @cli.command("release-perform")
-@click.argument('package')
+@click.argument('package', required=False)
+@click.option('--all', 'perform_all_', is_flag=True,
+              help="Perform every prepared release of the workspace")
+@click.option('--jobs', '-j', default=8, type=click.IntRange(1),
+              help="Number of tags to push concurrently with --all")
+@click.option('--per-host', default=PUSH_CONNECTIONS_PER_HOST,
+              type=click.IntRange(1),
+              help="Number of concurrent pushes to one host with --all")
 @click.option('--push/--no-push', default=True,
               help="Push changes")
 @pass_ctx
-def release_perform(ctx, package, push):
+def release_perform(ctx, package, perform_all_, jobs, per_host, push):
     """Perform a release.
 
     Verify tags and remotes are in order and push them to the
-    appropriate remotes."""
-    package = _get_package(ctx, package)
-    perform(package, push=push)
+    appropriate remotes. With --all, the releases of every prepared
+    package are committed and tagged, then pushed concurrently."""
+    if perform_all_ == bool(package):
+        raise click.UsageError("Specify either a package or --all.")
+    if package:
+        package = _get_package(ctx, package)
+        perform(package, push=push)
+        return
+    names = find_prepared(ctx.workspace_dir)
+    if not names:
+        click.echo("No release is currently prepared", err=True)
+        sys.exit(1)
+    # Pushes to the same host share one SSH connection
+    enable_ssh_multiplexing()
+    try:
+        results = perform_all([_get_package(ctx, name) for name in names],
+                              push=push, jobs=jobs, per_host=per_host)
+    finally:
+        _print_slowest(ctx)
+    failed = False
+    for result in results:
+        if result.error is not None:
+            failed = True
+            click.echo("{:<30} failed: {}".format(result.package, " ".join(
+                str(arg) for arg in getattr(result.error, "args", [])
+                or [result.error])), err=True)
+        elif result.pushed:
+            click.echo("{:<30} pushed {}".format(result.package, result.tag))
+        else:
+            click.echo("{:<30} tagged {}".format(result.package, result.tag))
+    if failed:
+        sys.exit(1)
+
+
+@cli.command("release-train")
+@click.argument('product')
+@click.argument('release-message', required=False)
+@click.option('--version',
+              help="Custom version for the product release")
+@click.option('--major', is_flag=True,
+              help="Bump next major version of the product")
+@click.option('--minor', is_flag=True,
+              help="Bump next minor version of the product")
+@click.option('--patch', is_flag=True,
+              help="Bump next patch version of the product")
+@click.option('--bump', type=click.Choice(BUMPS), default="patch",
+              help="Version bump of the packages released")
+@click.option('--jobs', '-j', default=8, type=click.IntRange(1),
+              help="Number of packages to prepare concurrently")
+@click.option('--push/--no-push', default=True,
+              help="Push changes")
+@click.option('--dry-run', is_flag=True,
+              help="Only list the packages which would be released")
+@pass_ctx
+def release_train(ctx, product, release_message, version, major, minor,
+                  patch, bump, jobs, push, dry_run):
+    """Release a product with its changed packages.
+
+    Every package of the product manifest with commits since its last
+    release tag is released, with releases prepared concurrently. The
+    new tags are written to the manifest, then the product itself is
+    released. Progress is recorded in the product's target directory,
+    and running the command again resumes an interrupted train."""
+    from .train import ReleaseTrain
+    product = _get_package(ctx, product)
+    train = ReleaseTrain(product)
+    try:
+        if train.in_progress:
+            if version and version != train.state["version"]:
+                raise RepomanError(
+                    "A release train of {} {} is in progress".format(
+                        product.name, train.state["version"]))
+            click.echo("Resuming release train of {} {}".format(
+                product.name, train.state["version"]))
+        else:
+            if major or minor or patch:
+                if version:
+                    raise RepomanError("Unable to specify version with "
+                                       "bumps.")
+                version = resolve_next_version(product, major, minor, patch)
+            if not version:
+                raise click.UsageError("Specify a --version or a bump for "
+                                       "the product.")
+            packages = train.plan(bump, jobs=jobs)
+            for name, package_release in packages.items():
+                click.echo("{:<30} {} -> {}".format(
+                    name, package_release["previous"],
+                    package_release["version"]))
+            if dry_run:
+                return
+            if not release_message:
+                release_message = _release_message(version)
+            train.start(version, release_message, packages)
+        tags = train.run(jobs=jobs, push=push)
+    except RepomanError as err:
+        _print_err(err)
+        sys.exit(1)
+    for tag in tags.values():
+        click.echo("Released " + tag)
+
+
+@cli.group()
+@pass_ctx
+def cache(ctx):
+    """Manage the shared package mirror cache."""
+    if not ctx.cache_dir:
+        raise click.UsageError("No cache configured. Use --cache-dir or "
+                               "set REPOMAN_CACHE_DIR.")
+
+
+@cache.command("list")
+@pass_ctx
+def cache_list(ctx):
+    """List cached package mirrors."""
+    mirror_cache = _get_cache(ctx)
+    for package in mirror_cache.mirrors():
+        updated = mirror_cache.last_updated(package)
+        updated = datetime.utcfromtimestamp(updated).strftime(
+            "%Y-%m-%d %H:%M:%S") if updated else "never"
+        click.echo("{:<30} {}".format(package, updated))
+
+
+@cache.command("size")
+@pass_ctx
+def cache_size(ctx):
+    """Report disk usage of cached package mirrors."""
+    mirror_cache = _get_cache(ctx)
+    total = 0
+    for package in mirror_cache.mirrors():
+        size = mirror_cache.size(package)
+        total += size
+        click.echo("{:<30} {:>10}".format(package, _format_size(size)))
+    click.echo("{:<30} {:>10}".format("total", _format_size(total)))
+
+
+@cache.command("prune")
+@click.argument('packages', nargs=-1, required=False)
+@click.option('--older-than', type=click.IntRange(0), metavar='DAYS',
+              help="Only prune mirrors not refreshed in DAYS days")
+@click.option('--dissociate', is_flag=True,
+              help="Copy the objects workspaces borrow from a mirror into "
+                   "them, so mirrors still in use can be pruned")
+@pass_ctx
+def cache_prune(ctx, packages, older_than, dissociate):
+    """Remove cached package mirrors.
+
+    Workspaces borrow objects from the mirrors they were staged from,
+    so mirrors still in use are kept unless --dissociate is given."""
+    mirror_cache = _get_cache(ctx)
+    if older_than is not None:
+        older_than = older_than * 24 * 3600
+    try:
+        pruned = mirror_cache.prune(packages, older_than, dissociate)
+    except RepomanError as err:
+        _print_err(err)
+        sys.exit(1)
+    for package in pruned:
+        click.echo("Pruned " + package)
+
+
+def _changed_specs(workspace, package, package_dir, package_specs, since,
+                   prune, force):
+    """
+    Filter specs down to the packages which changed since an older
+    manifest. Every spec of a changed package is kept, so paths are
+    staged together.
+    """
+    try:
+        if os.path.isfile(since):
+            old_specs = read_manifest(since)
+        else:
+            old_specs = Package(package, workspace, package_dir).read_manifest(
+                ref=since)
+        diff = diff_manifests(old_specs, package_specs)
+        click.echo("{} added, {} removed, {} retagged, {} unchanged".format(
+            len(diff.added), len(diff.removed), len(diff.retagged),
+            len(diff.unchanged)))
+        if prune:
+            remaining = set(spec.name for spec in package_specs)
+            for spec in diff.removed:
+                if spec.name not in remaining:
+                    workspace.remove(spec.name, force=force)
+    except RepomanError as err:
+        _print_err(err)
+        sys.exit(1)
+    changed = diff.changed_packages()
+    return [spec for spec in package_specs if spec.name in changed]
 
 
 def _dev_branch(package):
     return "master"
 
 
+def _get_cache(ctx):
+    from .cache import MirrorCache
+    return MirrorCache(ctx.cache_dir)
+
+
+def _get_workspace(ctx, fetch_strategy=None, network=True):
+    """
+    The workspace of this invocation, created on first use.
+    :param network: If False, the transport isn't probed. Commands which
+    only work with repos already staged don't need it.
+    """
+    from .workspace import Workspace, STATE_DIR, STATE_FILE
+    from .remote import RemoteRefIndex, REMOTE_INDEX_FILE
+    from .history import StageHistory, HISTORY_FILE
+    from .backend import get_backend, CONFIG_KEY
+    if ctx.workspace is None:
+        state_dir = os.path.join(ctx.workspace_dir, STATE_DIR)
+        remote_base = ctx.remote_base if network else \
+            ctx.configured_remote_base
+        backend = get_backend(ctx.config.get(CONFIG_KEY))
+        # Stop the git processes a backend keeps, even on errors
+        click.get_current_context().call_on_close(backend.close)
+        ctx.workspace = Workspace(
+            ctx.workspace_dir, remote_base,
+            cache=_get_cache(ctx) if ctx.cache_dir else None,
+            remote_index=RemoteRefIndex(
+                os.path.join(state_dir, REMOTE_INDEX_FILE)),
+            state_file=os.path.join(state_dir, STATE_FILE),
+            tracer=ctx.tracer,
+            history=StageHistory(os.path.join(state_dir, HISTORY_FILE)),
+            backend=backend)
+    if fetch_strategy:
+        ctx.workspace.fetch_strategy = fetch_strategy
+    return ctx.workspace
+
+
 def _get_package(ctx, name):
-    workspace = Workspace(ctx.workspace_dir, ctx.remote_base)
+    # Releases push to the remotes repos were cloned from, so there's
+    # no need to probe the transport
+    workspace = _get_workspace(ctx, network=False)
     package_dir = os.path.join(ctx.workspace_dir, name)
     return Package(name, workspace, package_dir)
 
@@ -240,7 +714,51 @@ def _print_err(err):
         click.echo(arg)
 
 
+def _print_slowest(ctx):
+    slowest = ctx.tracer.slowest(SLOWEST_COUNT)
+    if len(slowest) < 2:
+        return
+    click.echo("Slowest packages:", err=True)
+    for package, total, phases in slowest:
+        click.echo("  {:<30} {:>7.2f}s  {}".format(
+            package, total, ", ".join("{} {:.2f}s".format(phase, seconds)
+                                      for phase, seconds in phases.items()
+                                      if seconds >= 0.01)),
+            err=True)
+
+
+def _write_trace(tracer, path):
+    with open(path, "w") as trace_file:
+        tracer.write_chrome_trace(trace_file)
+
+
+def _format_status(status):
+    if not status.staged:
+        return "not staged"
+    states = ["dirty" if status.dirty else "clean"]
+    if status.untracked:
+        states.append("{} untracked".format(status.untracked))
+    if status.ahead:
+        states.append("ahead {}".format(status.ahead))
+    if status.behind:
+        states.append("behind {}".format(status.behind))
+    if status.at_ref is False:
+        states.append("not at ref")
+    return ", ".join(states)
+
+
+def _format_size(size):
+    if size < 1024:
+        return "{} B".format(size)
+    for unit in ["KiB", "MiB", "GiB"]:
+        size /= 1024.0
+        if size < 1024 or unit == "GiB":
+            break
+    return "{:.1f} {}".format(size, unit)
+
+
 def _global_info():
+    import git
     info = dict(editor=None, name=None, email=None)
     globalconfig = git.GitConfigParser([
         os.path.normpath(os.path.expanduser("~/.gitconfig"))],
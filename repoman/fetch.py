@@ -0,0 +1,178 @@
+from .error import WorkspaceError
+from .timing import NULL_TRACER
+from .transport import HostLimiter, remote_host
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The fetch module describes how packages are fetched, and schedules
+fetches so many can run at once without overloading a remote. It has
+no dependency on git so the command line can import it cheaply.
+"""
+
+FETCH_FULL = "full"
+FETCH_SHALLOW = "shallow"
+FETCH_BLOBLESS = "blobless"
+FETCH_TARGETED = "targeted"
+FETCH_STRATEGIES = [FETCH_FULL, FETCH_TARGETED, FETCH_SHALLOW, FETCH_BLOBLESS]
+# Strategies which only fetch the refs they are asked for
+FETCH_REF_STRATEGIES = [FETCH_TARGETED, FETCH_SHALLOW]
+
+FETCH_CONNECTIONS_PER_HOST = 8
+FETCH_ATTEMPTS = 4
+# Seconds one fetch, retries included, may take before it is killed
+FETCH_DEADLINE = 900
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# Consecutive failed fetches from a host before it isn't tried anymore
+BREAKER_THRESHOLD = 8
+BREAKER_COOLDOWN = 60
+
+
+def check_fetch_strategy(fetch_strategy):
+    if fetch_strategy not in FETCH_STRATEGIES:
+        raise WorkspaceError("Unknown fetch strategy: {}. Expected one of: "
+                             "{}".format(fetch_strategy,
+                                         ", ".join(FETCH_STRATEGIES)))
+
+
+def deadline_after(timeout):
+    """
+    :param timeout: Seconds from now, or None
+    :returns: The time at which timeout has passed, or None without one
+    """
+    if timeout is None:
+        return None
+    return time.time() + timeout
+
+
+def time_left(deadline):
+    """
+    Seconds left before a deadline from :py:func:deadline_after, so
+    the git commands of one fetch share its timeout.
+    :returns: Seconds, or None without a deadline
+    """
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
+
+
+class FetchScheduler:
+    """
+    Runs fetches with a cap on concurrent fetches from each host,
+    retrying failures with jittered exponential backoff until a
+    deadline. After repeated failures from one host, its circuit
+    breaker opens and fetches from it fail immediately, until a
+    cooldown has passed and one trial fetch succeeds again.
+    """
+
+    def __init__(self, per_host=FETCH_CONNECTIONS_PER_HOST,
+                 attempts=FETCH_ATTEMPTS, deadline=FETCH_DEADLINE,
+                 backoff=BACKOFF_BASE, max_backoff=BACKOFF_MAX,
+                 breaker_threshold=BREAKER_THRESHOLD,
+                 breaker_cooldown=BREAKER_COOLDOWN):
+        """
+        :param per_host: Maximum concurrent fetches from one host
+        :param attempts: Maximum attempts of one fetch
+        :param deadline: Seconds a fetch may take, retries included,
+        or None for no limit
+        :param backoff: Seconds before the first retry, doubled for
+        every following one
+        :param max_backoff: Maximum seconds between two attempts
+        :param breaker_threshold: Consecutive failures from a host
+        which open its breaker
+        :param breaker_cooldown: Seconds an open breaker stays open
+        """
+        self.attempts = attempts
+        self.deadline = deadline
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._limiter = HostLimiter(per_host)
+        self._failures = {}
+        self._opened = {}
+        self._lock = threading.Lock()
+
+    def run(self, package, url, fetch, retry_on=Exception,
+            tracer=NULL_TRACER):
+        """
+        Fetch, retrying on errors.
+        :param package: Name of the package, for logs and spans
+        :param url: URL fetched from
+        :param fetch: Function of the seconds left before the deadline,
+        None without one. It must give up once they have passed.
+        :param retry_on: Exception types which are retried
+        :param tracer: :py:class:repoman.timing.Tracer attempts and
+        sleeps are timed with
+        :returns: The result of fetch
+        :raises WorkspaceError: if the breaker of the host is open.
+        Otherwise, the error of the last attempt is raised.
+        """
+        host = remote_host(url)
+        start = time.time()
+        attempt = 0
+        while True:
+            self._check_breaker(host, package)
+            timeout = None
+            if self.deadline is not None:
+                timeout = max(self.deadline - (time.time() - start), 0)
+            try:
+                with tracer.span("fetch", package):
+                    result = self._limiter.run(url, fetch, timeout)
+            except retry_on:
+                self._record(host, False)
+                attempt += 1
+                delay = self._delay(attempt)
+                if attempt >= self.attempts or (
+                        self.deadline is not None and
+                        time.time() + delay - start >= self.deadline):
+                    raise
+                logger.debug("Error fetching {}, retrying in {:.2f}s".format(
+                    package, delay))
+                with tracer.span("retry-sleep", package):
+                    time.sleep(delay)
+                continue
+            self._record(host, True)
+            return result
+
+    def _delay(self, attempt):
+        """
+        Exponential backoff, with half of it random so packages failing
+        together don't retry together.
+        """
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _check_breaker(self, host, package):
+        with self._lock:
+            opened = self._opened.get(host)
+            if opened is None:
+                return
+            now = time.time()
+            if now - opened < self.breaker_cooldown:
+                raise WorkspaceError(
+                    "Not fetching {}, too many fetches from {} failed. Try "
+                    "again later.".format(package, host or "local remotes"))
+            # Half open, let this fetch through as a trial while the
+            # others keep failing fast
+            self._opened[host] = now
+
+    def _record(self, host, ok):
+        with self._lock:
+            if ok:
+                self._failures[host] = 0
+                self._opened.pop(host, None)
+                return
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.breaker_threshold:
+                logger.warning("{} consecutive fetches from {} failed, not "
+                               "fetching from it for {}s".format(
+                                   failures, host or "local remotes",
+                                   self.breaker_cooldown))
+                self._opened[host] = time.time()
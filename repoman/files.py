@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+import os
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The files module writes the files repoman keeps, like manifests and
+state, so they are either replaced whole or not at all.
+"""
+
+
+@contextmanager
+def atomic_write(path, copy_mode=False):
+    """
+    Write a file next to path, then sync it and rename it over path,
+    so readers never see a partially written file, even after a crash.
+    The temporary file is removed if writing fails.
+    :param path: Path of the file replaced
+    :param copy_mode: If True, keep the permissions of the file
+    replaced, which must exist
+    :returns: Text file open for writing
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if copy_mode:
+            shutil.copymode(path, tmp_path)
+        os.rename(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,157 @@
+from .error import RepomanError
+from .package import Package, PackageSpec
+from .manifest import _mangle_spec
+from .timing import PACKAGE_SPAN
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The graph module expands a product manifest into every package the
+product needs, reading the manifests of nested products, so a deep
+product tree can be staged as one flat list.
+"""
+
+
+class ProductGraph:
+    """
+    Dependency graph of a product. Nested manifests are read from the
+    commit each product spec resolves to, and memoized per (package,
+    ref), so every repository is fetched at most once no matter how
+    many products list it.
+    """
+
+    def __init__(self, workspace, refs=None, jobs=1, develop=None):
+        """
+        :param workspace: :py:class:repoman.workspace.Workspace the
+        package repos are fetched into
+        :param refs: Prioritized list of refs preferred over the refs
+        pinned in manifests
+        :param jobs: Number of nested manifests to read concurrently
+        :param develop: Optional function from a package name to its
+        development branch, staged instead of the refs nested
+        manifests pin
+        """
+        self.workspace = workspace
+        self.refs = refs
+        self.jobs = jobs
+        self.develop = develop
+        self.manifests = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, product, package_specs):
+        """
+        Build the graph of a product and plan its staging.
+        :param product: Name of the product
+        :param package_specs: Its manifest, as a list of
+        :py:class:repoman.package.PackageSpec
+        :returns: List of every spec in the tree, once each, with the
+        packages of a product before the product itself
+        :raises RepomanError: if two products pin a package to
+        different refs, or products depend on each other
+        """
+        specs = OrderedDict()
+        pinned_by = {}
+        edges = OrderedDict()
+        edges[product], frontier = self._add(product, package_specs, specs,
+                                             pinned_by)
+        while frontier:
+            manifests = self._read_manifests(frontier)
+            next_frontier = []
+            for spec, manifest in zip(frontier, manifests):
+                if manifest is None:
+                    continue
+                logger.debug("{} is a product of {} packages".format(
+                    spec.name, len(manifest)))
+                edges[spec.name], added = self._add(spec.name, manifest,
+                                                    specs, pinned_by)
+                next_frontier += added
+            frontier = next_frontier
+        order = _post_order(product, edges)
+        return [specs[key] for key in order if key in specs]
+
+    def manifest(self, spec):
+        """
+        The manifest of a package at the commit its spec resolves to.
+        :returns: List of :py:class:repoman.package.PackageSpec, or
+        None if the package isn't a product
+        """
+        key = (spec.name, spec.ref)
+        with self._lock:
+            if key in self.manifests:
+                return self.manifests[key]
+        with self.workspace.tracer.span(PACKAGE_SPAN, spec.name):
+            repo, commit = self.workspace.resolve_commit(
+                spec.name, spec.ref, self.refs, fetch_strategy=spec.fetch)
+            package = Package(spec.name, self.workspace,
+                              repo.working_tree_dir, repo=repo)
+            manifest = None
+            if package.has_dependencies(ref=commit):
+                manifest = package.read_manifest(ref=commit)
+        with self._lock:
+            self.manifests[key] = manifest
+        return manifest
+
+    def _add(self, product, manifest, specs, pinned_by):
+        """
+        Add the entries of a product's manifest to the plan.
+        :returns: Tuple of (keys of the entries, new specs which may be
+        products themselves)
+        """
+        keys = []
+        added = []
+        for spec in manifest:
+            if self.develop is not None and product in pinned_by:
+                spec = PackageSpec(spec.name, self.develop(spec.name),
+                                   spec.ref_path, spec.fetch)
+            key = _mangle_spec(spec)
+            keys.append(key)
+            existing = specs.get(key)
+            if existing is None:
+                specs[key] = spec
+                pinned_by[key] = product
+                if spec.ref_path is None:
+                    added.append(spec)
+            elif existing.ref != spec.ref:
+                raise RepomanError(
+                    "Conflicting refs for {}: {} pins {}, {} pins {}".format(
+                        key, pinned_by[key], existing.ref, product, spec.ref))
+        return keys, added
+
+    def _read_manifests(self, specs):
+        if self.jobs <= 1 or len(specs) <= 1:
+            return [self.manifest(spec) for spec in specs]
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(executor.map(self.manifest, specs))
+
+
+def _post_order(root, edges):
+    """
+    Order the nodes reachable from root so every node comes after
+    the nodes it depends on, keeping manifest order otherwise.
+    :param edges: Dictionary of node to the list of nodes it depends on
+    :raises RepomanError: if there is a cycle
+    """
+    order = []
+    done = set()
+    # Iterative, deep product trees shouldn't hit the recursion limit
+    path = [root]
+    stack = [iter(edges.get(root, []))]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            done.add(path[-1])
+            order.append(path.pop())
+            continue
+        if node in path:
+            cycle = path[path.index(node):] + [node]
+            raise RepomanError("Dependency cycle: " + " -> ".join(cycle))
+        if node in done:
+            continue
+        path.append(node)
+        stack.append(iter(edges.get(node, [])))
+    return order
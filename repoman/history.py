@@ -0,0 +1,130 @@
+from .files import atomic_write
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The history module remembers how long staging each package took, and
+how large its repository is, so runs can start the most expensive
+packages first.
+"""
+
+HISTORY_FILE = "history.json"
+# Weight of the latest run in the moving average of a package's cost
+HISTORY_WEIGHT = 0.5
+PHASES = ["fetch", "checkout"]
+
+
+class StageHistory:
+
+    def __init__(self, path, weight=HISTORY_WEIGHT):
+        """
+        :param path: Path of the JSON history file
+        :param weight: Weight of the latest run in the moving average
+        of each phase
+        """
+        self.path = path
+        self.weight = weight
+        self._lock = threading.Lock()
+        self._entries = None
+
+    @property
+    def entries(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = {}
+                if os.path.exists(self.path):
+                    with open(self.path) as f:
+                        self._entries = json.load(f)
+            return self._entries
+
+    def record(self, package, timings, size=None):
+        """
+        Record the seconds a run spent in the phases of a package.
+        :param timings: Dictionary of phase, one of ``PHASES``, to
+        seconds. Phases which didn't run are left out and keep their
+        recorded cost.
+        :param size: Size in bytes of the package's packed objects
+        """
+        entries = self.entries
+        with self._lock:
+            entry = entries.setdefault(package, {})
+            for phase, seconds in timings.items():
+                previous = entry.get(phase)
+                if previous is not None:
+                    seconds = self.weight * seconds + \
+                        (1 - self.weight) * previous
+                entry[phase] = seconds
+            if size is not None:
+                entry["size"] = size
+            entry["time"] = time.time()
+
+    def estimate(self, package):
+        """
+        :returns: Expected seconds to stage a package, or None if it
+        was never staged
+        """
+        entry = self.entries.get(package)
+        if entry is None or not any(phase in entry for phase in PHASES):
+            return None
+        return sum(entry.get(phase, 0) for phase in PHASES)
+
+    def order(self, packages, sizes=None):
+        """
+        Order packages longest first, so one large package doesn't
+        start last and finish long after the others. Packages without
+        history are estimated from their size when it is known, or
+        else at the mean cost. Without any history, the order is kept.
+        :param packages: Package names in manifest order
+        :param sizes: Optional dictionary of package to the size of its
+        packed objects, for packages without history
+        :returns: List of package names
+        """
+        costs = OrderedDict()
+        for package in packages:
+            costs[package] = self.estimate(package)
+        known = [package for package, cost in costs.items()
+                 if cost is not None]
+        if not known:
+            return list(packages)
+        default = sum(costs[package] for package in known) / len(known)
+        rates = sorted(costs[package] / self.entries[package]["size"]
+                       for package in known
+                       if self.entries[package].get("size"))
+        for package, cost in costs.items():
+            if cost is not None:
+                continue
+            size = (sizes or {}).get(package)
+            if size and rates:
+                # Median seconds per byte of the packages with history
+                costs[package] = size * rates[len(rates) // 2]
+            else:
+                costs[package] = default
+        # Stable, packages of equal cost keep manifest order
+        return sorted(costs, key=lambda package: -costs[package])
+
+    def save(self):
+        if self._entries is None:
+            return
+        with self._lock:
+            with atomic_write(self.path) as f:
+                json.dump(self._entries, f, indent=4, sort_keys=True,
+                          separators=(',', ': '))
+
+
+def pack_size(git_dir):
+    """
+    Size in bytes of the packs of a repository, read without git.
+    Loose objects are left out. Only small fetches are unpacked into
+    loose objects, so they matter little to the cost.
+    """
+    pack_dir = os.path.join(git_dir, "objects", "pack")
+    if not os.path.isdir(pack_dir):
+        return 0
+    return sum(os.path.getsize(os.path.join(pack_dir, name))
+               for name in os.listdir(pack_dir) if name.endswith(".pack"))
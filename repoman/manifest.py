@@ -1,10 +1,14 @@
 import os
+from collections import OrderedDict
 from .package import PackageSpec
+from .error import RepomanError
+from .files import atomic_write
 import logging
 
 logger = logging.getLogger(__name__)
 
 PACKAGE_LIST = "packageList.txt"
+SPEC_OPTIONS = ["fetch"]
 
 
 def find_manifest(package_dir):
@@ -41,15 +45,66 @@ def read_manifest_file(manifest_file):
     return package_specs
 
 
+class ManifestDiff:
+    """
+    Classification of the entries of two manifests, matched by package
+    and path.
+    """
+
+    def __init__(self, added, removed, retagged, unchanged):
+        self.added = added
+        self.removed = removed
+        self.retagged = retagged
+        self.unchanged = unchanged
+
+    def changed_packages(self):
+        """
+        Names of packages with any added, removed, or retagged entry.
+        """
+        specs = self.added + self.removed + [new for _, new in self.retagged]
+        return list(OrderedDict.fromkeys(spec.name for spec in specs))
+
+    def __repr__(self):
+        return repr(self.__dict__)
+
+
+def diff_manifests(old_specs, new_specs):
+    """
+    Compare two lists of package specs, such as a product manifest
+    from one release to the next.
+    :param old_specs: List of :py:class:PackageSpec
+    :param new_specs: List of :py:class:PackageSpec
+    :returns: :py:class:ManifestDiff, with retagged entries as
+    (old, new) pairs
+    """
+    old = OrderedDict((_mangle_spec(spec), spec) for spec in old_specs)
+    added = []
+    retagged = []
+    unchanged = []
+    for spec in new_specs:
+        old_spec = old.pop(_mangle_spec(spec), None)
+        if old_spec is None:
+            added.append(spec)
+        elif old_spec != spec:
+            retagged.append((old_spec, spec))
+        else:
+            unchanged.append(spec)
+    return ManifestDiff(added, list(old.values()), retagged, unchanged)
+
+
 def update_manifest(manifest_path, package_specs):
     """
     Read the list of name requirements and version
     specifications (tags) into a list of lists.
+    Entries not in package_specs are removed, and new specs are
+    appended. The file is replaced atomically.
     :param manifest_path: Path to the packageList.txt file
     :param package_specs: List of package specs to update manifest with
     """
-    with open(manifest_path, "r+") as pfile:
-        return update_manifest_file(pfile, package_specs)
+    with open(manifest_path, "r") as pfile:
+        lines = pfile.readlines()
+    new_lines, _ = _updated_lines(lines, _specs_by_key(package_specs), True)
+    _write_lines(manifest_path, new_lines)
 
 
 def update_manifest_file(manifest_file, package_specs):
@@ -59,16 +114,61 @@ def update_manifest_file(manifest_file, package_specs):
     :param manifest_file: name file
     :param package_specs: List of package specs to update manifest with
     """
-    new_specs = {_mangle_spec(spec):spec for spec in package_specs}
-    lines = [line for line in manifest_file.readlines()]
+    lines = manifest_file.readlines()
+    new_lines, _ = _updated_lines(lines, _specs_by_key(package_specs), True)
+    manifest_file.seek(0)
+    manifest_file.truncate()
+    manifest_file.writelines(new_lines)
+
+
+def update_manifests(manifest_paths, package_specs):
+    """
+    Apply the same spec changes to many manifests, such as when
+    retagging the packages of several products. Only entries listed
+    in package_specs are changed: other entries, comments, and blank
+    lines are kept, and specs a manifest doesn't list aren't added to
+    it. Each manifest is read and written once, and only replaced,
+    atomically, if an entry changed.
+    :param manifest_paths: Paths to packageList.txt files
+    :param package_specs: List of :py:class:PackageSpec to update
+    :returns: OrderedDict of manifest path to the keys of the entries
+    updated in it
+    """
+    new_specs = _specs_by_key(package_specs)
+    updated = OrderedDict()
+    for manifest_path in manifest_paths:
+        with open(manifest_path, "r") as pfile:
+            lines = pfile.readlines()
+        new_lines, changed = _updated_lines(lines, new_specs, False)
+        if changed:
+            _write_lines(manifest_path, new_lines)
+        updated[manifest_path] = changed
+    return updated
+
+
+def _specs_by_key(package_specs):
+    return OrderedDict((_mangle_spec(spec), spec) for spec in package_specs)
+
+
+def _updated_lines(lines, new_specs, replace):
+    """
+    Rewrite manifest lines with one pass over them.
+    :param new_specs: OrderedDict of manifest key to spec. It isn't
+    modified, so it can be shared between manifests.
+    :param replace: If True, the specs are the whole manifest: entries
+    not in them are dropped and missing ones appended.
+    :returns: Tuple of (new lines, keys of the updated entries)
+    """
     new_lines = []
+    changed = []
+    seen = set()
     for orig in lines:
         # Strip comments
         line_and_comment = orig.split("#")
         line = line_and_comment[0]
         comment = ""
         if len(line_and_comment) > 1:
-            comment = "#".join(line_and_comment[1:]).rstrip()
+            comment = "#" + "#".join(line_and_comment[1:]).rstrip()
         line = line.rstrip()
 
         if not len(line):
@@ -78,25 +178,37 @@ def update_manifest_file(manifest_file, package_specs):
 
         old_spec = get_spec(line)
         mangled = _mangle_spec(old_spec)
-        if mangled in new_specs and old_spec != new_specs[mangled]:
-            new_spec = new_specs[mangled]
+        new_spec = new_specs.get(mangled)
+        if new_spec is not None:
+            seen.add(mangled)
+            new_spec = _with_options(new_spec, old_spec)
+        if new_spec is not None and old_spec != new_spec:
             line = format_spec(new_spec, comment)
             new_lines.append(line + "\n")
-            del new_specs[mangled]
+            changed.append(mangled)
             logger.info("Updating spec for package: {}".format(mangled))
-        elif mangled in new_specs:
+        elif new_spec is not None:
             new_lines.append(orig)
-            del new_specs[mangled]
             logger.info("Package unchanged: {}".format(old_spec.name))
+        elif not replace:
+            new_lines.append(orig)
 
-    # Process new specs last
-    unused_specs = [i for i in package_specs if i in new_specs.values()]
-    for spec in unused_specs:
-        logger.info("Writing new spec for package: {}".format(spec.name))
-        new_lines.append(format_spec(spec) + "\n")
-    manifest_file.seek(0)
-    manifest_file.truncate()
-    manifest_file.writelines(new_lines)
+    if replace:
+        # Process new specs last
+        if new_lines and not new_lines[-1].endswith("\n"):
+            new_lines[-1] += "\n"
+        for mangled, spec in new_specs.items():
+            if mangled in seen:
+                continue
+            logger.info("Writing new spec for package: {}".format(spec.name))
+            new_lines.append(format_spec(spec) + "\n")
+            changed.append(mangled)
+    return new_lines, changed
+
+
+def _write_lines(manifest_path, lines):
+    with atomic_write(manifest_path, copy_mode=True) as pfile:
+        pfile.writelines(lines)
 
 
 def _mangle_spec(spec):
@@ -106,9 +218,21 @@ def _mangle_spec(spec):
     return package
 
 
+def _with_options(spec, old_spec):
+    """
+    Carry options of an existing manifest entry over to a new spec
+    which doesn't set them.
+    """
+    if spec.fetch is not None or old_spec.fetch is None:
+        return spec
+    return PackageSpec(spec.name, spec.ref, spec.ref_path, old_spec.fetch)
+
+
 def format_spec(spec, comment=None):
     package = _mangle_spec(spec)
     spec_list = [package, spec.ref]
+    if spec.fetch:
+        spec_list.append("fetch=" + spec.fetch)
     if comment:
         spec_list.append(comment)
     return " ".join(spec_list)
@@ -116,11 +240,19 @@ def format_spec(spec, comment=None):
 
 def get_spec(line):
     # Rebuild old_spec
-    (package, ref) = line.split(" ")
+    fields = line.split()
+    (package, ref) = fields[:2]
     ref_path = None
+    options = {}
+    for option in fields[2:]:
+        key, _, value = option.partition("=")
+        if key not in SPEC_OPTIONS or not value:
+            raise RepomanError("Invalid option for {}: {}".format(package,
+                                                                  option))
+        options[key] = value
 
     if "/" in package:
         parts = package.split("/")
         package = parts[0]
         ref_path = "/".join(parts[1:])
-    return PackageSpec(package, ref, ref_path)
+    return PackageSpec(package, ref, ref_path, **options)
@@ -1,35 +1,79 @@
-from git import Repo, GitCommandError
 from .error import RepomanError
+from collections import namedtuple
+import io
+import re
 import logging
 
 logger = logging.getLogger(__name__)
 
 DESCRIBE_MATCH_PATTERN = "{name}-[0-9][0-9]-[0-9][0-9]-[0-9][0-9]*"
+# Header of `git status --porcelain --branch`, e.g.
+# "## master...origin/master [ahead 1, behind 2]"
+BRANCH_HEADER = re.compile(r"## (?P<branch>.+?)(?:\.\.\.\S+)?"
+                           r"(?: \[(?:ahead (?P<ahead>\d+))?(?:, )?"
+                           r"(?:behind (?P<behind>\d+))?(?:gone)?\])?$")
+
+PackageStatus = namedtuple("PackageStatus", [
+    "name", "ref", "staged", "branch", "commit", "describe", "dirty",
+    "untracked", "ahead", "behind", "at_ref"])
 
 
 class Package:
-    def __init__(self, name, workspace, path, repo=None):
+    def __init__(self, name, workspace, path, repo=None, backend=None):
+        # GitPython is imported here so PackageSpec stays cheap to import
+        from git import Repo
+        from .backend import get_backend
         self.name = name
         self.workspace = workspace
         self.path = path
         self.repo = repo or Repo(path)
+        self.backend = backend or getattr(workspace, "backend", None) or \
+            get_backend()
+        self._versions = None
         # FIXME: assert_valid_repo(self.repo)
 
-    def read_manifest(self):
-        from .manifest import find_manifest, read_manifest
+    @property
+    def versions(self):
+        """
+        :py:class:repoman.versions.VersionIndex of the release tags,
+        shared by every query on this package.
+        """
+        if self._versions is None:
+            from .versions import VersionIndex
+            self._versions = VersionIndex(self.name, self.repo, self.backend)
+        return self._versions
+
+    def read_manifest(self, ref=None):
+        """
+        Read the package manifest from the working tree, or from a
+        commit if ref is given.
+        """
+        from .manifest import find_manifest, read_manifest, \
+            read_manifest_file, PACKAGE_LIST
+        if ref is not None:
+            content = self.backend.read_file(self.repo, ref, PACKAGE_LIST)
+            if content is None:
+                raise RepomanError("No manifest found for {} at {}".format(
+                    self.name, ref))
+            return read_manifest_file(io.StringIO(content + "\n"))
         manifest_path = find_manifest(self.path)
         if not manifest_path:
             raise RepomanError("Package isn't a product")
         return read_manifest(manifest_path)
 
-    def has_dependencies(self):
-        from .manifest import find_manifest
+    def has_dependencies(self, ref=None):
+        from .manifest import find_manifest, PACKAGE_LIST
         """
         A product is a special package which is collection of
         packages prepared together into a logical application.
 
         For Fermi, this includes ScienceTools and GlastRelease.
+        :param ref: If given, check the commit instead of the working
+        tree
         """
+        if ref is not None:
+            return self.backend.has_object(
+                self.repo, "{}:{}".format(ref, PACKAGE_LIST))
         return find_manifest(self.path) is not None
 
     def describe(self):
@@ -43,10 +87,72 @@ class Package:
             "--always"
         )
 
+    def status(self, ref=None, paths=None):
+        """
+        Summarize the state of the working tree with two git processes,
+        one for ``git status`` and one for :py:meth:describe, plus one
+        for each path checked out at another ref.
+        :param ref: The ref the manifest pins the package to
+        :param paths: Optional dictionary of path to the ref it is
+        checked out at. Paths are only dirty if they differ from their
+        own ref.
+        :returns: :py:class:PackageStatus. ``at_ref`` is None if no ref
+        is given.
+        """
+        from git import GitCommandError
+        paths = paths or {}
+        try:
+            output = self.repo.git.status(
+                "--porcelain", "--branch", "--", ".",
+                *[":(exclude)" + path for path in paths])
+            dirty = False
+            for path, path_ref in paths.items():
+                try:
+                    self.repo.git.diff("--quiet", path_ref, "--", path)
+                except GitCommandError:
+                    dirty = True
+        except GitCommandError as e:
+            raise RepomanError("Unable to read status of " + self.name,
+                               e.stderr)
+        lines = output.splitlines()
+        branch, ahead, behind = _branch_status(lines[0])
+        changes = [line for line in lines[1:] if line]
+        untracked = len([line for line in changes if line.startswith("??")])
+        dirty = dirty or len(changes) > untracked
+        if not self.repo.head.is_valid():
+            # Initialized, but nothing was ever checked out
+            return PackageStatus(self.name, ref, False, branch, None, None,
+                                 dirty, untracked, ahead, behind, False)
+        # Read from the repo files, no git process needed
+        commit = self.repo.head.commit.hexsha
+        try:
+            describe = self.describe()
+        except GitCommandError as e:
+            raise RepomanError("Unable to describe " + self.name, e.stderr)
+        at_ref = None
+        if ref is not None:
+            at_ref = self._at_ref(ref, branch, commit, describe)
+        return PackageStatus(self.name, ref, True, branch, commit, describe,
+                             dirty, untracked, ahead, behind, at_ref)
+
+    def _at_ref(self, ref, branch, commit, describe):
+        # Most packages are at a branch or a package tag, which the
+        # status and describe output already tell
+        if ref in (branch, describe.replace("-dirty", "")) or \
+                (len(ref) >= 7 and commit.startswith(ref)):
+            return True
+        from git import GitCommandError
+        try:
+            return self.repo.git.rev_parse(
+                "--verify", "-q", ref + "^{commit}") == commit
+        except GitCommandError:
+            return False
+
     def closest_tag(self):
         """
         Describe this package the most recent package tag.
         """
+        from git import GitCommandError
         self.repo.commit()
         try:
             return self.repo.git.describe(
@@ -59,14 +165,39 @@ class Package:
         return None
 
 
+def _branch_status(header):
+    """
+    Parse the branch header of ``git status --porcelain --branch``.
+    :returns: Tuple of (branch or None if detached, commits ahead,
+    commits behind). Counts are None without an upstream.
+    """
+    match = BRANCH_HEADER.match(header)
+    if match is None or match.group("branch").startswith("HEAD "):
+        return None, None, None
+    branch = match.group("branch")
+    for prefix in ["Initial commit on ", "No commits yet on "]:
+        if branch.startswith(prefix):
+            branch = branch[len(prefix):]
+    ahead = behind = None
+    if "..." in header and not header.endswith("[gone]"):
+        ahead = int(match.group("ahead") or 0)
+        behind = int(match.group("behind") or 0)
+    return branch, ahead, behind
+
+
 class PackageSpec:
-    def __init__(self, name, ref=None, ref_path=None):
+    def __init__(self, name, ref=None, ref_path=None, fetch=None):
         self.name = name
         self.ref = ref
         self.ref_path = ref_path
+        self.fetch = fetch
 
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
+    def __ne__(self, other):
+        # Python 2 doesn't derive this from __eq__
+        return not self == other
+
     def __repr__(self):
         return repr(self.__dict__)
@@ -0,0 +1,111 @@
+from collections import namedtuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The refs module resolves prioritized lists of refs against a
+repository without spawning a git process per candidate.
+"""
+
+# Order git uses to expand a short name, see `man gitrevisions`
+DWIM_RULES = ["{}", "refs/{}", "refs/tags/{}", "refs/heads/{}",
+              "refs/remotes/{}", "refs/remotes/{}/HEAD"]
+REF_FORMAT = "%(objectname)%09%(*objectname)%09%(refname)"
+
+Resolution = namedtuple("Resolution", ["ref", "sha", "candidate"])
+
+
+class RefResolver:
+    """
+    Answers ref lookups for one repository from an in-memory table
+    loaded with a single ``for-each-ref`` call. Candidates which
+    aren't ref names (commits, abbreviated SHAs, revision expressions)
+    are looked up together through the git backend.
+    """
+
+    def __init__(self, repo, remote="origin", backend=None):
+        """
+        :param backend: Optional :py:class:repoman.backend.GitBackend
+        commits are resolved with
+        """
+        from .backend import GitBackend
+        self.repo = repo
+        self.remote = remote
+        self.backend = backend or GitBackend()
+        self._refs = None
+
+    @property
+    def refs(self):
+        """
+        Dictionary of full ref name to the commit SHA it points to.
+        """
+        if self._refs is None:
+            self.reload()
+        return self._refs
+
+    def reload(self):
+        self._refs = {}
+        output = self.repo.git.for_each_ref("--format=" + REF_FORMAT)
+        for line in output.splitlines():
+            sha, peeled, refname = line.split("\t")
+            # Annotated tags point at a tag object, use the commit
+            self._refs[refname] = peeled or sha
+
+    def lookup(self, name):
+        """
+        Find a ref the way git would expand a short name.
+        :returns: Tuple of (full ref name, SHA) or None
+        """
+        for rule in DWIM_RULES:
+            refname = rule.format(name)
+            if refname in self.refs:
+                return refname, self.refs[refname]
+        return None
+
+    def is_tag(self, name):
+        return "refs/tags/" + name in self.refs
+
+    def resolve(self, candidates):
+        """
+        Resolve the first candidate which names a commit.
+
+        For each candidate, in order, a ref or commit in the repo is
+        preferred, then a branch at the remote.
+        :param candidates: Tags, Branches, or Commits, in decreasing
+        priority
+        :returns: :py:class:Resolution of the ref to check out, its
+        SHA, and the winning candidate, or None if nothing resolved
+        """
+        candidates = [str(candidate) for candidate in candidates]
+        commits = self._batch_commits(
+            [c for c in candidates if self.lookup(c) is None])
+        for candidate in candidates:
+            found = self.lookup(candidate)
+            if found is not None:
+                return Resolution(candidate, found[1], candidate)
+            if commits.get(candidate):
+                return Resolution(candidate, commits[candidate], candidate)
+            remote_ref = "refs/remotes/{}/{}".format(self.remote, candidate)
+            if remote_ref in self.refs:
+                return Resolution("{}/{}".format(self.remote, candidate),
+                                  self.refs[remote_ref], candidate)
+        return None
+
+    def commits(self, names):
+        """
+        Resolve names to commit SHAs, looking ref names up in the table
+        and everything else up through the backend.
+        :returns: Dictionary of name to SHA for names which resolved
+        """
+        commits = {}
+        for name in names:
+            found = self.lookup(name)
+            if found is not None:
+                commits[name] = found[1]
+        commits.update(self._batch_commits(
+            [name for name in names if name not in commits]))
+        return commits
+
+    def _batch_commits(self, names):
+        return self.backend.commits(self.repo, names)
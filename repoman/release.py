@@ -2,7 +2,11 @@ import json
 import logging
 import os
 import re
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from .error import RepomanError
+from .timing import NULL_TRACER, PACKAGE_SPAN
+from .transport import HostLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -10,32 +14,25 @@ RELEASE_COMMIT_PREFIX = "[repoman-release]"
 RELEASE_COMMIT_MESSAGE = "Prepare release"
 RELEASE_FILE = "repoman_release.json"
 TARGET_DIR = "target"
+PUSH_CONNECTIONS_PER_HOST = 4
 
+PerformResult = namedtuple("PerformResult", ["package", "tag", "pushed",
+                                             "error"])
 
-def resolve_next_version(package, major=None, minor=None, patch=None):
-    current_version = package.describe()
-    if not current_version:
-        raise RepomanError("No valid tag found")
-    split_version = current_version.split("-")
-    (next_major, next_minor, next_patch) = [int(i) for i in split_version[:3]]
-    pre_release = "-".join(split_version)[3:] if len(split_version) > 3 else ""
-    len_args = sum([1 for i in [major, minor, patch] if i])
-
-    if not pre_release and not len_args:
-        raise RepomanError("Invalid version specification")
 
+def resolve_next_version(package, major=None, minor=None, patch=None):
+    """
+    The version following the newest release of a package.
+    """
     if major:
-        next_major += 1
-        next_minor = 0
-        next_patch = 0
+        bump = "major"
     elif minor:
-        next_minor += 1
-        next_patch = 0
+        bump = "minor"
     elif patch:
-        next_patch += 1
-
-    version = "{:02}-{:02}-{:02}".format(next_major, next_minor, next_patch)
-    return version
+        bump = "patch"
+    else:
+        raise RepomanError("Invalid version specification")
+    return package.versions.next_version(bump)
 
 
 def prepare(package, release_version, release_message, commit_message=None,
@@ -60,12 +57,24 @@ def prepare(package, release_version, release_message, commit_message=None,
     :param remote: Remote handle of where to push changes. Defaults
     to ``origin``.
     """
+    with _tracer(package).span(PACKAGE_SPAN, package.name):
+        _prepare(package, release_version, release_message, commit_message,
+                 remote)
+
+
+def _prepare(package, release_version, release_message, commit_message,
+             remote):
+    tracer = _tracer(package)
     # Assert everything is committed.
-    if package.repo.is_dirty():
+    with tracer.span("status", package.name):
+        dirty = package.repo.is_dirty()
+    if dirty:
         raise RepomanError("Current working copy is dirty. Check git status.")
 
     current_ref = package.repo.head.commit.hexsha
     new_tag = _get_tag(package, release_version)
+    if package.versions.exists(new_tag):
+        raise RepomanError("Tag {} already exists".format(new_tag))
 
     full_commit_message = _get_commit_message(commit_message, new_tag)
 
@@ -81,7 +90,8 @@ def prepare(package, release_version, release_message, commit_message=None,
 
     target_path = os.path.join(package.path, TARGET_DIR)
     release_file_path = os.path.join(target_path, RELEASE_FILE)
-    do_resolve_release(package, release_properties)
+    with tracer.span("resolve-release", package.name):
+        do_resolve_release(package, release_properties)
     if not os.path.exists(target_path):
         os.mkdir(target_path)
     with open(release_file_path, "w") as release_file:
@@ -89,14 +99,82 @@ def prepare(package, release_version, release_message, commit_message=None,
         release_file.write(output)
 
 
-def perform(package, push=True):
+def perform(package, push=True, tagged_ok=False):
     """
     Verify state from perform, commit changes, tag package(s),
     and push the tags
     :param package: Package to release
     :param push: If True, the tag will be pushed.
+    :param tagged_ok: If True, a release whose tag already points at
+    HEAD is only pushed
+    """
+    with _tracer(package).span(PACKAGE_SPAN, package.name):
+        tag, remote = _commit_release(package, tagged_ok=tagged_ok)
+        if push:
+            _push_tag(package, remote, tag)
+
+
+def perform_all(packages, push=True, jobs=8,
+                per_host=PUSH_CONNECTIONS_PER_HOST):
     """
+    Perform the prepared releases of many packages. Releases are
+    committed and tagged one package at a time, which is local and
+    quick, then all tags are pushed concurrently, with a bounded
+    number of connections to each host. A package already tagged by
+    an earlier, interrupted run is only pushed.
+    :param packages: List of :py:class:repoman.package.Package
+    :param push: If True, the tags will be pushed
+    :param jobs: Number of tags to push concurrently
+    :param per_host: Number of concurrent pushes to any one host
+    :returns: List of :py:class:PerformResult, in the order of packages
+    """
+    from git import GitCommandError
+    results = OrderedDict()
+    pushes = []
+    for package in packages:
+        tag = None
+        try:
+            with _tracer(package).span(PACKAGE_SPAN, package.name):
+                tag, remote = _commit_release(package, tagged_ok=True)
+            url = _remote_url(package, remote)
+        except (RepomanError, GitCommandError) as e:
+            results[package.name] = PerformResult(package.name, tag, False,
+                                                  e)
+            continue
+        results[package.name] = PerformResult(package.name, tag, False, None)
+        pushes.append((package, url, remote, tag))
+    if not push or not pushes:
+        return list(results.values())
+
+    limiter = HostLimiter(per_host)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [(package, tag, executor.submit(
+            limiter.run, url, _push_tag, package, remote, tag))
+            for package, url, remote, tag in pushes]
+    for package, tag, future in futures:
+        error = future.exception()
+        results[package.name] = PerformResult(package.name, tag,
+                                              error is None, error)
+    return list(results.values())
+
+
+def find_prepared(working_path):
+    """
+    Names of the packages of a workspace with a prepared release.
+    """
+    return sorted(name for name in os.listdir(working_path)
+                  if os.path.exists(os.path.join(working_path, name,
+                                                 TARGET_DIR, RELEASE_FILE)))
 
+
+def _commit_release(package, tagged_ok=False):
+    """
+    Commit and tag a prepared release.
+    :param tagged_ok: If True, a release whose tag already points at
+    HEAD is taken as done
+    :returns: Tuple of (tag, remote to push to)
+    """
+    tracer = _tracer(package)
     target_path = os.path.join(package.path, TARGET_DIR)
     release_file_path = os.path.join(target_path, RELEASE_FILE)
 
@@ -108,25 +186,53 @@ def perform(package, push=True):
         release_properties = json.loads(release_input)
 
     tag = release_properties["tag"]
+    remote = release_properties["remote"]
     # Verify tag doesn't exist
-    if tag in package.repo.tags:
+    if package.versions.exists(tag):
+        commits = package.backend.commits(package.repo,
+                                          ["refs/tags/" + tag, "HEAD"])
+        if tagged_ok and commits.get("refs/tags/" + tag) == \
+                commits.get("HEAD"):
+            logger.info("{} is already tagged".format(tag))
+            return tag, remote
         raise RepomanError("Tag {} already exists".format(tag))
 
     commit_message = release_properties["commit_message"]
-    # Get a list of changed files and add them to the index for commmit
-    for item in package.repo.index.diff(None):
-        package.repo.index.add([item.a_path])
-    # Perform commit with message
-    package.repo.index.commit(commit_message)
+    with tracer.span("commit", package.name):
+        # Add every changed file to the index for commit at once
+        changed = [item.a_path for item in package.repo.index.diff(None)]
+        if changed:
+            package.repo.index.add(changed)
+        # Perform commit with message
+        package.repo.index.commit(commit_message)
 
-    tag = release_properties["tag"]
     release_message = release_properties["release_message"]
-    remote = release_properties["remote"]
-    package.repo.create_tag(tag, ref="HEAD", message=release_message,
-                            cleanup="whitespace")
-
-    if push:
-        package.repo.remotes[remote].push(tag)
+    with tracer.span("tag", package.name):
+        package.repo.create_tag(tag, ref="HEAD", message=release_message,
+                                cleanup="whitespace")
+    package.backend.invalidate(package.repo)
+    package.versions.refresh()
+    return tag, remote
+
+
+def _remote_url(package, remote):
+    try:
+        return package.repo.remotes[remote].url
+    except IndexError:
+        raise RepomanError("{} has no remote {}".format(package.name, remote))
+
+
+def _push_tag(package, remote, tag):
+    from git import GitCommandError
+    with _tracer(package).span("push", package.name):
+        try:
+            push_infos = package.repo.remotes[remote].push(tag)
+        except GitCommandError as e:
+            raise RepomanError("Unable to push {}".format(tag), e.stderr)
+    for push_info in push_infos:
+        if push_info.flags & push_info.ERROR:
+            raise RepomanError("Unable to push {}: {}".format(
+                tag, push_info.summary.strip()))
 
 
 def do_resolve_release(package, release_properties):
@@ -146,6 +252,11 @@ def do_resolve_release(package, release_properties):
             changelog_file.writelines(new_lines)
 
 
+def _tracer(package):
+    # Packages can be released without a workspace
+    return getattr(package.workspace, "tracer", None) or NULL_TRACER
+
+
 def _get_tag(package, version):
     return "-".join([package.name, version])
 
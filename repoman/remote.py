@@ -0,0 +1,161 @@
+import git
+from git.exc import GitCommandError
+from .error import RepomanError
+from .fetch import FetchScheduler
+from .files import atomic_write
+from .refs import Resolution
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The remote module keeps an on-disk index of the refs at each
+package's remote, read with ``git ls-remote``, so staging can be
+planned without fetching anything.
+"""
+
+REMOTE_INDEX_FILE = "remote_refs.json"
+REMOTE_INDEX_TTL = 600
+
+
+class RemoteRefIndex:
+
+    def __init__(self, path, ttl=REMOTE_INDEX_TTL, scheduler=None):
+        """
+        :param path: Path of the JSON index file
+        :param ttl: Seconds an entry is trusted before it is read
+        from the remote again
+        :param scheduler: Optional
+        :py:class:repoman.fetch.FetchScheduler remotes are read with,
+        so a stalled remote is retried and given up on like a fetch
+        """
+        self.path = path
+        self.ttl = ttl
+        self.scheduler = scheduler or FetchScheduler()
+        self._lock = threading.Lock()
+        self._entries = None
+
+    @property
+    def entries(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = {}
+                if os.path.exists(self.path):
+                    with open(self.path) as f:
+                        self._entries = json.load(f)
+            return self._entries
+
+    def cached(self, package, repo_url):
+        """
+        The refs of a package if the index has a fresh entry for it.
+        :returns: Dictionary of full ref name to commit SHA, or None
+        """
+        entry = self.entries.get(package)
+        if entry is None or entry["url"] != repo_url or \
+                time.time() - entry["time"] > self.ttl:
+            return None
+        return entry["refs"]
+
+    def refs(self, package, repo_url, refresh=False):
+        """
+        The refs of a package, read from the remote if the index
+        doesn't have a fresh entry.
+        """
+        refs = None if refresh else self.cached(package, repo_url)
+        if refs is None:
+            try:
+                refs = self.scheduler.run(
+                    package, repo_url,
+                    lambda timeout: _ls_remote(repo_url, timeout),
+                    retry_on=GitCommandError)
+            except GitCommandError as e:
+                raise RepomanError("Unable to list refs of " + repo_url,
+                                   e.stderr)
+            entry = dict(url=repo_url, time=time.time(), refs=refs)
+            entries = self.entries
+            with self._lock:
+                entries[package] = entry
+        return refs
+
+    def update(self, packages, jobs=8, refresh=False):
+        """
+        Read the refs of many packages concurrently, then save.
+        :param packages: Dictionary of package name to repo url
+        """
+        errors = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(self.refs, package, url, refresh)
+                       for package, url in packages.items()]
+        for future in futures:
+            if future.exception() is not None:
+                errors.append(future.exception())
+        self.save()
+        if errors:
+            raise errors[0]
+
+    def resolve(self, package, repo_url, candidates, refresh=False):
+        """
+        Resolve the first candidate naming a tag, branch, or complete
+        SHA at the remote.
+        :returns: :py:class:repoman.refs.Resolution or None
+        """
+        refs = self.refs(package, repo_url, refresh)
+        return resolve_remote(refs, candidates)
+
+    def save(self):
+        # Load first, an index never read would wipe the entries on disk
+        entries = self.entries
+        with self._lock:
+            with atomic_write(self.path) as f:
+                json.dump(entries, f)
+
+
+def resolve_remote(refs, candidates):
+    """
+    Resolve the first candidate against a remote ref table, preferring
+    tags over branches. Complete SHAs resolve to themselves, since a
+    remote can't be asked for anything else.
+    :param refs: Dictionary of full ref name to commit SHA
+    :param candidates: Tags, Branches, or Commits, in decreasing
+    priority
+    :returns: :py:class:repoman.refs.Resolution or None
+    """
+    for candidate in candidates:
+        for refname in ["refs/tags/" + candidate, "refs/heads/" + candidate]:
+            if refname in refs:
+                return Resolution(refname, refs[refname], candidate)
+        if len(candidate) == 40 and \
+                all(c in "0123456789abcdef" for c in candidate):
+            return Resolution(candidate, candidate, candidate)
+    return None
+
+
+def bom_entry(resolution):
+    """
+    Describe a resolution the way a checkout records it in the bom.
+    """
+    entry = OrderedDict(commit=resolution.sha)
+    if resolution.ref.startswith("refs/tags/"):
+        entry["tag"] = resolution.ref[len("refs/tags/"):]
+    elif resolution.ref.startswith("refs/heads/"):
+        entry["branch"] = resolution.ref[len("refs/heads/"):]
+    return entry
+
+
+def _ls_remote(repo_url, timeout=None):
+    output = git.cmd.Git().ls_remote(repo_url, kill_after_timeout=timeout)
+    refs = {}
+    for line in output.splitlines():
+        sha, refname = line.split("\t")
+        if refname.endswith("^{}"):
+            # Peeled annotated tag, use the commit
+            refs[refname[:-3]] = sha
+        elif refname not in refs:
+            refs[refname] = sha
+    return refs
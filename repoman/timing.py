@@ -0,0 +1,117 @@
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The timing module records how long each phase of staging and
+releasing takes, per package, so slow runs can be broken down into
+fetching, retry sleeps, ref resolution, and checkouts. Spans can be
+exported as Chrome trace events, viewable in chrome://tracing or
+Perfetto.
+"""
+
+# Span covering all the work done for a package
+PACKAGE_SPAN = "stage"
+
+Span = namedtuple("Span", ["name", "package", "start", "duration", "thread"])
+
+
+class Tracer:
+
+    def __init__(self, enabled=True):
+        """
+        :param enabled: If False, spans aren't recorded
+        """
+        self.enabled = enabled
+        self.spans = []
+        self._origin = default_timer()
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, package=None):
+        """
+        Time the enclosed block as a phase of a package.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.record(name, package, start, default_timer() - start)
+
+    def record(self, name, package, start, duration):
+        """
+        Record a span which started at start, a ``default_timer()``
+        value, and lasted duration seconds.
+        """
+        if not self.enabled:
+            return
+        thread = threading.current_thread().ident
+        with self._lock:
+            # Small thread numbers read better in trace viewers
+            number = self._threads.setdefault(thread, len(self._threads) + 1)
+            self.spans.append(Span(name, package, start - self._origin,
+                                   duration, number))
+
+    def slowest(self, count=5):
+        """
+        The packages which took longest, with the time spent in each
+        phase.
+        :returns: List of (package, seconds, OrderedDict of phase to
+        seconds) tuples, slowest first. Phases are ordered by time.
+        """
+        totals = OrderedDict()
+        phases = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span.package is None:
+                continue
+            if span.name == PACKAGE_SPAN:
+                totals[span.package] = totals.get(span.package, 0) + \
+                    span.duration
+                continue
+            package_phases = phases.setdefault(span.package, {})
+            package_phases[span.name] = package_phases.get(span.name, 0) + \
+                span.duration
+        slowest = sorted(totals.items(), key=lambda item: -item[1])[:count]
+        return [(package, total, OrderedDict(sorted(
+            phases.get(package, {}).items(), key=lambda item: -item[1])))
+            for package, total in slowest]
+
+    def write_chrome_trace(self, trace_file):
+        """
+        Write spans in the Chrome trace event format.
+        :param trace_file: File object
+        """
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            event = OrderedDict([
+                ("name", span.name if span.package is None else
+                 "{} {}".format(span.name, span.package)),
+                ("cat", span.name),
+                ("ph", "X"),
+                ("ts", int(span.start * 1e6)),
+                ("dur", int(span.duration * 1e6)),
+                ("pid", pid),
+                ("tid", span.thread)])
+            if span.package is not None:
+                event["args"] = dict(package=span.package)
+            events.append(event)
+        json.dump(dict(traceEvents=events, displayTimeUnit="ms"),
+                  trace_file)
+
+
+NULL_TRACER = Tracer(enabled=False)
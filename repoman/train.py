@@ -0,0 +1,210 @@
+from .error import RepomanError
+from .files import atomic_write
+from .package import Package, PackageSpec
+from .manifest import find_manifest, read_manifest, update_manifests
+from .release import prepare, perform, TARGET_DIR, RELEASE_FILE
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The train module releases a product together with every package of
+it which has unreleased commits. Progress is recorded in a state
+file in the product's target directory, so an interrupted train can
+be resumed where it stopped.
+"""
+
+TRAIN_FILE = "repoman_train.json"
+PREPARED = "prepared"
+RELEASED = "released"
+MANIFEST_UPDATED = "manifest-updated"
+
+
+class ReleaseTrain:
+
+    def __init__(self, product):
+        """
+        :param product: :py:class:repoman.package.Package of the
+        product, staged in its workspace with its packages
+        """
+        self.product = product
+        self.path = os.path.join(product.path, TARGET_DIR, TRAIN_FILE)
+        self.state = None
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f, object_pairs_hook=OrderedDict)
+
+    @property
+    def in_progress(self):
+        return self.state is not None and self.state["status"] != RELEASED
+
+    def plan(self, bump="patch", jobs=8):
+        """
+        Find the packages of the product with commits since their
+        closest release tag.
+        :param bump: Part of the version bumped for each package
+        :param jobs: Number of packages to inspect concurrently
+        :returns: OrderedDict of package name to a dict of its
+        ``previous`` tag and the ``version`` to release
+        """
+        manifest_path = find_manifest(self.product.path)
+        if manifest_path is None:
+            raise RepomanError("Package isn't a product")
+        names = OrderedDict((spec.name, None)
+                            for spec in read_manifest(manifest_path)
+                            if spec.ref_path is None)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            releases = list(executor.map(
+                lambda name: self._unreleased(name, bump), names))
+        return OrderedDict((name, release) for name, release
+                           in zip(names, releases) if release is not None)
+
+    def start(self, version, release_message, packages):
+        """
+        Record a new train. Fails if one is already in progress.
+        :param version: Version the product is released as
+        :param release_message: Message for every release of the train
+        :param packages: Plan returned by :py:meth:plan
+        """
+        if self.in_progress:
+            raise RepomanError(
+                "A release train of {} {} is in progress. Resume it, or "
+                "remove {} to start over.".format(
+                    self.product.name, self.state["version"], self.path))
+        packages = OrderedDict(
+            (name, OrderedDict([("previous", release["previous"]),
+                                ("version", release["version"]),
+                                ("status", None)]))
+            for name, release in packages.items())
+        self.state = OrderedDict([
+            ("product", self.product.name),
+            ("version", version),
+            ("release_message", release_message),
+            ("packages", packages),
+            ("status", None)])
+        self._save()
+
+    def run(self, jobs=8, push=True):
+        """
+        Release the packages of the train, prepared concurrently, then
+        update the product manifest with their new tags and release
+        the product. Steps recorded as done are skipped, so this also
+        resumes an interrupted train.
+        :returns: OrderedDict of package name to the tag released
+        """
+        if not self.in_progress:
+            raise RepomanError("No release train is in progress")
+        packages = self.state["packages"]
+        message = self.state["release_message"]
+        pending = [name for name, release in packages.items()
+                   if release["status"] is None]
+        if pending:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(self._prepare, name, message)
+                           for name in pending]
+            errors = [future.exception() for future in futures
+                      if future.exception() is not None]
+            if errors:
+                raise errors[0]
+        tags = OrderedDict((name, _tag(name, release["version"]))
+                           for name, release in packages.items())
+        for name, release in packages.items():
+            if release["status"] == PREPARED:
+                self._perform(self._staged_package(name), push)
+                self._set_status(name, RELEASED)
+
+        product_tag = _tag(self.product.name, self.state["version"])
+        if self.state["status"] is None:
+            if _prepared_tag(self.product) != product_tag:
+                prepare(self.product, self.state["version"], message)
+            self._set_status(None, PREPARED)
+        if self.state["status"] == PREPARED:
+            # After prepare, which refuses to release a dirty product
+            manifest_path = find_manifest(self.product.path)
+            update_manifests([manifest_path],
+                             [PackageSpec(name, tag)
+                              for name, tag in tags.items()])
+            self._set_status(None, MANIFEST_UPDATED)
+        if self.state["status"] == MANIFEST_UPDATED:
+            self._perform(self.product, push)
+            self._set_status(None, RELEASED)
+        tags[self.product.name] = product_tag
+        return tags
+
+    def _unreleased(self, name, bump):
+        package = self._package(name)
+        if package is None:
+            logger.info("{} isn't staged, not releasing it".format(name))
+            return None
+        previous = package.closest_tag()
+        if previous is None:
+            logger.warning("{} has no release tag, not releasing "
+                           "it".format(name))
+            return None
+        count = int(package.repo.git.rev_list("--count",
+                                              previous + "..HEAD"))
+        if not count:
+            return None
+        logger.info("{} has {} commits since {}".format(name, count,
+                                                        previous))
+        # Bumped from the newest release, like a single release, even
+        # if previous is on an older line
+        return dict(previous=previous,
+                    version=package.versions.next_version(bump))
+
+    def _prepare(self, name, message):
+        package = self._staged_package(name)
+        version = self.state["packages"][name]["version"]
+        # A prepare which finished before an interruption is reused
+        if _prepared_tag(package) != _tag(name, version):
+            prepare(package, version, message)
+        self._set_status(name, PREPARED)
+
+    def _perform(self, package, push):
+        # A tag made before an interruption isn't redone, but it is
+        # pushed, since the push may be what failed
+        perform(package, push=push, tagged_ok=True)
+
+    def _staged_package(self, name):
+        package = self._package(name)
+        if package is None:
+            raise RepomanError("{} of the release train isn't staged".format(
+                name))
+        return package
+
+    def _package(self, name):
+        path = os.path.join(self.product.workspace.working_path, name)
+        if not os.path.isdir(os.path.join(path, ".git")):
+            return None
+        return Package(name, self.product.workspace, path)
+
+    def _set_status(self, name, status):
+        with self._lock:
+            if name is None:
+                self.state["status"] = status
+            else:
+                self.state["packages"][name]["status"] = status
+        self._save()
+
+    def _save(self):
+        with self._lock:
+            with atomic_write(self.path) as f:
+                json.dump(self.state, f, indent=4, separators=(',', ': '))
+
+
+def _tag(name, version):
+    return "-".join([name, version])
+
+
+def _prepared_tag(package):
+    release_file = os.path.join(package.path, TARGET_DIR, RELEASE_FILE)
+    if not os.path.exists(release_file):
+        return None
+    with open(release_file) as f:
+        return json.load(f).get("tag")
@@ -0,0 +1,200 @@
+from .files import atomic_write
+import errno
+import json
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The transport module decides how repoman talks to GitHub. The result
+of probing SSH access is cached, and SSH connections are multiplexed
+over one master connection so each fetch doesn't pay for its own
+handshake.
+"""
+
+GITHUB_SSH = "git@github.com"
+GITHUB_HTTPS = "https://github.com/"
+TRANSPORT_FILE = "transport.json"
+PROBE_TTL = 3600
+# A failed probe is retried sooner, it may have been a transient error
+FAILED_PROBE_TTL = 60
+SSH_CONTROL_PERSIST = 60
+
+
+def user_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "repoman")
+
+
+def resolve_remote_base(remote_base, cache_file=None, ttl=PROBE_TTL,
+                        multiplex=True, failed_ttl=FAILED_PROBE_TTL):
+    """
+    Pick the remote base to use for a run. For SSH remotes on GitHub,
+    connections are multiplexed and, if SSH doesn't work, the HTTPS
+    remote of the same user or organization is used instead.
+    :param remote_base: Configured remote base
+    :param cache_file: Where probe results are cached. Defaults to
+    ``transport.json`` in the user cache directory.
+    :param ttl: Seconds a probe result is trusted
+    :param multiplex: Share one SSH master connection between git
+    processes of this run
+    :param failed_ttl: Seconds a failed probe is trusted
+    :returns: The remote base to use
+    """
+    if "git@github" not in remote_base:
+        return remote_base
+    if multiplex:
+        enable_ssh_multiplexing()
+    cache_file = cache_file or os.path.join(user_cache_dir(), TRANSPORT_FILE)
+    if ssh_works(GITHUB_SSH, cache_file, ttl, failed_ttl):
+        return remote_base
+    org_or_user = remote_base.split(":")[-1]
+    return GITHUB_HTTPS + org_or_user
+
+
+def ssh_works(host, cache_file, ttl=PROBE_TTL, failed_ttl=FAILED_PROBE_TTL):
+    """
+    Check whether SSH authentication to host succeeds, using a cached
+    result if it is younger than ttl, or failed_ttl if it failed.
+    """
+    probes = _read_probes(cache_file)
+    probe = probes.get(host)
+    if probe is not None and time.time() - probe["time"] <= \
+            (ttl if probe["ok"] else min(ttl, failed_ttl)):
+        return probe["ok"]
+    logger.debug("Probing SSH access to {}".format(host))
+    command = ["ssh", "-o", "BatchMode=yes"] + _ssh_options() + [host]
+    with open(os.devnull, 'w') as devnull:
+        # GitHub accepts the key, then refuses a shell with status 1
+        ok = subprocess.call(command, stdin=devnull, stdout=devnull,
+                             stderr=devnull) == 1
+    probes[host] = dict(ok=ok, time=time.time())
+    _write_probes(cache_file, probes)
+    return ok
+
+
+def enable_ssh_multiplexing():
+    """
+    Have git processes started from this one share an SSH master
+    connection, unless the user already configured git's SSH command.
+    Needs git 2.3 or later, earlier versions ignore it.
+    """
+    if "GIT_SSH_COMMAND" in os.environ or "GIT_SSH" in os.environ:
+        return
+    options = _ssh_options()
+    if options:
+        os.environ["GIT_SSH_COMMAND"] = " ".join(["ssh"] + options)
+
+
+class HostLimiter:
+    """
+    Bounds the number of concurrent connections to each host, so
+    parallel git operations don't overwhelm, or get throttled by, a
+    single server.
+    """
+
+    def __init__(self, per_host):
+        """
+        :param per_host: Maximum concurrent calls for any one host
+        """
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def run(self, url, func, *args):
+        """
+        Call func(*args) once a connection to the host of url is free.
+        """
+        host = remote_host(url)
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = semaphore
+        with semaphore:
+            return func(*args)
+
+
+def remote_host(url):
+    """
+    The host of a git remote URL, for both URLs and the scp-like
+    ``user@host:path`` syntax. Local paths have no host.
+    """
+    if "://" in url:
+        scheme, _, rest = url.partition("://")
+        if scheme == "file":
+            return None
+        netloc = rest.split("/", 1)[0]
+        return netloc.rpartition("@")[2].split(":")[0]
+    first = url.split("/", 1)[0]
+    if ":" in first:
+        return first.split(":", 1)[0].rpartition("@")[2]
+    return None
+
+
+def _ssh_options():
+    if "GIT_SSH_COMMAND" in os.environ and \
+            "ControlMaster" not in os.environ["GIT_SSH_COMMAND"]:
+        return []
+    control_dir = _control_dir()
+    if control_dir is None:
+        return []
+    return ["-o", "ControlMaster=auto",
+            "-o", "ControlPath=" + os.path.join(control_dir, "%C"),
+            "-o", "ControlPersist={}".format(SSH_CONTROL_PERSIST)]
+
+
+def _control_dir(base=None):
+    """
+    Directory of the sockets of SSH master connections. Anyone who can
+    write to it can take over connections, so it must be a directory
+    only this user can access.
+    :param base: Directory it is created in. Defaults to the temporary
+    directory, as socket paths have a length limit, so deep home
+    directories are avoided.
+    :returns: Path, or None if it isn't safe to use
+    """
+    path = os.path.join(base or tempfile.gettempdir(),
+                        "repoman-ssh-{}".format(os.getuid()))
+    try:
+        os.mkdir(path, 0o700)
+        # The umask may have removed permissions from the owner
+        os.chmod(path, 0o700)
+    except OSError as e:
+        # Another process may have created it first
+        if e.errno != errno.EEXIST:
+            logger.debug("Unable to create {}: {}".format(path, e))
+            return None
+    try:
+        info = os.lstat(path)
+    except OSError as e:
+        logger.debug("Unable to read {}: {}".format(path, e))
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+            stat.S_IMODE(info.st_mode) != 0o700:
+        logger.warning("Not sharing SSH connections, {} isn't a directory "
+                       "only you can access".format(path))
+        return None
+    return path
+
+
+def _read_probes(cache_file):
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _write_probes(cache_file, probes):
+    with atomic_write(cache_file) as f:
+        json.dump(probes, f)
@@ -0,0 +1,196 @@
+from .error import RepomanError
+from .files import atomic_write
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+The versions module keeps a sorted index of the release tags of a
+package, ``name-XX-YY-ZZ``, so version queries don't need a history
+walk. The index is saved in the repository and only the tags added or
+removed since, e.g. by a fetch, are merged into it. The refs are only
+read once by an index, queries after that are answered from memory
+until it is refreshed.
+"""
+
+VERSIONS_FILE = "repoman_versions.json"
+BUMPS = ["major", "minor", "patch"]
+
+
+class VersionIndex:
+
+    def __init__(self, name, repo, backend=None):
+        """
+        :param name: Name of the package, the prefix of its tags
+        :param repo: Repo of the package
+        :param backend: Optional :py:class:repoman.backend.GitBackend
+        tags are looked up with
+        """
+        from .backend import GitBackend
+        self.name = name
+        self.repo = repo
+        self.backend = backend or GitBackend()
+        git_dir = getattr(repo, "common_dir", None) or repo.git_dir
+        self.git_dir = git_dir
+        self.path = os.path.join(git_dir, VERSIONS_FILE)
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._versions = None
+        self._checked = False
+
+    @property
+    def versions(self):
+        """
+        Sorted list of (major, minor, patch) tuples of every release.
+        """
+        with self._lock:
+            if not self._checked:
+                self._refresh()
+            return self._versions
+
+    def refresh(self):
+        """
+        Merge the tags added or removed since the index read the refs,
+        e.g. after a fetch or a new tag.
+        """
+        with self._lock:
+            self._refresh()
+
+    def latest(self):
+        """
+        :returns: Tag of the newest release, or None
+        """
+        versions = self.versions
+        return format_tag(self.name, versions[-1]) if versions else None
+
+    def next_version(self, bump):
+        """
+        The version following the newest release.
+        :param bump: One of ``BUMPS``
+        :returns: Version, e.g. ``04-00-03``
+        """
+        versions = self.versions
+        if not versions:
+            raise RepomanError("No valid tag found")
+        return format_version(bump_version(versions[-1], bump))
+
+    def exists(self, tag):
+        """
+        Whether a tag exists. Release tags are looked up in the index,
+        anything else is asked of git.
+        """
+        version = parse_tag(self.name, tag)
+        if version is None:
+            return self.backend.has_tag(self.repo, tag)
+        versions = self.versions
+        i = bisect.bisect_left(versions, version)
+        return i < len(versions) and versions[i] == version
+
+    def _refresh(self):
+        self._checked = True
+        fingerprint = _refs_fingerprint(self.git_dir)
+        if fingerprint == self._fingerprint:
+            return
+        if self._versions is None:
+            self._load()
+            if fingerprint == self._fingerprint:
+                return
+        found = set()
+        for tag in self.backend.tags(self.repo, self.name + "-*"):
+            version = parse_tag(self.name, tag)
+            if version is not None:
+                found.add(version)
+        indexed = set(self._versions)
+        added = found - indexed
+        if indexed - found:
+            self._versions = sorted(found)
+        else:
+            for version in added:
+                bisect.insort(self._versions, version)
+        logger.debug("{} release tags of {} added to the index".format(
+            len(added), self.name))
+        self._fingerprint = fingerprint
+        self._save()
+
+    def _load(self):
+        self._versions = []
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except ValueError:
+            logger.warning("Ignoring corrupt version index " + self.path)
+            return
+        if saved.get("name") != self.name:
+            return
+        self._fingerprint = saved["fingerprint"]
+        self._versions = [tuple(version) for version in saved["versions"]]
+
+    def _save(self):
+        with atomic_write(self.path) as f:
+            json.dump(dict(name=self.name, fingerprint=self._fingerprint,
+                           versions=self._versions), f)
+
+
+def parse_tag(name, tag):
+    """
+    :returns: Tuple of (major, minor, patch) of a release tag of the
+    package, or None
+    """
+    match = re.match(r"{}-(\d{{2,}})-(\d{{2,}})-(\d{{2,}})$".format(
+        re.escape(name)), tag)
+    if match is None:
+        return None
+    return tuple(int(part) for part in match.groups())
+
+
+def bump_version(version, bump):
+    """
+    :param version: Tuple of (major, minor, patch)
+    :param bump: One of ``BUMPS``
+    """
+    major, minor, patch = version
+    if bump == "major":
+        return major + 1, 0, 0
+    elif bump == "minor":
+        return major, minor + 1, 0
+    elif bump == "patch":
+        return major, minor, patch + 1
+    raise RepomanError("Invalid version bump: " + bump)
+
+
+def format_version(version):
+    return "{:02}-{:02}-{:02}".format(*version)
+
+
+def format_tag(name, version):
+    return "-".join([name, format_version(version)])
+
+
+def _refs_fingerprint(git_dir):
+    """
+    Hash of the content of packed-refs and the names of the loose tags,
+    so any tag added or removed changes it. Timestamps aren't used, as
+    they are coarse or unreliable on some file systems, like NFS.
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(os.path.join(git_dir, "packed-refs"), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except (IOError, OSError):
+        pass
+    tags_dir = os.path.join(git_dir, "refs", "tags")
+    for root, dirs, files in os.walk(tags_dir):
+        dirs.sort()
+        for name in sorted(files):
+            tag = os.path.relpath(os.path.join(root, name), tags_dir)
+            digest.update(b"\0" + tag.encode("utf-8"))
+    return digest.hexdigest()
@@ -2,15 +2,35 @@ import git
 from git import Repo
 from git.exc import GitCommandError
 from .error import WorkspaceError
+from .files import atomic_write
+from .package import Package, PackageStatus
+from .refs import RefResolver
+from .timing import Tracer, PACKAGE_SPAN
+from .history import pack_size
+from .backend import get_backend
+from .remote import resolve_remote
+from .fetch import FETCH_FULL, FETCH_SHALLOW, FETCH_BLOBLESS, \
+    FETCH_REF_STRATEGIES, FetchScheduler, check_fetch_strategy, \
+    deadline_after, time_left
 import os
+import json
 import shutil
 import logging
+import threading
 from collections import OrderedDict
-import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from timeit import default_timer
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_REMOTE_BASE = "git@github.com:fermi-lat"
+STATE_DIR = ".repoman"
+STATE_FILE = "state.json"
 
 """
 The Workspace Module is used for staging packages from repositories
@@ -18,21 +38,64 @@ to a working directory.
 """
 
 
-SLEEP_INTERVALS = [0.5, 2.5, 5]
+_GIT_VERSION = None
+# Fetched repositories waiting for each checkout worker
+PIPELINE_DEPTH = 2
+MIRROR_FETCH_REFSPECS = ["+refs/heads/*:refs/remotes/origin/*",
+                         "+refs/tags/*:refs/tags/*"]
 
 
 class Workspace:
 
-    def __init__(self, working_path, remote_base=None):
+    def __init__(self, working_path, remote_base=None, cache=None,
+                 fetch_strategy=FETCH_FULL, remote_index=None,
+                 state_file=None, tracer=None, fetch_scheduler=None,
+                 history=None, backend=None):
+        """
+        :param working_path: Directory packages are staged into
+        :param remote_base: Github user/organization for repos
+        :param cache: Optional :py:class:repoman.cache.MirrorCache
+        packages are fetched through
+        :param fetch_strategy: Default fetch strategy, one of
+        ``FETCH_STRATEGIES``
+        :param remote_index: Optional
+        :py:class:repoman.remote.RemoteRefIndex. Fetches are skipped
+        when a fresh entry resolves to a commit the repo already has.
+        :param state_file: Optional path where the refs and commits
+        staged are persisted. Packages still at their recorded commit
+        are skipped on the next run.
+        :param tracer: Optional :py:class:repoman.timing.Tracer phases
+        of staging are timed with
+        :param fetch_scheduler: Optional
+        :py:class:repoman.fetch.FetchScheduler fetches are retried and
+        limited with
+        :param history: Optional :py:class:repoman.history.StageHistory.
+        The cost of staging each package is recorded in it, and
+        concurrent runs start the most expensive packages first.
+        :param backend: Optional :py:class:repoman.backend.GitBackend
+        object queries are answered with
+        """
+        check_fetch_strategy(fetch_strategy)
         self.working_path = working_path
         self.remote_base = remote_base or DEFAULT_REMOTE_BASE
+        self.cache = cache
+        self.fetch_strategy = fetch_strategy
+        self.remote_index = remote_index
+        self.state_file = state_file
+        self.state = _load_state(state_file)
+        self.tracer = tracer or Tracer()
+        self.fetch_scheduler = fetch_scheduler or FetchScheduler()
+        self.history = history
+        self.backend = backend or get_backend()
         self.repo = None
         self.bom = OrderedDict()
-        self.git_version = _git_version()
         self.fetched = []
+        self._timings = {}
+        self._lock = threading.Lock()
 
     def checkout(self, package, ref=None, ref_path=None, refs=None,
-                 force=False, clobber=False, in_place=False):
+                 force=False, clobber=False, in_place=False,
+                 fetch_strategy=None, sparse_paths=None):
         """
         Checkout a name repo by name.
         :param package: Name of the name you are checking out
@@ -45,6 +108,29 @@ class Workspace:
         what's in origin.
         :param clobber: Remove the directory named `name` first
         :param in_place: If True, use the working_path as the repo path
+        :param fetch_strategy: Overrides the workspace fetch strategy.
+        ``full`` fetches all history and tags, ``targeted`` fetches
+        only the requested refs and their history, ``shallow`` fetches
+        only the requested refs at depth 1, and ``blobless`` fetches
+        all history but defers file contents to checkout.
+        :param sparse_paths: If not None, restrict the working tree to
+        top-level files and these directories. An empty list restores
+        the full working tree.
+        """
+        fetch_strategy = fetch_strategy or self.fetch_strategy
+        check_fetch_strategy(fetch_strategy)
+        repo, unchanged = self._fetch_spec(package, ref, ref_path, refs,
+                                           clobber, in_place, fetch_strategy)
+        self._checkout_spec(package, repo, ref, ref_path, refs, force,
+                            sparse_paths, unchanged)
+
+    def _fetch_spec(self, package, ref, ref_path, refs, clobber, in_place,
+                    fetch_strategy, check_unchanged=True):
+        """
+        The network half of :py:meth:checkout. Fetch what a spec needs,
+        unless it is still staged as recorded in the state.
+        :param check_unchanged: If False, always fetch and check out
+        :returns: Tuple of (repo, whether the spec is unchanged)
         """
         repo_path = self.working_path
         if not in_place:
@@ -55,62 +141,327 @@ class Workspace:
             if os.path.isdir(repo_path):
                 shutil.rmtree(repo_path)
 
-        repo = self.get_or_init_repo(repo_path)
-        repo_url = os.path.join(self.remote_base, package) + ".git"
+        repo = self.get_or_init_repo(repo_path, package)
+        repo_url = self.repo_url(package)
         if not repo.remotes:
             repo.create_remote("origin", repo_url)
 
-        # Check if package has already been fetched.
-        # This happens if we are checking out a path at a different ref
-        if package not in self.fetched:
-            self._fetch(package, repo, repo_url)
+        state_key = _state_key(package, ref_path)
+        unchanged = False
+        if check_unchanged and not clobber:
+            with self.tracer.span("unchanged", package):
+                unchanged = self._is_unchanged(
+                    state_key, package, repo, repo_url, ref, refs, ref_path)
+        if not unchanged:
+            self._ensure_fetched(package, repo, repo_url, ref, refs,
+                                 fetch_strategy)
+        return repo, unchanged
+
+    def _checkout_spec(self, package, repo, ref, ref_path, refs, force,
+                       sparse_paths, unchanged):
+        """
+        The disk half of :py:meth:checkout, run once the spec is
+        fetched.
+        """
+        self._checkout_specs(package, repo, [(ref, ref_path, unchanged)],
+                             refs, force, sparse_paths)
+
+    def _checkout_specs(self, package, repo, specs, refs, force,
+                        sparse_paths, dropped_paths=None):
+        """
+        Check out the fetched specs of one repository in one pass. Refs
+        are resolved together, the base is checked out first, then the
+        paths checked out at the same ref are overlaid with a single
+        git checkout. Paths get their own bom entries, ``package/path``.
+        :param specs: List of (ref, ref_path, unchanged) tuples
+        :param dropped_paths: Paths overlaid by a previous run which
+        aren't listed any more. They are returned to the commit checked
+        out before the base is.
+        """
+        pending = []
+        for ref, ref_path, unchanged in specs:
+            state_key = _state_key(package, ref_path)
+            if unchanged:
+                logger.info("Package unchanged: {}".format(state_key))
+                with self._lock:
+                    self.bom[state_key] = self.state[state_key]["bom"]
+            else:
+                pending.append((ref, ref_path))
+
+        if dropped_paths and repo.head.is_valid():
+            with self.tracer.span("restore", package), \
+                    self._timed(package, "checkout"):
+                self._restore_paths(package, repo, dropped_paths)
+        if sparse_paths is not None:
+            # Only a package which is checked out records its cost, an
+            # unchanged one would drag its average down
+            with self.tracer.span("sparse", package), \
+                    self._timed(package, "checkout", record=bool(pending)):
+                self.set_sparse_paths(package, repo, sparse_paths,
+                                      force=force)
 
-        checkout_ref = ref or repo.head.ref
+        if not pending:
+            return
+        # Check out the base before overlaying paths
+        pending.sort(key=lambda spec: spec[1] is not None)
 
+        resolver = RefResolver(repo, backend=self.backend)
+        resolved = None
         # If a ref is listed in the list, use that instead
         if refs:
-            repo_refs = repo.references
-            origin_refs = repo.remotes.origin.refs
-            for ref in refs:
-                if _has_commit(repo, ref):
-                    checkout_ref = ref
-                    break
-
-                # Prefer origin refs
-                if ref in origin_refs:
-                    checkout_ref = origin_refs[ref]
-                    break
-
-                # fall back to local refs if not at origin
-                if ref in repo_refs:
-                    checkout_ref = repo_refs[ref]
-                    break
-
-        spec_str = "{} {}".format(package, checkout_ref or "")
-        if ref_path:
-            spec_str += " for path {}".format(ref_path)
-        logging.info("Checkout out spec: {}".format(spec_str))
+            with self.tracer.span("resolve", package):
+                resolution = resolver.resolve(refs)
+            if resolution is not None:
+                logger.debug("Resolved {} to {} for {}".format(
+                    resolution.candidate, resolution.sha, package))
+                resolved = resolution.ref
 
         checkout_args = ["-f"] if force else []
-        checkout_args.append(checkout_ref)
-        if ref_path:
-            checkout_args.append(ref_path)
+        checkouts = []
+        overlays = OrderedDict()
         try:
-            repo.git.checkout(*checkout_args)
-            if force:
-                repo.git.reset("--hard", checkout_ref)
-            self.bom[package] = dict(commit=repo.head.commit.hexsha)
-            if checkout_ref in repo.tags:
-                self.bom[package]["tag"] = checkout_ref
-            if not repo.head.is_detached:
-                self.bom[package]["branch"] = repo.head.ref.name
+            for ref, ref_path in pending:
+                checkout_ref = str(resolved or ref or repo.head.ref)
+                checkouts.append((ref, ref_path, checkout_ref))
+                spec_str = "{} {}".format(package, checkout_ref)
+                if ref_path:
+                    overlays.setdefault(checkout_ref, []).append(ref_path)
+                    spec_str += " for path {}".format(ref_path)
+                logging.info("Checkout out spec: {}".format(spec_str))
+                if ref_path:
+                    continue
+                with self.tracer.span("checkout", package), \
+                        self._timed(package, "checkout"):
+                    repo.git.checkout(*(checkout_args + [checkout_ref]))
+                if force:
+                    with self.tracer.span("reset", package), \
+                            self._timed(package, "checkout"):
+                        repo.git.reset("--hard", checkout_ref)
+            for checkout_ref, paths in overlays.items():
+                with self.tracer.span("checkout", package), \
+                        self._timed(package, "checkout"):
+                    repo.git.checkout(*(checkout_args + [checkout_ref, "--"] +
+                                        paths))
+            commits = resolver.commits([checkout_ref for _, _, checkout_ref
+                                        in checkouts])
         except GitCommandError as e:
             raise WorkspaceError("Unable to checkout name: %s, "
                                  "You may need to force checkout. \n"
                                  "Command Output: " % package,
                                  e.stderr)
 
-    def get_or_init_repo(self, repo_path):
+        for ref, ref_path, checkout_ref in checkouts:
+            if ref_path:
+                entry = dict(commit=commits[checkout_ref])
+            else:
+                entry = dict(commit=repo.head.commit.hexsha)
+                if not repo.head.is_detached:
+                    entry["branch"] = repo.head.ref.name
+            if resolver.is_tag(checkout_ref):
+                entry["tag"] = checkout_ref
+            state_key = _state_key(package, ref_path)
+            with self._lock:
+                self.bom[state_key] = entry
+                self.state[state_key] = dict(ref=ref, refs=list(refs or []),
+                                             commit=commits[checkout_ref],
+                                             bom=entry)
+
+    def _restore_paths(self, package, repo, paths):
+        """
+        Return paths to their content at HEAD, removing the files an
+        overlay added which HEAD doesn't have.
+        """
+        overlaid = set(repo.git.ls_files("-z", "--", *paths).split("\0"))
+        try:
+            repo.git.rm("-r", "-q", "--cached", "--ignore-unmatch", "--",
+                        *paths)
+            present = [path for path in paths if self.backend.has_object(
+                repo, "HEAD:" + path)]
+            if present:
+                repo.git.checkout("HEAD", "--", *present)
+        except GitCommandError as e:
+            raise WorkspaceError("Unable to restore paths of %s: %s\n"
+                                 "Command Output: "
+                                 % (package, ", ".join(paths)), e.stderr)
+        kept = set(repo.git.ls_files("-z", "--", *paths).split("\0"))
+        for name in overlaid - kept:
+            file_path = os.path.join(repo.working_tree_dir, name)
+            if os.path.lexists(file_path):
+                os.remove(file_path)
+
+    def resolve_commit(self, package, ref=None, refs=None,
+                       fetch_strategy=None):
+        """
+        Resolve a spec to a commit of the package repo without checking
+        anything out, fetching only if needed. Tags and commits already
+        in the repo are trusted. A package is fetched at most once per
+        run, so staging it afterwards doesn't fetch again.
+        :param package: Name of the package
+        :param ref: Tag, Branch, or Commit
+        :param refs: List of Tags, Branches, or Commits, in decreasing
+        priority, preferred over ref
+        :param fetch_strategy: Overrides the workspace fetch strategy
+        :returns: Tuple of (repo, commit SHA)
+        """
+        repo = self.get_or_init_repo(
+            os.path.join(self.working_path, package), package)
+        repo_url = self.repo_url(package)
+        if not repo.remotes:
+            repo.create_remote("origin", repo_url)
+        candidates = list(refs or []) + [ref or repo.head.ref.name]
+        resolver = RefResolver(repo, backend=self.backend)
+        resolution = resolver.resolve(candidates)
+        if resolution is None or refs or not (
+                resolver.is_tag(resolution.ref) or
+                _is_full_sha(resolution.candidate)):
+            self._ensure_fetched(package, repo, repo_url, ref, refs,
+                                 fetch_strategy or self.fetch_strategy)
+            resolver.reload()
+            resolution = resolver.resolve(candidates)
+        if resolution is None:
+            raise WorkspaceError("Unable to resolve {} for {}".format(
+                ", ".join(candidates), package))
+        return repo, resolution.sha
+
+    def remove(self, package, force=False):
+        """
+        Remove a staged package from the workspace.
+        :param package: Name of the package
+        :param force: Remove it even if it has local changes or commits
+        which were never pushed
+        """
+        repo_path = os.path.join(self.working_path, package)
+        if os.path.isdir(repo_path):
+            repo = Repo(repo_path)
+            if not force and repo.is_dirty(untracked_files=True):
+                raise WorkspaceError("Unable to remove {}, it has local "
+                                     "changes. You may need to force "
+                                     "it.".format(package))
+            if not force and self._unpushed(package, repo):
+                raise WorkspaceError("Unable to remove {}, it has commits "
+                                     "which were never pushed. You may need "
+                                     "to force it.".format(package))
+            logger.info("Removing package: {}".format(package))
+            shutil.rmtree(repo_path)
+        with self._lock:
+            for entries in [self.bom, self.state]:
+                for key in list(entries):
+                    if key == package or key.startswith(package + "/"):
+                        del entries[key]
+
+    def _unpushed(self, package, repo):
+        """
+        :returns: List of the commits of local branches and HEAD which
+        aren't at origin, in a tag, or staged by repoman
+        """
+        revs = ["--branches"]
+        if repo.head.is_valid():
+            revs.append("HEAD")
+        with self._lock:
+            staged = [recorded["commit"] for key, recorded
+                      in self.state.items()
+                      if key == package or key.startswith(package + "/")]
+        # Locked commits are fetched by SHA, without a ref
+        staged = [commit for commit in staged
+                  if self.backend.has_commit(repo, commit)]
+        return repo.git.rev_list(
+            *(revs + ["--not", "--remotes", "--tags"] + staged)).split()
+
+    def save_state(self):
+        """
+        Persist what has been staged to the state file, if any, and
+        the cost of this run to the history, if any.
+        """
+        if self.history is not None:
+            self._save_history()
+        if self.state_file is None:
+            return
+        with self._lock:
+            with atomic_write(self.state_file) as f:
+                json.dump(self.state, f, indent=4, separators=(',', ': '))
+
+    def _save_history(self):
+        with self._lock:
+            timings, self._timings = self._timings, {}
+        for package, package_timings in timings.items():
+            size = pack_size(os.path.join(self.working_path, package, ".git"))
+            self.history.record(package, package_timings, size or None)
+        self.history.save()
+
+    @contextmanager
+    def _timed(self, package, phase, record=True):
+        """
+        Add the time spent in the enclosed block to a phase of the
+        package's cost, for the history.
+        :param record: If False, the block isn't timed
+        """
+        if not record:
+            yield
+            return
+        start = default_timer()
+        try:
+            yield
+        finally:
+            duration = default_timer() - start
+            with self._lock:
+                timings = self._timings.setdefault(package, {})
+                timings[phase] = timings.get(phase, 0) + duration
+
+    def _is_unchanged(self, state_key, package, repo, repo_url, ref, refs,
+                      ref_path):
+        """
+        Check, without touching the network, whether a spec is still
+        staged as recorded in the state: the requested refs resolve to
+        the recorded commit and the working tree is clean. Tags and
+        commits are trusted locally, branches need a fresh entry in
+        the remote index.
+        """
+        if self.state_file is None:
+            return False
+        recorded = self.state.get(state_key)
+        if recorded is None or ref is None or recorded["ref"] != ref or \
+                recorded["refs"] != list(refs or []):
+            return False
+        if not repo.head.is_valid():
+            return False
+        resolver = RefResolver(repo, backend=self.backend)
+        resolution = resolver.resolve(list(refs or []) + [ref])
+        if resolution is None or resolution.sha != recorded["commit"]:
+            return False
+        found = resolver.lookup(resolution.ref)
+        if found is not None and not found[0].startswith("refs/tags/"):
+            # A branch, which may have moved at origin
+            refs_at_origin = None
+            if self.remote_index is not None:
+                refs_at_origin = self.remote_index.cached(package, repo_url)
+            if refs_at_origin is None:
+                return False
+            branch = resolve_remote(refs_at_origin, [resolution.candidate])
+            if branch is None or branch.sha != recorded["commit"]:
+                return False
+        if ref_path is None and repo.head.commit.hexsha != recorded["commit"]:
+            return False
+        # Paths overlaid at other refs are checked on their own
+        if ref_path:
+            pathspecs = [ref_path]
+        else:
+            pathspecs = ["."] + [":(exclude)" + key[len(package) + 1:]
+                                 for key in self.state
+                                 if key.startswith(package + "/")]
+        try:
+            repo.git.diff("--quiet", recorded["commit"], "--", *pathspecs)
+        except GitCommandError:
+            return False
+        return True
+
+    @property
+    def git_version(self):
+        return _git_version()
+
+    def repo_url(self, package):
+        return os.path.join(self.remote_base, package) + ".git"
+
+    def get_or_init_repo(self, repo_path, package=None):
         git_dir = os.path.join(repo_path, ".git")
 
         if os.path.exists(git_dir):
@@ -122,10 +473,54 @@ class Workspace:
             # Not clear it this does anything, but can't hurt.
             with git_repo.config_writer() as config:
                 config.set_value("core", "sparsecheckout", "true")
+        if self.cache is not None and package is not None:
+            self.cache.link(git_repo, package)
         return git_repo
 
+    def set_sparse_paths(self, package, repo, paths, force=False):
+        """
+        Write a cone-mode sparse checkout pattern so only top-level
+        files and the given directories are in the working tree.
+        :param package: Name of the package
+        :param repo: Repo of the package
+        :param paths: Directories to check out. If empty, the whole
+        tree is checked out.
+        :param force: Throw away local changes when updating an
+        existing working tree.
+        """
+        patterns = "\n".join(_cone_patterns(paths)) + "\n"
+        sparse_file = os.path.join(repo.git_dir, "info", "sparse-checkout")
+        if os.path.exists(sparse_file):
+            with open(sparse_file) as f:
+                if f.read() == patterns:
+                    return
+        elif not paths:
+            # Nothing has ever been excluded
+            return
+        if not os.path.isdir(os.path.dirname(sparse_file)):
+            os.makedirs(os.path.dirname(sparse_file))
+        with repo.config_writer() as config:
+            config.set_value("core", "sparsecheckout", "true")
+            config.set_value("core", "sparsecheckoutcone", "true")
+        with open(sparse_file, "w") as f:
+            f.write(patterns)
+        logger.debug("Sparse paths for {}: {}".format(
+            package, ", ".join(paths) or "(all)"))
+        if repo.head.is_valid():
+            try:
+                if force:
+                    repo.git.read_tree("--reset", "-u", "HEAD")
+                else:
+                    repo.git.read_tree("-mu", "HEAD")
+            except GitCommandError as e:
+                raise WorkspaceError("Unable to update sparse checkout of %s, "
+                                     "You may need to force checkout. \n"
+                                     "Command Output: " % package,
+                                     e.stderr)
+
     def checkout_packages(self, package_specs, refs=None, force=False,
-                          clobber=False):
+                          clobber=False, jobs=1, sparse=True,
+                          checkout_jobs=None):
         """
         Checkout a bunch of packages
         :param package_specs: list of (name, ref) pairs
@@ -134,49 +529,549 @@ class Workspace:
         :param force: Force git checkout. This throws away local
         changes in the packages.
         :param clobber: Clobber the name directories
+        :param jobs: Number of repositories to fetch concurrently.
+        Specs sharing a repository are always staged in order by a
+        single worker.
+        :param sparse: If True, packages with ref_path specs only have
+        those paths (and top-level files) in their working tree.
+        :param checkout_jobs: Number of fetched repositories to check
+        out concurrently. Defaults to jobs.
         """
-        for spec in package_specs:
-            self.checkout(spec.name, spec.ref, spec.ref_path,
-                          refs=refs, force=force, clobber=clobber)
+        groups = group_specs(package_specs)
+        self._run_groups(
+            groups, lambda specs: self._fetch_group(specs, refs, clobber),
+            lambda specs, fetched: self._checkout_group(
+                specs, fetched, refs, force, sparse),
+            jobs, checkout_jobs)
 
-    def _fetch(self, package, repo, repo_url):
-        remote = repo.remotes["origin"]
-        git_major, git_minor = self.git_version
-        retry = 0
-        # Not sure if this needs to be optimized
-        while True:
+    def checkout_lock(self, bom, force=False, jobs=1, sparse=True,
+                      checkout_jobs=None):
+        """
+        Stage the exact commits recorded in a bill of materials, such
+        as one written by ``checkout --bom`` or ``resolve``. Commits
+        are fetched directly and checked out by SHA, so no refs are
+        resolved.
+        :param bom: Dictionary of package, or package/path, to a dict
+        with a ``commit`` and optionally ``tag`` or ``branch``
+        :param force: Force git checkout. This throws away local
+        changes in the packages.
+        :param jobs: Number of repositories to fetch concurrently
+        :param sparse: If True, packages with path entries only have
+        those paths (and top-level files) in their working tree.
+        :param checkout_jobs: Number of fetched repositories to check
+        out concurrently. Defaults to jobs.
+        """
+        groups = OrderedDict()
+        for key, entry in bom.items():
+            package, _, ref_path = key.partition("/")
+            if "commit" not in entry:
+                raise WorkspaceError("No commit recorded for " + key)
+            groups.setdefault(package, []).append(
+                (package, ref_path or None, entry))
+        self._run_groups(
+            groups, self._fetch_locked,
+            lambda entries, repo: self._checkout_locked(entries, repo, force,
+                                                        sparse),
+            jobs, checkout_jobs)
+
+    def status(self, package_specs, jobs=8):
+        """
+        Summarize the staged state of packages, concurrently.
+        :param package_specs: List of :py:class:PackageSpec. Packages
+        are compared with the ref of their base spec, and paths with
+        the ref of their own spec.
+        :param jobs: Number of packages to query concurrently
+        :returns: List of :py:class:repoman.package.PackageStatus, in
+        manifest order
+        """
+        groups = list(group_specs(package_specs).values())
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(self._package_status, groups))
+
+    def _package_status(self, specs):
+        bases = [spec for spec in specs if spec.ref_path is None]
+        spec = (bases or specs)[0]
+        paths = OrderedDict((spec.ref_path, spec.ref) for spec in specs
+                            if spec.ref_path)
+        repo_path = os.path.join(self.working_path, spec.name)
+        if not os.path.isdir(os.path.join(repo_path, ".git")):
+            return PackageStatus(spec.name, spec.ref, False, None, None, None,
+                                 False, 0, None, None, False)
+        return Package(spec.name, self, repo_path).status(spec.ref, paths)
+
+    def _run_groups(self, groups, fetch, checkout, jobs, checkout_jobs=None):
+        """
+        Stage every group in two pipelined stages. Up to jobs threads
+        call fetch(items), and up to checkout_jobs threads call
+        checkout(items, fetched) as soon as a group is fetched, so
+        network and disk work overlap. A bounded queue between the
+        stages keeps fetches from running far ahead of checkouts. With
+        a history, groups are fetched most expensive first. The first
+        error in group order is raised.
+        """
+        checkout_jobs = checkout_jobs or jobs
+        if max(jobs, checkout_jobs) <= 1 or len(groups) <= 1:
+            for package, items in groups.items():
+                with self.tracer.span(PACKAGE_SPAN, package):
+                    checkout(items, fetch(items))
+            return
+
+        order = list(groups)
+        if self.history is not None:
+            # Longest first, so no large package starts last
+            sizes = dict((package, pack_size(os.path.join(
+                self.working_path, package, ".git"))) for package in order
+                if self.history.estimate(package) is None)
+            order = self.history.order(order, sizes)
+        bom_keys = list(self.bom)
+        errors = {}
+        failed = threading.Event()
+        fetched = queue.Queue(maxsize=checkout_jobs * PIPELINE_DEPTH)
+
+        def fetch_group(package, items):
+            # Don't start anything new, let running work finish
+            if failed.is_set():
+                return
             try:
-                remote.fetch(tags=True)
-                if git_major == 1 and git_minor < 9:
-                    logger.debug("You are using an older version of git.")
-                    remote.fetch()  # This is required for RHEL6/git1.8 support
-                self.fetched.append(package)
-                break
+                with self.tracer.span(PACKAGE_SPAN, package):
+                    result = fetch(items)
+            except Exception as e:
+                errors[package] = e
+                failed.set()
+                return
+            fetched.put((package, items, result, default_timer()))
+
+        def checkout_groups():
+            while True:
+                work = fetched.get()
+                if work is None:
+                    return
+                package, items, result, queued = work
+                self.tracer.record("queued", package, queued,
+                                   default_timer() - queued)
+                # Fetched groups are still checked out after an error
+                try:
+                    with self.tracer.span(PACKAGE_SPAN, package):
+                        checkout(items, result)
+                except Exception as e:
+                    errors[package] = e
+                    failed.set()
+
+        workers = [threading.Thread(target=checkout_groups)
+                   for _ in range(checkout_jobs)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for package in order:
+                    executor.submit(fetch_group, package, groups[package])
+        finally:
+            for _ in workers:
+                fetched.put(None)
+            for worker in workers:
+                worker.join()
+        self._order_bom(bom_keys, groups)
+        for package in groups:
+            if package in errors:
+                raise errors[package]
+
+    def _fetch_locked(self, entries):
+        package = entries[0][0]
+        repo = self.get_or_init_repo(
+            os.path.join(self.working_path, package), package)
+        repo_url = self.repo_url(package)
+        if not repo.remotes:
+            repo.create_remote("origin", repo_url)
+        commits = OrderedDict.fromkeys(entry["commit"] for _, _, entry
+                                       in entries)
+        missing = [commit for commit in commits
+                   if not self.backend.has_commit(repo, commit)]
+        if missing:
+            self._with_retries(package, repo, repo_url, self._fetch_commits,
+                               package, repo, repo_url, missing)
+        return repo
+
+    def _checkout_locked(self, entries, repo, force, sparse):
+        # Check out the base before overlaying paths
+        entries = sorted(entries, key=lambda item: item[1] is not None)
+        package = entries[0][0]
+        if sparse:
+            with self.tracer.span("sparse", package), \
+                    self._timed(package, "checkout"):
+                self.set_sparse_paths(
+                    package, repo, [path for _, path, _ in entries if path],
+                    force=force)
+
+        for _, ref_path, entry in entries:
+            key = _state_key(package, ref_path)
+            commit = entry["commit"]
+            logging.info("Checkout out locked spec: {} {}".format(key, commit))
+            checkout_args = ["-f"] if force else []
+            checkout_args.append(commit)
+            if ref_path:
+                checkout_args.append(ref_path)
+            try:
+                with self.tracer.span("checkout", package), \
+                        self._timed(package, "checkout"):
+                    repo.git.checkout(*checkout_args)
+                if force and not ref_path:
+                    with self.tracer.span("reset", package), \
+                            self._timed(package, "checkout"):
+                        repo.git.reset("--hard", commit)
             except GitCommandError as e:
-                if retry < len(SLEEP_INTERVALS):
-                    logger.debug("Error checkout out {}, retrying in {}s"
-                                 .format(package, SLEEP_INTERVALS[retry]))
-                    time.sleep(SLEEP_INTERVALS[retry])
-                    retry += 1
-                    continue
-                raise WorkspaceError("Unable to fetch tags for %s. Please verify "
-                                     "name exists and you are accessing it "
-                                     "properly. You may also need to wait a few "
-                                     "minutes" % package,
-                                     "Repo: " + repo_url,
+                raise WorkspaceError("Unable to checkout name: %s, "
+                                     "You may need to force checkout. \n"
+                                     "Command Output: " % key,
                                      e.stderr)
+            with self._lock:
+                self.bom[key] = entry
+                self.state[key] = dict(ref=commit, refs=[], commit=commit,
+                                       bom=entry)
+
+    def _is_current(self, package, repo, repo_url, candidates):
+        """
+        Check the remote index for whether the repo already has the
+        commit candidates resolve to at origin, without touching the
+        network. A matching remote branch is brought up to date, as a
+        fetch would.
+        """
+        if self.remote_index is None or not repo.head.is_valid():
+            return False
+        refs = self.remote_index.cached(package, repo_url)
+        if refs is None:
+            return False
+        resolution = resolve_remote(refs, candidates)
+        if resolution is None or not self.backend.has_commit(
+                repo, resolution.sha):
+            return False
+        if resolution.ref.startswith("refs/heads/"):
+            repo.git.update_ref(
+                "refs/remotes/origin/" + resolution.ref[len("refs/heads/"):],
+                resolution.sha)
+        logger.debug("{} already has {} at {}, skipping fetch".format(
+            package, resolution.candidate, resolution.sha))
+        return True
+
+    def _ensure_fetched(self, package, repo, repo_url, ref, refs,
+                        fetch_strategy):
+        # Check if package has already been fetched.
+        # This happens if we are checking out a path at a different ref
+        # Targeted fetches only bring in the refs they were asked for.
+        if not self.is_fetched(package) and self._is_current(
+                package, repo, repo_url, list(refs or []) +
+                [ref or repo.head.ref.name]):
+            with self._lock:
+                self.fetched.append(package)
+        if not self.is_fetched(package) or (
+                fetch_strategy in FETCH_REF_STRATEGIES and ref and
+                not self.backend.has_commit(repo, ref)):
+            self._fetch(package, repo, repo_url, ref, refs, fetch_strategy)
+
+    def is_fetched(self, package):
+        with self._lock:
+            return package in self.fetched
+
+    def _fetch_group(self, specs, refs, clobber):
+        """
+        Fetch what the specs of one repository need.
+        :returns: Tuple of a list of (repo, unchanged) for each spec,
+        and the list of paths overlaid before which aren't listed now
+        """
+        # Overlays dropped from the manifest must be undone, which
+        # means staging the base again
+        dropped = self._trim_state(specs[0].name,
+                                   [spec.ref_path for spec in specs])
+        fetched = []
+        for i, spec in enumerate(specs):
+            fetch_strategy = spec.fetch or self.fetch_strategy
+            check_fetch_strategy(fetch_strategy)
+            # Only clobber before the first spec of a repository
+            fetched.append(self._fetch_spec(
+                spec.name, spec.ref, spec.ref_path, refs,
+                clobber and i == 0, False, fetch_strategy, not dropped))
+        if not all(unchanged for _, unchanged in fetched):
+            # Checking out the base overwrites the paths, even those
+            # listed before it, so every overlay is applied again
+            for i, spec in enumerate(specs):
+                if spec.ref_path and fetched[i][1]:
+                    fetched[i] = self._fetch_spec(
+                        spec.name, spec.ref, spec.ref_path, refs, False,
+                        False, spec.fetch or self.fetch_strategy, False)
+        return fetched, [path for path in dropped if path]
+
+    def _trim_state(self, package, ref_paths):
+        """
+        Forget the staged specs of a package which aren't listed any
+        more.
+        :param ref_paths: Paths of the listed specs, None for the base
+        :returns: List of the ref paths forgotten, None for the base
+        """
+        keys = set(_state_key(package, ref_path) for ref_path in ref_paths)
+        dropped = []
+        with self._lock:
+            for key in list(self.state):
+                if key in keys or (key != package and
+                                   not key.startswith(package + "/")):
+                    continue
+                del self.state[key]
+                self.bom.pop(key, None)
+                dropped.append(key.partition("/")[2] or None)
+        return dropped
+
+    def _checkout_group(self, specs, result, refs, force, sparse):
+        fetched, dropped_paths = result
+        sparse_paths = None
+        if sparse:
+            sparse_paths = [spec.ref_path for spec in specs if spec.ref_path]
+        # Specs of a group share a repository
+        repo = fetched[0][0]
+        self._checkout_specs(
+            specs[0].name, repo,
+            [(spec.ref, spec.ref_path, unchanged)
+             for spec, (_, unchanged) in zip(specs, fetched)],
+            refs, force, sparse_paths, dropped_paths)
+
+    def _order_bom(self, bom_keys, packages):
+        """
+        Restore the order the bom would have had if packages had
+        been checked out serially.
+        """
+        rank = dict((package, i) for i, package in enumerate(packages))
+        new_keys = [key for key in self.bom if key not in bom_keys]
+        # Stable, so paths of a package keep their order
+        new_keys.sort(key=lambda key: rank.get(key.partition("/")[0],
+                                               len(rank)))
+        order = [key for key in bom_keys if key in self.bom] + new_keys
+        self.bom = OrderedDict((key, self.bom[key]) for key in order)
+
+    def _fetch(self, package, repo, repo_url, ref=None, refs=None,
+               fetch_strategy=None):
+        fetch_strategy = fetch_strategy or self.fetch_strategy
+        if self.cache is not None:
+            # Mirrors are complete, so strategies don't apply
+            fetch = self._fetch_mirror
+            args = (package, repo, repo_url, ref)
+        elif fetch_strategy in FETCH_REF_STRATEGIES:
+            depth = 1 if fetch_strategy == FETCH_SHALLOW else None
+            fetch = self._fetch_refs
+            args = (package, repo, ref or repo.head.ref.name, refs, depth)
+        elif fetch_strategy == FETCH_BLOBLESS:
+            fetch = self._fetch_blobless
+            args = (package, repo)
+        else:
+            fetch = self._fetch_full
+            args = (repo,)
+        self._with_retries(package, repo, repo_url, fetch, *args)
+        with self._lock:
+            self.fetched.append(package)
+
+    def _with_retries(self, package, repo, repo_url, fetch, *args):
+        def attempt(timeout):
+            try:
+                with self._timed(package, "fetch"):
+                    return fetch(*args, timeout=timeout)
+            finally:
+                # Even a failed fetch may have brought in objects and refs
+                self.backend.invalidate(repo)
+        try:
+            return self.fetch_scheduler.run(package, repo_url, attempt,
+                                            retry_on=GitCommandError,
+                                            tracer=self.tracer)
+        except GitCommandError as e:
+            raise WorkspaceError("Unable to fetch tags for %s. Please verify "
+                                 "name exists and you are accessing it "
+                                 "properly. You may also need to wait a few "
+                                 "minutes" % package,
+                                 "Repo: " + repo_url,
+                                 e.stderr)
+
+    def _fetch_full(self, repo, timeout=None):
+        deadline = deadline_after(timeout)
+        remote = repo.remotes["origin"]
+        git_major, git_minor = self.git_version
+        kwargs = {}
+        if os.path.exists(os.path.join(repo.git_dir, "shallow")):
+            logger.debug("Converting shallow repo to a full repo")
+            kwargs["unshallow"] = True
+        remote.fetch(tags=True, kill_after_timeout=timeout, **kwargs)
+        if git_major == 1 and git_minor < 9:
+            logger.debug("You are using an older version of git.")
+            # This is required for RHEL6/git1.8 support
+            remote.fetch(kill_after_timeout=time_left(deadline))
+
+    def _fetch_refs(self, package, repo, ref, refs=None, depth=None,
+                    timeout=None):
+        """
+        Fetch only the requested ref and the candidates in refs.
+        Candidates missing at origin are skipped, since the priority
+        list usually names branches only some packages have. If ref
+        itself can't be resolved to a branch, tag or complete SHA, this
+        falls back to a full fetch.
+        :param ref: The ref the package is pinned to
+        :param refs: Prioritized list of optional refs
+        :param depth: If set, only fetch this many commits of history
+        :param timeout: Seconds after which the fetch is killed
+        """
+        deadline = deadline_after(timeout)
+        refspecs, unresolved = _remote_refspecs(
+            repo, [ref] + list(refs or []), timeout)
+        # Servers only accept complete SHAs
+        refspecs += [name for name in unresolved if _is_full_sha(name)]
+        if ref in unresolved and not _is_full_sha(ref):
+            logger.info("Unable to resolve {} at origin for {}, fetching "
+                        "everything".format(ref, package))
+            return self._fetch_full(repo, time_left(deadline))
+        args = ["--no-tags"]
+        if depth:
+            args += ["--depth", str(depth)]
+        repo.git.fetch(*(args + ["origin"] + refspecs),
+                       kill_after_timeout=time_left(deadline))
+
+    def _fetch_blobless(self, package, repo, timeout=None):
+        """
+        Fetch all commits and trees, deferring blobs until checkout.
+        Requires git 2.19 or later on both ends.
+        """
+        if self.git_version < (2, 19):
+            logger.info("git {}.{} doesn't support partial clones, fetching "
+                        "{} in full".format(self.git_version[0],
+                                            self.git_version[1], package))
+            return self._fetch_full(repo, timeout)
+        with repo.config_writer() as config:
+            config.set_value("core", "repositoryformatversion", "1")
+            config.set_value("extensions", "partialclone", "origin")
+            config.set_value('remote "origin"', "promisor", "true")
+            config.set_value('remote "origin"', "partialclonefilter",
+                             "blob:none")
+        repo.git.fetch("--filter=blob:none", "--tags", "origin",
+                       kill_after_timeout=timeout)
+
+    def _fetch_commits(self, package, repo, repo_url, commits, timeout=None):
+        """
+        Fetch specific commits. Servers which refuse to serve commits
+        by SHA are fetched from in full.
+        """
+        deadline = deadline_after(timeout)
+        if self.cache is not None:
+            for commit in commits:
+                mirror_path = self.cache.ensure(package, repo_url, commit,
+                                                time_left(deadline))
+            self.cache.link(repo, package)
+            repo.git.fetch(mirror_path, *MIRROR_FETCH_REFSPECS,
+                           kill_after_timeout=time_left(deadline))
+            return
+        args = ["--no-tags"]
+        if self.fetch_strategy == FETCH_SHALLOW:
+            args += ["--depth", "1"]
+        try:
+            repo.git.fetch(*(args + ["origin"] + list(commits)),
+                           kill_after_timeout=timeout)
+        except GitCommandError as e:
+            logger.info("Unable to fetch commits of {} directly, fetching "
+                        "everything: {}".format(package, e.stderr.strip()))
+            self._fetch_full(repo, time_left(deadline))
+
+    def _fetch_mirror(self, package, repo, repo_url, ref=None, timeout=None):
+        """
+        Fetch refs from the package mirror, refreshing the mirror
+        first if needed. Objects are shared through alternates, so
+        this only does local I/O once the mirror is current.
+        """
+        deadline = deadline_after(timeout)
+        mirror_path = self.cache.ensure(package, repo_url, ref, timeout)
+        self.cache.link(repo, package)
+        repo.git.fetch(mirror_path, *MIRROR_FETCH_REFSPECS,
+                       kill_after_timeout=time_left(deadline))
+
+
+def group_specs(package_specs):
+    """
+    Group specs by the repository they are staged from, preserving
+    manifest order within and across groups.
+    :param package_specs: List of :py:class:PackageSpec
+    :returns: OrderedDict of package name to list of specs
+    """
+    groups = OrderedDict()
+    for spec in package_specs:
+        groups.setdefault(spec.name, []).append(spec)
+    return groups
+
+
+def _cone_patterns(paths):
+    """
+    Build cone-mode sparse checkout patterns for directories. Parents
+    of each directory are included without their other subdirectories.
+    These are also valid non-cone patterns for older versions of git.
+    """
+    if not paths:
+        return ["/*"]
+    paths = sorted(set(path.strip("/") for path in paths))
+    # Directories inside another listed directory are already included
+    paths = [path for path in paths
+             if not any(path.startswith(other + "/") for other in paths)]
+    parents = set()
+    for path in paths:
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            parents.add("/".join(parts[:i]))
+    patterns = ["/*", "!/*/"]
+    for parent in sorted(parents):
+        patterns += ["/{}/".format(parent), "!/{}/*/".format(parent)]
+    patterns += ["/{}/".format(path) for path in paths]
+    return patterns
+
+
+def _remote_refspecs(repo, names, timeout=None):
+    """
+    Map ref names to refspecs for the branches and tags at origin
+    with one ``ls-remote`` call.
+    :param timeout: Seconds after which ``ls-remote`` is killed
+    :returns: Tuple of (refspecs, names not found at origin)
+    """
+    names = list(OrderedDict.fromkeys(names))
+    remote_refs = set()
+    for line in repo.git.ls_remote("origin", *names,
+                                   kill_after_timeout=timeout).splitlines():
+        remote_refs.add(line.split("\t")[1])
+    refspecs = []
+    unresolved = []
+    for name in names:
+        if "refs/tags/" + name in remote_refs:
+            refspecs.append("+refs/tags/{0}:refs/tags/{0}".format(name))
+        elif "refs/heads/" + name in remote_refs:
+            refspecs.append(
+                "+refs/heads/{0}:refs/remotes/origin/{0}".format(name))
+        else:
+            unresolved.append(name)
+    return refspecs, unresolved
+
+
+def _is_full_sha(ref):
+    return len(ref) == 40 and all(c in "0123456789abcdef" for c in ref)
 
 
 def _git_version():
-    git_version_str = git.cmd.Git().version().split()[2]
-    git_version_spec = git_version_str.split(".")
-    git_major, git_minor = git_version_spec[0:2]
-    return int(git_major), int(git_minor)
+    """
+    Version of git as a (major, minor) tuple, detected once.
+    """
+    global _GIT_VERSION
+    if _GIT_VERSION is None:
+        git_version_str = git.cmd.Git().version().split()[2]
+        git_version_spec = git_version_str.split(".")
+        git_major, git_minor = git_version_spec[0:2]
+        _GIT_VERSION = int(git_major), int(git_minor)
+    return _GIT_VERSION
 
 
-def _has_commit(repo, ref):
-    try:
-        repo.git.show("--oneline", ref)
-        return True
-    except GitCommandError as e:
-        return False
+def _state_key(package, ref_path):
+    if ref_path:
+        return "/".join([package, ref_path])
+    return package
+
+
+def _load_state(state_file):
+    if state_file is None or not os.path.exists(state_file):
+        return OrderedDict()
+    with open(state_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
@@ -45,7 +45,8 @@ setup(
     },
     install_requires=[
         'gitpython',
-        'click'
+        'click',
+        'futures; python_version < "3"'
     ],
     classifiers=[
         'Intended Audience :: Science/Research',
@@ -0,0 +1,80 @@
+"""
+Helpers for building throwaway local remotes, so workspace tests can
+run without network access.
+"""
+import os
+import subprocess
+from repoman.backend import BACKEND_ENV, CAT_FILE
+
+GIT_ENV = dict(
+    GIT_AUTHOR_NAME="repoman", GIT_AUTHOR_EMAIL="repoman@localhost",
+    GIT_COMMITTER_NAME="repoman", GIT_COMMITTER_EMAIL="repoman@localhost"
+)
+
+
+def git(cwd, *args):
+    env = dict(os.environ)
+    env.update(GIT_ENV)
+    return subprocess.check_output(("git",) + args, cwd=cwd, env=env,
+                                   stderr=subprocess.STDOUT).decode("utf-8")
+
+
+def make_remote(remote_base, name, tags=(), paths=("src",), files=None):
+    """
+    Create a bare repository ``name.git`` under ``remote_base``.
+    One commit is made for each tag, touching a file in each path,
+    and the tag is created on that commit.
+    :param remote_base: Directory holding the bare repositories
+    :param name: Name of the package
+    :param tags: Tags to create, oldest first
+    :param paths: Subdirectories to populate in every commit
+    :param files: Optional dictionary of top-level file name to
+    content, written in every commit
+    :returns: Path to the bare repository
+    """
+    work_path = os.path.join(remote_base, "_work", name)
+    bare_path = os.path.join(remote_base, name + ".git")
+    os.makedirs(work_path)
+    git(work_path, "init", "-q")
+    git(work_path, "checkout", "-q", "-b", "master")
+    for i, tag in enumerate(list(tags) or [None]):
+        _write(work_path, "README", "{} {}\n".format(name, i))
+        for path in paths:
+            _write(os.path.join(work_path, path), "version.txt",
+                   "{} {}\n".format(path, i))
+        for file_name, content in (files or {}).items():
+            _write(work_path, file_name, content)
+        git(work_path, "add", "-A")
+        git(work_path, "commit", "-q", "-m", "commit {}".format(i))
+        if tag:
+            git(work_path, "tag", "-a", tag, "-m", tag)
+    git(remote_base, "clone", "-q", "--bare", work_path, bare_path)
+    return bare_path
+
+
+def _write(directory, name, content):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, name), "w") as f:
+        f.write(content)
+
+
+class CatFileBackendMixin(object):
+    """
+    Runs the tests of a TestCase again with the cat-file git backend,
+    which workspaces and packages created without a backend pick up
+    from the environment.
+    """
+
+    def setUp(self):
+        previous = os.environ.get(BACKEND_ENV)
+        os.environ[BACKEND_ENV] = CAT_FILE
+        self.addCleanup(restore_env, BACKEND_ENV, previous)
+        super(CatFileBackendMixin, self).setUp()
+
+
+def restore_env(name, value):
+    if value is None:
+        os.environ.pop(name, None)
+    else:
+        os.environ[name] = value
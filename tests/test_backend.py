@@ -0,0 +1,151 @@
+import unittest
+from unittest import TestCase
+from repoman.backend import GitBackend, CatFileBackend, get_backend, \
+    BACKEND_ENV
+from repoman.error import RepomanError
+from repoman.package import Package, PackageSpec
+from repoman.workspace import Workspace
+from remotes import make_remote, git
+from git import Repo
+import tempfile
+import shutil
+import os
+
+
+class BackendTests(object):
+    """
+    Behavior every backend shares, run against each implementation.
+    """
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        bare_path = make_remote(self.remote_base, "astro",
+                                ["astro-04-00-01", "astro-04-00-02"],
+                                files={"packageList.txt":
+                                       "xmlBase xmlBase-05-07-00\n"})
+        self.repo_path = os.path.join(self.remote_base, "clone")
+        git(self.remote_base, "clone", "-q", bare_path, self.repo_path)
+        self.repo = Repo(self.repo_path)
+        self.backend = self.make_backend()
+        self.addCleanup(self.backend.close)
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+
+    def rev(self, ref):
+        return git(self.repo_path, "rev-parse", ref + "^{commit}").strip()
+
+    def test_read_file(self):
+        self.assertEqual(
+            self.backend.read_file(self.repo, "astro-04-00-01", "README"),
+            "astro 0")
+        self.assertEqual(
+            self.backend.read_file(self.repo, "master", "README"), "astro 1")
+        self.assertIsNone(
+            self.backend.read_file(self.repo, "master", "missing"))
+        self.assertIsNone(
+            self.backend.read_file(self.repo, "missing", "README"))
+        # A directory isn't a file
+        self.assertIsNone(self.backend.read_file(self.repo, "master", "src"))
+
+    def test_has_object(self):
+        self.assertTrue(self.backend.has_object(
+            self.repo, "astro-04-00-01:packageList.txt"))
+        self.assertFalse(self.backend.has_object(
+            self.repo, "astro-04-00-01:missing.txt"))
+        self.assertTrue(self.backend.has_commit(self.repo, "astro-04-00-01"))
+        self.assertTrue(self.backend.has_commit(
+            self.repo, self.rev("master")))
+        self.assertFalse(self.backend.has_commit(self.repo, "0" * 40))
+        self.assertFalse(self.backend.has_commit(self.repo, "master:src"))
+
+    def test_commits(self):
+        sha = self.rev("astro-04-00-01")
+        commits = self.backend.commits(
+            self.repo, ["astro-04-00-01", sha[:7], "missing", "origin/master"])
+        self.assertEqual(commits, {"astro-04-00-01": sha, sha[:7]: sha,
+                                   "origin/master": self.rev("master")})
+        self.assertEqual(self.backend.commits(self.repo, []), {})
+
+    def test_tags(self):
+        git(self.repo_path, "tag", "astroData-01-00-00")
+        self.assertEqual(self.backend.tags(self.repo, "astro-*"),
+                         ["astro-04-00-01", "astro-04-00-02"])
+        self.assertEqual(len(self.backend.tags(self.repo)), 3)
+        self.assertTrue(self.backend.has_tag(self.repo, "astro-04-00-01"))
+        self.assertFalse(self.backend.has_tag(self.repo, "master"))
+
+    def test_invalidate(self):
+        self.assertFalse(self.backend.has_commit(self.repo, "astro-04-00-03"))
+        with open(os.path.join(self.repo_path, "README"), "w") as f:
+            f.write("astro 2\n")
+        git(self.repo_path, "commit", "-q", "-a", "-m", "astro 2")
+        git(self.repo_path, "tag", "astro-04-00-03")
+        self.backend.invalidate(self.repo)
+        self.assertEqual(self.backend.commits(self.repo, ["astro-04-00-03"]),
+                         {"astro-04-00-03": self.rev("astro-04-00-03")})
+        self.assertEqual(
+            self.backend.read_file(self.repo, "astro-04-00-03", "README"),
+            "astro 2")
+
+    def test_package(self):
+        package = Package("astro", None, self.repo_path, self.repo,
+                          backend=self.backend)
+        self.assertTrue(package.has_dependencies("astro-04-00-01"))
+        self.assertEqual(package.read_manifest("astro-04-00-01"),
+                         [PackageSpec("xmlBase", "xmlBase-05-07-00")])
+        with self.assertRaises(RepomanError):
+            package.read_manifest("missing")
+
+
+class TestGitBackend(BackendTests, TestCase):
+
+    def make_backend(self):
+        return GitBackend()
+
+
+class TestCatFileBackend(BackendTests, TestCase):
+
+    def make_backend(self):
+        return CatFileBackend()
+
+    def test_stage(self):
+        make_remote(self.remote_base, "xmlBase",
+                    ["xmlBase-05-07-00", "xmlBase-05-07-01"])
+        working_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, working_path)
+        workspace = Workspace(working_path, self.remote_base,
+                              backend=self.backend)
+        workspace.checkout_packages([
+            PackageSpec("astro", "astro-04-00-01"),
+            PackageSpec("xmlBase", "xmlBase-05-07-00")])
+        for package, tag in [("astro", "astro-04-00-01"),
+                             ("xmlBase", "xmlBase-05-07-00")]:
+            self.assertEqual(workspace.bom[package]["tag"], tag)
+            path = os.path.join(working_path, package)
+            self.assertEqual(workspace.bom[package]["commit"],
+                             git(path, "rev-parse", "HEAD").strip())
+
+
+class TestGetBackend(TestCase):
+
+    def test_get_backend(self):
+        environ = os.environ.pop(BACKEND_ENV, None)
+        try:
+            self.assertIsInstance(get_backend(), GitBackend)
+            self.assertIsInstance(get_backend("cat-file"), CatFileBackend)
+            os.environ[BACKEND_ENV] = "cat-file"
+            self.assertIsInstance(get_backend(), CatFileBackend)
+            with self.assertRaises(RepomanError):
+                get_backend("libgit")
+        finally:
+            os.environ.pop(BACKEND_ENV, None)
+            if environ is not None:
+                os.environ[BACKEND_ENV] = environ
+
+
+if __name__ == '__main__':
+    unittest.main()
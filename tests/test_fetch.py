@@ -0,0 +1,111 @@
+import unittest
+from unittest import TestCase
+from repoman.error import WorkspaceError
+from repoman.fetch import FetchScheduler
+from repoman.timing import Tracer
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class FetchFailed(Exception):
+    pass
+
+
+class Remote:
+    """
+    Fails the first ``failures`` fetches, counting how many run at once.
+    """
+
+    def __init__(self, failures=0, duration=0):
+        self.failures = failures
+        self.duration = duration
+        self.calls = 0
+        self.running = 0
+        self.most_running = 0
+        self.timeouts = []
+        self._lock = threading.Lock()
+
+    def fetch(self, timeout):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            self.timeouts.append(timeout)
+            fail = self.calls <= self.failures
+        time.sleep(self.duration)
+        with self._lock:
+            self.running -= 1
+        if fail:
+            raise FetchFailed()
+        return "fetched"
+
+
+class TestFetchScheduler(TestCase):
+
+    def test_retries(self):
+        remote = Remote(failures=2)
+        tracer = Tracer()
+        scheduler = FetchScheduler(attempts=3, backoff=0.02)
+        self.assertEqual(scheduler.run("astro", "/remotes/astro.git",
+                                       remote.fetch, tracer=tracer),
+                         "fetched")
+        self.assertEqual(remote.calls, 3)
+        sleeps = [span.duration for span in tracer.spans
+                  if span.name == "retry-sleep"]
+        self.assertEqual(len(sleeps), 2)
+        # Jittered, but never less than half the backoff
+        self.assertGreaterEqual(sleeps[0], 0.01)
+        self.assertGreaterEqual(sleeps[1], 0.02)
+
+    def test_attempts(self):
+        remote = Remote(failures=5)
+        scheduler = FetchScheduler(attempts=2, backoff=0.01)
+        with self.assertRaises(FetchFailed):
+            scheduler.run("astro", "/remotes/astro.git", remote.fetch)
+        self.assertEqual(remote.calls, 2)
+
+    def test_deadline(self):
+        remote = Remote(failures=5, duration=0.05)
+        scheduler = FetchScheduler(attempts=10, deadline=0.2, backoff=0.05)
+        with self.assertRaises(FetchFailed):
+            scheduler.run("astro", "/remotes/astro.git", remote.fetch)
+        self.assertLess(remote.calls, 10)
+        self.assertAlmostEqual(remote.timeouts[0], 0.2, places=2)
+        # Later attempts only get what is left
+        self.assertLess(remote.timeouts[-1], 0.2)
+
+    def test_per_host(self):
+        remote = Remote(duration=0.02)
+        scheduler = FetchScheduler(per_host=2)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(
+                lambda name: scheduler.run(
+                    name, "git@github.com:fermi-lat/" + name, remote.fetch),
+                ["package{}".format(i) for i in range(6)]))
+        self.assertEqual(remote.calls, 6)
+        self.assertEqual(remote.most_running, 2)
+
+    def test_circuit_breaker(self):
+        remote = Remote(failures=3)
+        scheduler = FetchScheduler(attempts=1, breaker_threshold=3,
+                                   breaker_cooldown=0.1)
+        url = "git@github.com:fermi-lat/astro.git"
+        for _ in range(3):
+            with self.assertRaises(FetchFailed):
+                scheduler.run("astro", url, remote.fetch)
+        with self.assertRaises(WorkspaceError):
+            scheduler.run("astro", url, remote.fetch)
+        # Other hosts are still fetched from
+        scheduler.run("astro", "https://example.org/astro.git",
+                      remote.fetch)
+        self.assertEqual(remote.calls, 4)
+        time.sleep(0.1)
+        # The trial fetch succeeds and closes the breaker
+        scheduler.run("astro", url, remote.fetch)
+        scheduler.run("astro", url, remote.fetch)
+        self.assertEqual(remote.calls, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
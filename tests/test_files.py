@@ -0,0 +1,45 @@
+import unittest
+from unittest import TestCase
+from repoman.files import atomic_write
+import tempfile
+import shutil
+import os
+
+
+class TestAtomicWrite(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.path, "state", "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read(self):
+        with open(self.file_path) as f:
+            return f.read()
+
+    def test_write(self):
+        with atomic_write(self.file_path) as f:
+            f.write("first")
+        self.assertEqual(self.read(), "first")
+        os.chmod(self.file_path, 0o640)
+        with atomic_write(self.file_path, copy_mode=True) as f:
+            f.write("second")
+        self.assertEqual(self.read(), "second")
+        self.assertEqual(os.stat(self.file_path).st_mode & 0o777, 0o640)
+
+    def test_failed_write(self):
+        with atomic_write(self.file_path) as f:
+            f.write("first")
+        with self.assertRaises(ValueError):
+            with atomic_write(self.file_path) as f:
+                f.write("partial")
+                raise ValueError("Interrupted")
+        self.assertEqual(self.read(), "first")
+        self.assertEqual(os.listdir(os.path.dirname(self.file_path)),
+                         ["state.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest import TestCase
+from repoman.error import RepomanError
+from repoman.graph import ProductGraph
+from repoman.package import PackageSpec
+from repoman.workspace import Workspace
+from remotes import make_remote
+import tempfile
+import shutil
+
+
+class TestProductGraph(TestCase):
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        self.workspace = Workspace(self.working_path, self.remote_base)
+        make_remote(self.remote_base, "xmlBase",
+                    ["xmlBase-05-07-00", "xmlBase-05-07-01"])
+        make_remote(self.remote_base, "astro", ["astro-04-00-02"])
+        make_remote(self.remote_base, "celestialSources",
+                    ["celestialSources-01-06-00", "Pulsar-03-03-00"],
+                    paths=["src", "Pulsar"])
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def make_product(self, name, manifest):
+        make_remote(self.remote_base, name, [name + "-01-00-00"],
+                    files={"packageList.txt": manifest})
+
+    def test_resolve_nested(self):
+        self.make_product("facilities", "xmlBase xmlBase-05-07-01\n"
+                                        "astro astro-04-00-02\n")
+        specs = [
+            PackageSpec("xmlBase", "xmlBase-05-07-01"),
+            PackageSpec("facilities", "facilities-01-00-00"),
+            PackageSpec("celestialSources", "celestialSources-01-06-00"),
+            PackageSpec("celestialSources", "Pulsar-03-03-00", "Pulsar"),
+        ]
+        graph = ProductGraph(self.workspace, jobs=4)
+        plan = graph.resolve("ScienceTools", specs)
+        self.assertEqual([(spec.name, spec.ref_path) for spec in plan],
+                         [("xmlBase", None), ("astro", None),
+                          ("facilities", None), ("celestialSources", None),
+                          ("celestialSources", "Pulsar")])
+        # Paths aren't products, only the base spec is read
+        self.assertEqual(sorted(graph.manifests),
+                         [("astro", "astro-04-00-02"),
+                          ("celestialSources", "celestialSources-01-06-00"),
+                          ("facilities", "facilities-01-00-00"),
+                          ("xmlBase", "xmlBase-05-07-01")])
+
+        # Staging the plan doesn't fetch anything again
+        self.workspace.checkout_packages(plan, jobs=4)
+        self.assertEqual(sorted(self.workspace.fetched),
+                         ["astro", "celestialSources", "facilities",
+                          "xmlBase"])
+
+    def test_resolve_conflict(self):
+        self.make_product("facilities", "xmlBase xmlBase-05-07-00\n")
+        specs = [
+            PackageSpec("xmlBase", "xmlBase-05-07-01"),
+            PackageSpec("facilities", "facilities-01-00-00"),
+        ]
+        with self.assertRaises(RepomanError) as context:
+            ProductGraph(self.workspace).resolve("ScienceTools", specs)
+        self.assertEqual(str(context.exception.args[0]),
+                         "Conflicting refs for xmlBase: ScienceTools pins "
+                         "xmlBase-05-07-01, facilities pins xmlBase-05-07-00")
+
+    def test_resolve_cycle(self):
+        self.make_product("facilities", "sane sane-01-00-00\n")
+        self.make_product("sane", "facilities facilities-01-00-00\n")
+        specs = [PackageSpec("facilities", "facilities-01-00-00")]
+        with self.assertRaises(RepomanError) as context:
+            ProductGraph(self.workspace).resolve("ScienceTools", specs)
+        self.assertEqual(str(context.exception.args[0]),
+                         "Dependency cycle: facilities -> sane -> facilities")
+
+    def test_resolve_develop(self):
+        self.make_product("facilities", "xmlBase xmlBase-05-07-00\n")
+        specs = [PackageSpec("facilities", "master")]
+        graph = ProductGraph(self.workspace, develop=lambda name: "master")
+        plan = graph.resolve("ScienceTools", specs)
+        self.assertEqual([(spec.name, spec.ref) for spec in plan],
+                         [("xmlBase", "master"), ("facilities", "master")])
+
+
+if __name__ == '__main__':
+    unittest.main()
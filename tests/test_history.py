@@ -0,0 +1,102 @@
+import unittest
+from unittest import TestCase
+from repoman.history import StageHistory
+from repoman.package import PackageSpec
+from repoman.workspace import Workspace
+from remotes import make_remote
+import tempfile
+import shutil
+import os
+
+
+class TestStageHistory(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.history = StageHistory(os.path.join(self.path, "history.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_order(self):
+        packages = ["xmlBase", "astro", "GlastRelease", "tip"]
+        # No history, manifest order
+        self.assertEqual(self.history.order(packages), packages)
+        self.history.record("xmlBase", dict(fetch=1.0, checkout=0.5), 1000)
+        self.history.record("GlastRelease", dict(fetch=20.0, checkout=10.0),
+                            20000)
+        self.history.record("tip", dict(fetch=2.0), 1000)
+        # astro is unknown, estimated at the mean cost
+        self.assertEqual(self.history.order(packages),
+                         ["GlastRelease", "astro", "tip", "xmlBase"])
+        # or from its size
+        self.assertEqual(self.history.order(packages, dict(astro=100)),
+                         ["GlastRelease", "tip", "xmlBase", "astro"])
+
+    def test_moving_average(self):
+        self.history.record("astro", dict(fetch=4.0, checkout=2.0))
+        self.history.record("astro", dict(fetch=2.0))
+        self.assertEqual(self.history.estimate("astro"), 5.0)
+        self.assertIsNone(self.history.estimate("tip"))
+        self.history.save()
+        history = StageHistory(self.history.path)
+        self.assertEqual(history.estimate("astro"), 5.0)
+
+
+class TestStageScheduling(TestCase):
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        for name in ["xmlBase", "astro", "tip"]:
+            make_remote(self.remote_base, name, [name + "-01-00-00"])
+        self.specs = [PackageSpec(name, name + "-01-00-00")
+                      for name in ["xmlBase", "astro", "tip"]]
+        self.history_path = os.path.join(self.working_path, ".repoman",
+                                         "history.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def test_largest_first(self):
+        workspace = Workspace(self.working_path, self.remote_base,
+                              history=StageHistory(self.history_path))
+        workspace.checkout_packages(self.specs, jobs=1, checkout_jobs=2)
+        workspace.save_state()
+        history = StageHistory(self.history_path)
+        self.assertEqual(sorted(history.entries),
+                         ["astro", "tip", "xmlBase"])
+        self.assertGreater(history.entries["astro"]["fetch"], 0)
+        self.assertGreater(history.entries["astro"]["checkout"], 0)
+
+        history.record("tip", dict(fetch=100.0))
+        history.record("astro", dict(fetch=10.0))
+        workspace = Workspace(self.working_path, self.remote_base,
+                              history=history)
+        workspace.checkout_packages(self.specs, jobs=1, checkout_jobs=2)
+        fetches = [span.package for span in workspace.tracer.spans
+                   if span.name == "fetch"]
+        self.assertEqual(fetches, ["tip", "astro", "xmlBase"])
+        # The bom keeps manifest order
+        self.assertEqual(list(workspace.bom), ["xmlBase", "astro", "tip"])
+
+    def test_unchanged_not_recorded(self):
+        state_file = os.path.join(self.working_path, ".repoman", "state.json")
+        workspace = Workspace(self.working_path, self.remote_base,
+                              history=StageHistory(self.history_path),
+                              state_file=state_file)
+        workspace.checkout_packages(self.specs)
+        workspace.save_state()
+        entries = StageHistory(self.history_path).entries
+        # Nothing is fetched or checked out, the costs stay as they were
+        workspace = Workspace(self.working_path, self.remote_base,
+                              history=StageHistory(self.history_path),
+                              state_file=state_file)
+        workspace.checkout_packages(self.specs)
+        workspace.save_state()
+        self.assertEqual(StageHistory(self.history_path).entries, entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 import unittest
 from unittest import TestCase
-from repoman.package import PackageSpec
-from repoman.manifest import read_manifest, update_manifest
+from repoman.package import PackageSpec, _branch_status
+from repoman.manifest import read_manifest, update_manifest, get_spec, \
+    format_spec, diff_manifests, update_manifests
+from repoman.error import RepomanError
 import os
 import shutil
+import tempfile
 import json
 
 PACKAGELIST_FILES = ["packagelist_1.txt"]
@@ -43,5 +46,87 @@ class TestPackage(TestCase):
             expected = expected_f.read()
         self.assertEqual(actual, expected, "package list differs from expected")
 
+    def test_update_manifests(self):
+        manifest_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, manifest_dir)
+        paths = [os.path.join(manifest_dir, name)
+                 for name in ["ScienceTools.txt", "GlastRelease.txt",
+                              "Other.txt"]]
+        contents = [
+            "# ScienceTools\n"
+            "xmlBase xmlBase-05-07-01  # shared\n"
+            "\n"
+            "astro astro-04-00-02 fetch=shallow\n",
+            "xmlBase xmlBase-05-07-01\n"
+            "celestialSources/Pulsar Pulsar-03-03-00\n",
+            "tip tip-02-00-00\n"]
+        for path, content in zip(paths, contents):
+            with open(path, "w") as f:
+                f.write(content)
+        updated = update_manifests(paths, [
+            PackageSpec("xmlBase", "xmlBase-05-08-00"),
+            PackageSpec("astro", "astro-04-00-03"),
+            PackageSpec("celestialSources", "Pulsar-03-03-00", "Pulsar"),
+            PackageSpec("facilities", "facilities-02-00-00")])
+        self.assertEqual(list(updated.items()),
+                         [(paths[0], ["xmlBase", "astro"]),
+                          (paths[1], ["xmlBase"]), (paths[2], [])])
+        with open(paths[0]) as f:
+            self.assertEqual(f.read(),
+                             "# ScienceTools\n"
+                             "xmlBase xmlBase-05-08-00 # shared\n"
+                             "\n"
+                             "astro astro-04-00-03 fetch=shallow\n")
+        with open(paths[1]) as f:
+            self.assertEqual(f.read(),
+                             "xmlBase xmlBase-05-08-00\n"
+                             "celestialSources/Pulsar Pulsar-03-03-00\n")
+        with open(paths[2]) as f:
+            self.assertEqual(f.read(), contents[2])
+        self.assertEqual(sorted(os.listdir(manifest_dir)),
+                         ["GlastRelease.txt", "Other.txt", "ScienceTools.txt"])
+
+    def test_diff_manifests(self):
+        test_dir = os.path.dirname(__file__)
+        manifest_path = os.path.join(test_dir, "packagelist_2.txt")
+        with open(manifest_path + ".json", "r") as json_file:
+            new_specs = [PackageSpec(*spec_args)
+                         for spec_args in json.loads(json_file.read())]
+        old_specs = read_manifest(manifest_path)
+        diff = diff_manifests(old_specs, new_specs[1:])
+        self.assertEqual(diff.added, [new_specs[5]])
+        self.assertEqual(diff.removed, [old_specs[0]])
+        self.assertEqual(diff.retagged, [(old_specs[2], new_specs[2]),
+                                         (old_specs[3], new_specs[3])])
+        self.assertEqual(diff.unchanged, [new_specs[1], new_specs[4]])
+        self.assertEqual(diff.changed_packages(),
+                         ["celestialSources", "xmlBase"])
+        self.assertFalse(PackageSpec("astro", "astro-04-00-01") !=
+                         PackageSpec("astro", "astro-04-00-01"))
+
+    def test_spec_options(self):
+        line = "celestialSources/Pulsar Pulsar-03-03-00 fetch=shallow"
+        spec = get_spec(line)
+        self.assertEqual(spec, PackageSpec("celestialSources",
+                                           "Pulsar-03-03-00", "Pulsar",
+                                           fetch="shallow"))
+        self.assertEqual(format_spec(spec), line)
+        with self.assertRaises(RepomanError):
+            get_spec("astro astro-04-00-02 depth=1")
+
+    def test_branch_status(self):
+        self.assertEqual(
+            _branch_status("## master...origin/master [ahead 1, behind 2]"),
+            ("master", 1, 2))
+        self.assertEqual(_branch_status("## master...origin/master"),
+                         ("master", 0, 0))
+        self.assertEqual(_branch_status("## dev...origin/dev [gone]"),
+                         ("dev", None, None))
+        self.assertEqual(_branch_status("## HEAD (no branch)"),
+                         (None, None, None))
+        self.assertEqual(_branch_status("## No commits yet on master"),
+                         ("master", None, None))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from unittest import TestCase
+from repoman.refs import RefResolver
+from remotes import make_remote, git
+from git import Repo
+import tempfile
+import shutil
+import os
+
+
+class TestRefResolver(TestCase):
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        bare_path = make_remote(self.remote_base, "astro",
+                                ["astro-04-00-01", "astro-04-00-02"])
+        work_path = os.path.join(self.remote_base, "_work", "astro")
+        git(work_path, "branch", "devel", "astro-04-00-01")
+        git(work_path, "push", "-q", bare_path, "devel")
+        self.repo_path = os.path.join(self.remote_base, "clone")
+        git(self.remote_base, "clone", "-q", bare_path, self.repo_path)
+        self.repo = Repo(self.repo_path)
+        self.resolver = RefResolver(self.repo)
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+
+    def rev(self, ref):
+        return git(self.repo_path, "rev-parse", ref + "^{commit}").strip()
+
+    def test_resolve_priority(self):
+        resolution = self.resolver.resolve(["missing", "astro-04-00-01",
+                                            "master"])
+        self.assertEqual(resolution.ref, "astro-04-00-01")
+        self.assertEqual(resolution.candidate, "astro-04-00-01")
+        self.assertEqual(resolution.sha, self.rev("astro-04-00-01"))
+
+    def test_resolve_remote_branch(self):
+        resolution = self.resolver.resolve(["devel"])
+        self.assertEqual(resolution.ref, "origin/devel")
+        self.assertEqual(resolution.sha, self.rev("origin/devel"))
+
+    def test_resolve_commit(self):
+        sha = self.rev("astro-04-00-01")
+        resolution = self.resolver.resolve(["missing", sha[:7]])
+        self.assertEqual(resolution.ref, sha[:7])
+        self.assertEqual(resolution.sha, sha)
+        self.assertIsNone(self.resolver.resolve(["missing", "0000000"]))
+
+    def test_is_tag(self):
+        self.assertTrue(self.resolver.is_tag("astro-04-00-02"))
+        self.assertFalse(self.resolver.is_tag("master"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from unittest import TestCase
+from repoman.error import RepomanError
+from repoman.package import Package, PackageSpec
+from repoman.release import prepare, perform_all, find_prepared
+from repoman.transport import remote_host
+from repoman.workspace import Workspace
+from remotes import make_remote, git, GIT_ENV, \
+    CatFileBackendMixin
+import tempfile
+import shutil
+import os
+
+
+class TestPerformAll(TestCase):
+
+    def setUp(self):
+        environ = dict(os.environ)
+        self.addCleanup(self.restore_environ, environ)
+        os.environ.update(GIT_ENV)
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        self.workspace = Workspace(self.working_path, self.remote_base)
+        make_remote(self.remote_base, "xmlBase", ["xmlBase-05-07-01"])
+        make_remote(self.remote_base, "astro", ["astro-04-00-02"])
+        self.workspace.checkout_packages(
+            [PackageSpec("xmlBase", "master"), PackageSpec("astro", "master")])
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def restore_environ(self, environ):
+        os.environ.clear()
+        os.environ.update(environ)
+
+    def package(self, name):
+        return Package(name, self.workspace,
+                       os.path.join(self.working_path, name))
+
+    def test_perform_all(self):
+        prepare(self.package("xmlBase"), "05-07-02", "Release")
+        prepare(self.package("astro"), "04-00-03", "Release")
+        self.assertEqual(find_prepared(self.working_path),
+                         ["astro", "xmlBase"])
+
+        results = perform_all([self.package("astro"),
+                               self.package("xmlBase")], jobs=2)
+        self.assertEqual([(result.package, result.tag, result.pushed,
+                           result.error) for result in results],
+                         [("astro", "astro-04-00-03", True, None),
+                          ("xmlBase", "xmlBase-05-07-02", True, None)])
+        self.assertIn("astro-04-00-03", git(
+            os.path.join(self.remote_base, "astro.git"), "tag").split())
+        self.assertIn("xmlBase-05-07-02", git(
+            os.path.join(self.remote_base, "xmlBase.git"), "tag").split())
+
+    def test_partial_failure(self):
+        prepare(self.package("xmlBase"), "05-07-02", "Release")
+        prepare(self.package("astro"), "04-00-03", "Release")
+        # The release was tagged by an interrupted run, but not pushed
+        perform_all([self.package("astro")], push=False)
+        shutil.rmtree(os.path.join(self.remote_base, "xmlBase.git"))
+
+        results = perform_all([self.package("astro"),
+                               self.package("xmlBase")])
+        self.assertTrue(results[0].pushed)
+        self.assertIsNone(results[0].error)
+        self.assertFalse(results[1].pushed)
+        self.assertIsInstance(results[1].error, RepomanError)
+        self.assertIn("astro-04-00-03", git(
+            os.path.join(self.remote_base, "astro.git"), "tag").split())
+
+    def test_missing_remote(self):
+        prepare(self.package("xmlBase"), "05-07-02", "Release")
+        prepare(self.package("astro"), "04-00-03", "Release")
+        git(os.path.join(self.working_path, "xmlBase"), "remote", "remove",
+            "origin")
+
+        results = perform_all([self.package("xmlBase"),
+                               self.package("astro")])
+        self.assertEqual(results[0].tag, "xmlBase-05-07-02")
+        self.assertFalse(results[0].pushed)
+        self.assertIsInstance(results[0].error, RepomanError)
+        self.assertTrue(results[1].pushed)
+
+    def test_not_prepared(self):
+        results = perform_all([self.package("astro")])
+        self.assertIsNone(results[0].tag)
+        self.assertIsInstance(results[0].error, RepomanError)
+
+
+class TestRemoteHost(TestCase):
+
+    def test_remote_host(self):
+        self.assertEqual(remote_host("git@github.com:fermi-lat/astro.git"),
+                         "github.com")
+        self.assertEqual(remote_host("https://github.com/fermi-lat/astro"),
+                         "github.com")
+        self.assertEqual(remote_host("ssh://git@example.org:22/astro.git"),
+                         "example.org")
+        self.assertIsNone(remote_host("/data/remotes/astro.git"))
+        self.assertIsNone(remote_host("file:///data/remotes/astro.git"))
+
+
+class TestPerformAllCatFile(CatFileBackendMixin, TestPerformAll):
+    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
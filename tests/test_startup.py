@@ -0,0 +1,41 @@
+import unittest
+from unittest import TestCase
+import subprocess
+import sys
+import time
+
+# Generous, so only real regressions (like importing GitPython
+# eagerly again) trip it on slow machines.
+STARTUP_BUDGET = 1.0
+RUNS = 3
+
+
+class TestStartup(TestCase):
+
+    def run_python(self, code):
+        return subprocess.check_output([sys.executable, "-c", code])
+
+    def test_help_does_not_import_git(self):
+        output = self.run_python(
+            "import sys\n"
+            "from click.testing import CliRunner\n"
+            "from repoman.cli import cli\n"
+            "CliRunner().invoke(cli, ['--help'])\n"
+            "CliRunner().invoke(cli, ['checkout', '--help'])\n"
+            "print(sorted(m for m in ('git', 'repoman.workspace') "
+            "if m in sys.modules))\n")
+        self.assertEqual(output.strip(), b"[]")
+
+    def test_help_startup_time(self):
+        elapsed = []
+        for _ in range(RUNS):
+            start = time.time()
+            subprocess.check_call([sys.executable, "-m", "repoman.cli",
+                                   "--help"], stdout=subprocess.PIPE)
+            elapsed.append(time.time() - start)
+        self.assertLess(min(elapsed), STARTUP_BUDGET,
+                        "repoman --help took {:.3f}s".format(min(elapsed)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest import TestCase
+from repoman.error import RepomanError
+from repoman.timing import Tracer, PACKAGE_SPAN
+from repoman.package import PackageSpec
+from repoman.fetch import FetchScheduler
+from repoman.workspace import Workspace
+from remotes import make_remote
+import io
+import json
+import tempfile
+import shutil
+import time
+
+
+class TestTracer(TestCase):
+
+    def test_slowest(self):
+        tracer = Tracer()
+        tracer.record(PACKAGE_SPAN, "astro", 0, 2.0)
+        tracer.record("fetch", "astro", 0, 1.5)
+        tracer.record("checkout", "astro", 1.5, 0.5)
+        tracer.record(PACKAGE_SPAN, "xmlBase", 0, 3.0)
+        tracer.record("retry-sleep", "xmlBase", 0, 2.5)
+        tracer.record(PACKAGE_SPAN, "tip", 0, 1.0)
+        slowest = tracer.slowest(2)
+        self.assertEqual([(package, total) for package, total, _ in slowest],
+                         [("xmlBase", 3.0), ("astro", 2.0)])
+        self.assertEqual(list(slowest[1][2].items()),
+                         [("fetch", 1.5), ("checkout", 0.5)])
+
+    def test_chrome_trace(self):
+        tracer = Tracer()
+        with tracer.span("fetch", "astro"):
+            time.sleep(0.01)
+        with tracer.span("total"):
+            pass
+        output = io.StringIO()
+        tracer.write_chrome_trace(output)
+        events = json.loads(output.getvalue())["traceEvents"]
+        self.assertEqual([event["name"] for event in events],
+                         ["fetch astro", "total"])
+        self.assertEqual(events[0]["ph"], "X")
+        self.assertGreaterEqual(events[0]["dur"], 10000)
+        self.assertEqual(events[0]["args"], dict(package="astro"))
+        self.assertNotIn("args", events[1])
+
+    def test_disabled(self):
+        tracer = Tracer(enabled=False)
+        with tracer.span("fetch", "astro"):
+            pass
+        self.assertEqual(tracer.spans, [])
+
+
+class TestStageTiming(TestCase):
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        make_remote(self.remote_base, "astro", ["astro-04-00-01"])
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def test_checkout_phases(self):
+        workspace = Workspace(self.working_path, self.remote_base,
+                              fetch_scheduler=FetchScheduler(attempts=2,
+                                                             backoff=0.02))
+        specs = [PackageSpec("astro", "astro-04-00-01"),
+                 PackageSpec("missing", "missing-01-00-00")]
+        with self.assertRaises(RepomanError):
+            workspace.checkout_packages(specs, jobs=2)
+        phases = dict((package, phases) for package, _, phases
+                      in workspace.tracer.slowest())
+        self.assertEqual(sorted(phases), ["astro", "missing"])
+        self.assertIn("fetch", phases["astro"])
+        self.assertIn("checkout", phases["astro"])
+        # Throttling shows up on its own
+        self.assertGreaterEqual(phases["missing"]["retry-sleep"], 0.01)
+        self.assertNotIn("checkout", phases["missing"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from unittest import TestCase
+from repoman.error import RepomanError
+from repoman.package import Package, PackageSpec
+from repoman.manifest import read_manifest
+from repoman.release import resolve_next_version
+from repoman.train import ReleaseTrain, RELEASED
+from repoman.workspace import Workspace
+from remotes import make_remote, git, GIT_ENV
+import tempfile
+import shutil
+import os
+
+MANIFEST = "xmlBase xmlBase-05-07-01\nastro astro-04-00-02  # stable\n"
+
+
+class TestReleaseTrain(TestCase):
+
+    def setUp(self):
+        environ = dict(os.environ)
+        self.addCleanup(self.restore_environ, environ)
+        os.environ.update(GIT_ENV)
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        self.workspace = Workspace(self.working_path, self.remote_base)
+        make_remote(self.remote_base, "xmlBase",
+                    ["xmlBase-05-07-00", "xmlBase-05-07-01"])
+        make_remote(self.remote_base, "astro", ["astro-04-00-02"])
+        make_remote(self.remote_base, "ScienceTools",
+                    ["ScienceTools-01-00-00"],
+                    files={"packageList.txt": MANIFEST})
+        self.workspace.checkout("ScienceTools", "master")
+        self.workspace.checkout_packages(
+            [PackageSpec("xmlBase", "xmlBase-05-07-01"),
+             PackageSpec("astro", "astro-04-00-02")])
+        xml_path = os.path.join(self.working_path, "xmlBase")
+        with open(os.path.join(xml_path, "README"), "a") as f:
+            f.write("unreleased\n")
+        git(xml_path, "commit", "-q", "-a", "-m", "Unreleased change")
+        self.product = Package("ScienceTools", self.workspace,
+                               os.path.join(self.working_path,
+                                            "ScienceTools"))
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def restore_environ(self, environ):
+        os.environ.clear()
+        os.environ.update(environ)
+
+    def test_release_train(self):
+        train = ReleaseTrain(self.product)
+        plan = train.plan()
+        self.assertEqual(list(plan), ["xmlBase"])
+        self.assertEqual(plan["xmlBase"]["version"], "05-07-02")
+        train.start("01-01-00", "Train release", plan)
+        tags = train.run(jobs=2, push=False)
+        self.assertEqual(list(tags.values()),
+                         ["xmlBase-05-07-02", "ScienceTools-01-01-00"])
+
+        self.assertIn("xmlBase-05-07-02", git(
+            os.path.join(self.working_path, "xmlBase"), "tag").split())
+        product_path = self.product.path
+        self.assertEqual(git(product_path, "describe", "--tags"),
+                         "ScienceTools-01-01-00\n")
+        self.assertEqual(git(product_path, "show", "HEAD:packageList.txt"),
+                         "xmlBase xmlBase-05-07-02\n"
+                         "astro astro-04-00-02  # stable\n")
+        self.assertEqual(ReleaseTrain(self.product).state["status"], RELEASED)
+        self.assertFalse(ReleaseTrain(self.product).in_progress)
+
+    def test_resume(self):
+        train = ReleaseTrain(self.product)
+        train.start("01-01-00", "Train release", train.plan())
+        # Interrupted after preparing the package
+        train._prepare("xmlBase", "Train release")
+
+        train = ReleaseTrain(self.product)
+        self.assertTrue(train.in_progress)
+        with self.assertRaises(RepomanError):
+            train.start("01-02-00", "Another train", train.plan())
+        train.run(push=False)
+        self.assertEqual([spec.ref for spec in read_manifest(
+            os.path.join(self.product.path, "packageList.txt"))],
+            ["xmlBase-05-07-02", "astro-04-00-02"])
+
+    def test_resume_push(self):
+        train = ReleaseTrain(self.product)
+        train.start("01-01-00", "Train release", train.plan())
+        xml_remote = os.path.join(self.remote_base, "xmlBase.git")
+        os.rename(xml_remote, xml_remote + ".away")
+        with self.assertRaises(RepomanError):
+            train.run()
+        self.assertTrue(ReleaseTrain(self.product).in_progress)
+        # The product isn't released with a tag which wasn't pushed
+        self.assertNotIn("ScienceTools-01-01-00", git(
+            os.path.join(self.remote_base, "ScienceTools.git"),
+            "tag").split())
+
+        os.rename(xml_remote + ".away", xml_remote)
+        ReleaseTrain(self.product).run()
+        self.assertIn("xmlBase-05-07-02", git(xml_remote, "tag").split())
+        self.assertIn("ScienceTools-01-01-00", git(
+            os.path.join(self.remote_base, "ScienceTools.git"),
+            "tag").split())
+
+    def test_bump_from_newest(self):
+        xml_path = os.path.join(self.working_path, "xmlBase")
+        # A newer release, from another line than the one staged
+        git(xml_path, "tag", "xmlBase-05-08-00", "xmlBase-05-07-00")
+        package = Package("xmlBase", self.workspace, xml_path)
+        plan = ReleaseTrain(self.product).plan(bump="minor")
+        self.assertEqual(plan["xmlBase"]["previous"], "xmlBase-05-07-01")
+        self.assertEqual(plan["xmlBase"]["version"], "05-09-00")
+        self.assertEqual(resolve_next_version(package, minor=True),
+                         "05-09-00")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from unittest import TestCase
+from repoman.transport import resolve_remote_base, GITHUB_SSH, \
+    FAILED_PROBE_TTL, _control_dir
+import tempfile
+import shutil
+import json
+import time
+import os
+
+
+class TestTransport(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.cache_dir, "transport.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def write_probe(self, ok, age):
+        with open(self.cache_file, "w") as f:
+            json.dump({GITHUB_SSH: dict(ok=ok, time=time.time() - age)}, f)
+
+    def test_other_remote_base(self):
+        self.assertEqual(resolve_remote_base("/srv/git", self.cache_file),
+                         "/srv/git")
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_cached_probe(self):
+        self.write_probe(False, 10)
+        self.assertEqual(
+            resolve_remote_base("git@github.com:fermi-lat", self.cache_file,
+                                multiplex=False),
+            "https://github.com/fermi-lat")
+        self.write_probe(True, 10)
+        self.assertEqual(
+            resolve_remote_base("git@github.com:fermi-lat", self.cache_file,
+                                multiplex=False),
+            "git@github.com:fermi-lat")
+
+    def test_failed_probe_retried(self):
+        # An ssh which authenticates, like GitHub refusing a shell
+        bin_dir = os.path.join(self.cache_dir, "bin")
+        os.mkdir(bin_dir)
+        ssh = os.path.join(bin_dir, "ssh")
+        with open(ssh, "w") as f:
+            f.write("#!/bin/sh\nexit 1\n")
+        os.chmod(ssh, 0o755)
+        path = os.environ["PATH"]
+        self.addCleanup(os.environ.__setitem__, "PATH", path)
+        os.environ["PATH"] = bin_dir + os.pathsep + path
+
+        self.write_probe(False, FAILED_PROBE_TTL + 10)
+        self.assertEqual(
+            resolve_remote_base("git@github.com:fermi-lat", self.cache_file,
+                                multiplex=False),
+            "git@github.com:fermi-lat")
+        with open(self.cache_file) as f:
+            self.assertTrue(json.load(f)[GITHUB_SSH]["ok"])
+
+    def test_control_dir(self):
+        path = os.path.join(self.cache_dir,
+                            "repoman-ssh-{}".format(os.getuid()))
+        self.assertEqual(_control_dir(self.cache_dir), path)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+        # Created already, by another run
+        self.assertEqual(_control_dir(self.cache_dir), path)
+
+        os.chmod(path, 0o755)
+        self.assertIsNone(_control_dir(self.cache_dir))
+        os.rmdir(path)
+
+        # Someone else's directory, through a link
+        other = tempfile.mkdtemp(dir=self.cache_dir)
+        os.symlink(other, path)
+        self.assertIsNone(_control_dir(self.cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from unittest import TestCase
+from repoman.error import RepomanError
+from repoman.package import Package
+from repoman.release import resolve_next_version
+from repoman.versions import VersionIndex, parse_tag
+from remotes import make_remote, git
+import tempfile
+import shutil
+import os
+
+
+class TestVersionIndex(TestCase):
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        bare_path = make_remote(
+            self.remote_base, "astro",
+            ["astro-04-00-02", "astro-10-00-00", "astro-04-01-00",
+             "astro-04-00-10"])
+        self.path = os.path.join(self.working_path, "astro")
+        git(self.working_path, "clone", "-q", bare_path, self.path)
+        # Not releases
+        git(self.path, "tag", "astro-04-02-00-rc1")
+        git(self.path, "tag", "astroData-11-00-00")
+        self.package = Package("astro", None, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def test_queries(self):
+        index = VersionIndex("astro", self.package.repo)
+        self.assertEqual(index.versions, [(4, 0, 2), (4, 0, 10), (4, 1, 0),
+                                          (10, 0, 0)])
+        self.assertEqual(index.latest(), "astro-10-00-00")
+        self.assertEqual(index.next_version("patch"), "10-00-01")
+        self.assertEqual(index.next_version("minor"), "10-01-00")
+        self.assertEqual(index.next_version("major"), "11-00-00")
+        self.assertTrue(index.exists("astro-04-00-10"))
+        self.assertFalse(index.exists("astro-04-00-03"))
+        self.assertTrue(index.exists("astro-04-02-00-rc1"))
+        self.assertFalse(index.exists("astro-04-02-00-rc2"))
+        self.assertEqual(resolve_next_version(self.package, minor=True),
+                         "10-01-00")
+        with self.assertRaises(RepomanError):
+            resolve_next_version(self.package)
+
+    def test_incremental(self):
+        VersionIndex("astro", self.package.repo).latest()
+        git(self.path, "tag", "astro-10-00-01")
+        git(self.path, "pack-refs", "--all")
+        git(self.path, "tag", "astro-10-01-00")
+        index = VersionIndex("astro", self.package.repo)
+        self.assertEqual(index.latest(), "astro-10-01-00")
+        self.assertTrue(index.exists("astro-10-00-01"))
+
+        git(self.path, "tag", "-d", "astro-10-01-00", "astro-10-00-00")
+        # The refs are only read again when asked to
+        self.assertEqual(index.latest(), "astro-10-01-00")
+        index.refresh()
+        self.assertEqual(index.latest(), "astro-10-00-01")
+        self.assertFalse(index.exists("astro-10-00-00"))
+
+    def test_coarse_timestamps(self):
+        index = VersionIndex("astro", self.package.repo)
+        index.latest()
+        git(self.path, "pack-refs", "--all")
+        packed_refs = os.path.join(self.path, ".git", "packed-refs")
+        tags_dir = os.path.join(self.path, ".git", "refs", "tags")
+        stats = [os.stat(path) for path in [packed_refs, tags_dir]]
+        index.refresh()
+        # Tags changed within the same timestamp, as on NFS
+        git(self.path, "tag", "-d", "astro-10-00-00")
+        git(self.path, "tag", "-a", "-m", "astro-10-00-01", "astro-10-00-01")
+        git(self.path, "pack-refs")
+        for path, stat in zip([packed_refs, tags_dir], stats):
+            os.utime(path, (stat.st_atime, stat.st_mtime))
+        index.refresh()
+        self.assertEqual(index.latest(), "astro-10-00-01")
+        self.assertFalse(index.exists("astro-10-00-00"))
+
+    def test_saved(self):
+        VersionIndex("astro", self.package.repo).latest()
+        index = VersionIndex("astro", self.package.repo)
+        index.repo = None
+        # Read without asking git
+        self.assertEqual(index.latest(), "astro-10-00-00")
+
+    def test_parse_tag(self):
+        self.assertEqual(parse_tag("astro", "astro-04-00-02"), (4, 0, 2))
+        self.assertEqual(parse_tag("astro", "astro-100-00-02"), (100, 0, 2))
+        self.assertIsNone(parse_tag("astro", "astro-4-00-02"))
+        self.assertIsNone(parse_tag("astro", "v04-00-02"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
 import unittest
 from unittest import TestCase
 from repoman.error import RepomanError
-from repoman.workspace import Workspace
+from repoman.workspace import Workspace, _cone_patterns
+from repoman.cache import MirrorCache
+from repoman.remote import RemoteRefIndex
+from repoman.fetch import FetchScheduler
 from repoman.package import PackageSpec
+from repoman.cli import cli
+from remotes import make_remote, git, restore_env, CatFileBackendMixin
+from click.testing import CliRunner
 import tempfile
+import time
 import shutil
 import os
 
@@ -43,5 +50,521 @@ class TestStage(TestCase):
         self.workspace.checkout_packages(packages)
 
 
+class TestLocalStage(TestCase):
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        self.workspace = Workspace(self.working_path, self.remote_base)
+        make_remote(self.remote_base, "xmlBase",
+                    ["xmlBase-05-07-00", "xmlBase-05-07-01"])
+        make_remote(self.remote_base, "astro",
+                    ["astro-04-00-01", "astro-04-00-02"])
+        make_remote(self.remote_base, "celestialSources",
+                    ["celestialSources-01-06-00", "Pulsar-03-03-00"],
+                    paths=["src", "Pulsar", "genericSources"])
+        self.specs = [
+            PackageSpec("xmlBase", "xmlBase-05-07-01"),
+            PackageSpec("celestialSources", "celestialSources-01-06-00"),
+            PackageSpec("celestialSources", "Pulsar-03-03-00", "Pulsar"),
+            PackageSpec("astro", "astro-04-00-01")
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def test_checkout_packages_jobs(self):
+        self.workspace.checkout_packages(self.specs, jobs=4)
+        self.assertEqual(list(self.workspace.bom),
+                         ["xmlBase", "celestialSources",
+                          "celestialSources/Pulsar", "astro"])
+        self.assertEqual(self.workspace.bom["astro"]["tag"], "astro-04-00-01")
+        self.assertEqual(self.workspace.bom["celestialSources/Pulsar"]["tag"],
+                         "Pulsar-03-03-00")
+        self.assertEqual(sorted(self.workspace.fetched),
+                         ["astro", "celestialSources", "xmlBase"])
+        pulsar_path = os.path.join(self.working_path, "celestialSources",
+                                   "Pulsar", "version.txt")
+        with open(pulsar_path) as f:
+            self.assertEqual(f.read(), "Pulsar 1\n")
+
+    def test_checkout_packages_pipelined(self):
+        # Many fetch workers feeding a single checkout worker
+        self.workspace.checkout_packages(self.specs, jobs=3, checkout_jobs=1)
+        self.assertEqual(list(self.workspace.bom),
+                         ["xmlBase", "celestialSources",
+                          "celestialSources/Pulsar", "astro"])
+        spans = self.workspace.tracer.spans
+        checkout_threads = set(span.thread for span in spans
+                               if span.name == "checkout")
+        self.assertEqual(len(checkout_threads), 1)
+        queued = [span.package for span in spans if span.name == "queued"]
+        self.assertEqual(sorted(queued),
+                         ["astro", "celestialSources", "xmlBase"])
+        pulsar_path = os.path.join(self.working_path, "celestialSources",
+                                   "Pulsar", "version.txt")
+        with open(pulsar_path) as f:
+            self.assertEqual(f.read(), "Pulsar 1\n")
+
+    def test_checkout_paths_together(self):
+        specs = [
+            PackageSpec("celestialSources", "Pulsar-03-03-00", "Pulsar"),
+            PackageSpec("celestialSources", "celestialSources-01-06-00"),
+            PackageSpec("celestialSources", "Pulsar-03-03-00",
+                        "genericSources")
+        ]
+        self.workspace.checkout_packages(specs)
+        # The base, then both paths at once
+        checkouts = [span for span in self.workspace.tracer.spans
+                     if span.name == "checkout"]
+        self.assertEqual(len(checkouts), 2)
+        bom = self.workspace.bom
+        self.assertEqual(list(bom), ["celestialSources",
+                                     "celestialSources/Pulsar",
+                                     "celestialSources/genericSources"])
+        self.assertEqual(bom["celestialSources"]["tag"],
+                         "celestialSources-01-06-00")
+        package_path = os.path.join(self.working_path, "celestialSources")
+        pulsar_commit = git(package_path, "rev-parse",
+                            "Pulsar-03-03-00^{commit}").strip()
+        for path in ["Pulsar", "genericSources"]:
+            key = "celestialSources/" + path
+            self.assertEqual(bom[key], dict(commit=pulsar_commit,
+                                            tag="Pulsar-03-03-00"))
+            with open(os.path.join(package_path, path, "version.txt")) as f:
+                self.assertEqual(f.read(), path + " 1\n")
+        self.assertEqual(git(package_path, "rev-parse", "HEAD").strip(),
+                         bom["celestialSources"]["commit"])
+
+    def test_checkout_packages_jobs_error(self):
+        specs = self.specs + [PackageSpec("missing", "missing-01-00-00")]
+        with self.assertRaises(RepomanError):
+            self.workspace.checkout_packages(specs, jobs=4)
+
+    def test_checkout_through_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = MirrorCache(cache_dir)
+        workspace = Workspace(self.working_path, self.remote_base, cache)
+        workspace.checkout_packages(self.specs)
+        self.assertEqual(cache.mirrors(),
+                         ["astro", "celestialSources", "xmlBase"])
+
+        # A second workspace only needs the mirrors
+        shutil.rmtree(os.path.join(self.remote_base, "astro.git"))
+        other_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_path)
+        other = Workspace(other_path, self.remote_base, cache)
+        other.checkout("astro", "astro-04-00-02")
+        self.assertEqual(other.bom["astro"]["tag"], "astro-04-00-02")
+        alternates = os.path.join(other_path, "astro", ".git", "objects",
+                                  "info", "alternates")
+        self.assertTrue(os.path.exists(alternates))
+
+        # Both workspaces still borrow objects from the mirror
+        astro_path = os.path.join(other_path, "astro")
+        self.assertEqual(cache.users("astro"), [
+            os.path.join(self.working_path, "astro", ".git"),
+            os.path.join(astro_path, ".git")])
+        self.assertEqual(cache.prune(["astro"]), [])
+        self.assertEqual(cache.prune(["astro"], dissociate=True), ["astro"])
+        self.assertEqual(cache.mirrors(), ["celestialSources", "xmlBase"])
+        self.assertFalse(os.path.exists(alternates))
+        git(astro_path, "fsck")
+        self.assertEqual(git(astro_path, "describe", "--tags").strip(),
+                         "astro-04-00-02")
+
+    def test_cache_keeps_shared_objects(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = MirrorCache(cache_dir, max_age=None)
+        work_path = os.path.join(self.remote_base, "_work", "astro")
+        bare_path = os.path.join(self.remote_base, "astro.git")
+        git(work_path, "checkout", "-q", "-b", "feature")
+        with open(os.path.join(work_path, "README"), "w") as f:
+            f.write("feature\n")
+        git(work_path, "commit", "-q", "-a", "-m", "Feature")
+        git(work_path, "push", "-q", bare_path, "feature")
+        workspace = Workspace(self.working_path, self.remote_base, cache)
+        workspace.checkout("astro", "feature")
+
+        # The branch is deleted at origin, then pruned from the mirror
+        git(bare_path, "branch", "-D", "feature")
+        mirror_path = cache.mirror_path("astro")
+        with cache._package_lock("astro"):
+            cache.update("astro", bare_path)
+        git(mirror_path, "gc", "-q", "--prune=now")
+        astro_path = os.path.join(self.working_path, "astro")
+        git(mirror_path, "cat-file", "-e",
+            git(astro_path, "rev-parse", "HEAD").strip())
+        git(astro_path, "fsck")
+
+    def hang(self, repo_path):
+        """
+        Make fetches of the repo from origin hang, like a stalled SSH
+        connection.
+        """
+        if not os.path.isdir(repo_path):
+            git(self.working_path, "init", "-q", repo_path)
+            git(repo_path, "remote", "add", "origin",
+                os.path.join(self.remote_base, "astro.git"))
+        git(repo_path, "config", "remote.origin.uploadpack",
+            "exec sleep 30 #")
+
+    def assert_deadline(self, workspace, **kwargs):
+        start = time.time()
+        with self.assertRaises(RepomanError):
+            workspace.checkout("astro", "astro-04-00-01", **kwargs)
+        self.assertLess(time.time() - start, 15)
+
+    def test_fetch_deadline_through_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = MirrorCache(cache_dir)
+        self.hang(cache.mirror_path("astro"))
+        workspace = Workspace(
+            self.working_path, self.remote_base, cache,
+            fetch_scheduler=FetchScheduler(attempts=1, deadline=1))
+        self.assert_deadline(workspace)
+
+    def test_fetch_deadline_targeted(self):
+        self.hang(os.path.join(self.working_path, "astro"))
+        workspace = Workspace(
+            self.working_path, self.remote_base,
+            fetch_scheduler=FetchScheduler(attempts=1, deadline=1))
+        self.assert_deadline(workspace, fetch_strategy="targeted")
+
+    def test_checkout_with_remote_index(self):
+        self.workspace.checkout("astro", "astro-04-00-02")
+        index = RemoteRefIndex(os.path.join(self.working_path, "index.json"))
+        index.update({"astro": self.workspace.repo_url("astro")})
+        resolution = index.resolve("astro", self.workspace.repo_url("astro"),
+                                   ["astro-04-00-01"])
+        self.assertEqual(resolution.ref, "refs/tags/astro-04-00-01")
+
+        # The commit is already there, so the remote isn't needed
+        shutil.rmtree(os.path.join(self.remote_base, "astro.git"))
+        workspace = Workspace(self.working_path, self.remote_base,
+                              remote_index=RemoteRefIndex(index.path))
+        workspace.checkout("astro", "astro-04-00-01")
+        self.assertEqual(workspace.bom["astro"]["tag"], "astro-04-00-01")
+
+        # Saving an index which was never read keeps its entries
+        RemoteRefIndex(index.path).save()
+        self.assertIsNotNone(RemoteRefIndex(index.path).cached(
+            "astro", self.workspace.repo_url("astro")))
+
+    def test_remote_index_deadline(self):
+        # A stalled SSH connection
+        environ = os.environ.get("GIT_SSH_COMMAND")
+        self.addCleanup(restore_env, "GIT_SSH_COMMAND", environ)
+        os.environ["GIT_SSH_COMMAND"] = "sleep 30 #"
+        index = RemoteRefIndex(
+            os.path.join(self.working_path, "index.json"),
+            scheduler=FetchScheduler(attempts=1, deadline=1))
+        start = time.time()
+        with self.assertRaises(RepomanError):
+            index.update({"astro": "ssh://example.org/astro.git"})
+        self.assertLess(time.time() - start, 15)
+
+    def test_restage_unchanged(self):
+        state_file = os.path.join(self.working_path, ".repoman", "state.json")
+        workspace = Workspace(self.working_path, self.remote_base,
+                              state_file=state_file)
+        workspace.checkout_packages(self.specs)
+        workspace.save_state()
+        bom = workspace.bom
+
+        # Tags are trusted locally, so the remote isn't needed
+        shutil.rmtree(os.path.join(self.remote_base, "astro.git"))
+        workspace = Workspace(self.working_path, self.remote_base,
+                              state_file=state_file)
+        workspace.checkout_packages(self.specs)
+        self.assertEqual(workspace.fetched, [])
+        self.assertEqual(workspace.bom, bom)
+
+        # Local changes mean the package is staged again
+        with open(os.path.join(self.working_path, "xmlBase", "README"),
+                  "w") as f:
+            f.write("changed\n")
+        workspace = Workspace(self.working_path, self.remote_base,
+                              state_file=state_file)
+        workspace.checkout_packages(self.specs)
+        self.assertEqual(workspace.fetched, ["xmlBase"])
+
+    def test_restage_path_before_base(self):
+        make_remote(self.remote_base, "Likelihood",
+                    ["Likelihood-01-00-00", "Pulsar-01-00-00",
+                     "Likelihood-01-01-00"], paths=["src", "Pulsar"])
+        state_file = os.path.join(self.working_path, ".repoman", "state.json")
+        package_path = os.path.join(self.working_path, "Likelihood")
+        pulsar = PackageSpec("Likelihood", "Pulsar-01-00-00", "Pulsar")
+        for base_ref, commit in [("Likelihood-01-00-00", 0),
+                                 ("Likelihood-01-01-00", 2)]:
+            workspace = Workspace(self.working_path, self.remote_base,
+                                  state_file=state_file)
+            # Only the base is retagged the second time
+            workspace.checkout_packages(
+                [pulsar, PackageSpec("Likelihood", base_ref)], force=True,
+                sparse=False)
+            workspace.save_state()
+            with open(os.path.join(package_path, "Pulsar",
+                                   "version.txt")) as f:
+                self.assertEqual(f.read(), "Pulsar 1\n")
+            with open(os.path.join(package_path, "src", "version.txt")) as f:
+                self.assertEqual(f.read(), "src {}\n".format(commit))
+            self.assertEqual(workspace.bom["Likelihood"]["tag"], base_ref)
+            self.assertEqual(workspace.bom["Likelihood/Pulsar"]["tag"],
+                             "Pulsar-01-00-00")
+
+    def test_restage_dropped_path(self):
+        state_file = os.path.join(self.working_path, ".repoman", "state.json")
+        package_path = os.path.join(self.working_path, "celestialSources")
+        workspace = Workspace(self.working_path, self.remote_base,
+                              state_file=state_file)
+        workspace.checkout_packages(self.specs[1:3], sparse=False)
+        workspace.save_state()
+
+        workspace = Workspace(self.working_path, self.remote_base,
+                              state_file=state_file)
+        workspace.checkout_packages(self.specs[1:2], sparse=False)
+        workspace.save_state()
+        with open(os.path.join(package_path, "Pulsar", "version.txt")) as f:
+            self.assertEqual(f.read(), "Pulsar 0\n")
+        self.assertEqual(git(package_path, "status", "--porcelain"), "")
+        self.assertEqual(list(workspace.state), ["celestialSources"])
+        self.assertEqual(list(workspace.bom), ["celestialSources"])
+
+    def test_remove(self):
+        self.workspace.checkout_packages(self.specs)
+        xml_path = os.path.join(self.working_path, "xmlBase")
+        with open(os.path.join(xml_path, "README"), "w") as f:
+            f.write("changed\n")
+        with self.assertRaises(RepomanError):
+            self.workspace.remove("xmlBase")
+        git(xml_path, "checkout", "-q", "-b", "feature")
+        git(xml_path, "commit", "-q", "-a", "-m", "Local change")
+        # Detached again, the commit is only on a local branch
+        git(xml_path, "checkout", "-q", "xmlBase-05-07-01")
+        with self.assertRaises(RepomanError):
+            self.workspace.remove("xmlBase")
+        self.assertTrue(os.path.isdir(xml_path))
+        self.workspace.remove("xmlBase", force=True)
+        self.assertFalse(os.path.exists(xml_path))
+
+        # Overlaid paths are local changes of the base
+        with self.assertRaises(RepomanError):
+            self.workspace.remove("celestialSources")
+        self.workspace.remove("celestialSources", force=True)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.working_path, "celestialSources")))
+        self.workspace.remove("astro")
+        self.assertEqual(list(self.workspace.bom), [])
+
+    def test_remove_locked(self):
+        self.workspace.checkout_packages(self.specs)
+        other_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_path)
+        workspace = Workspace(other_path, self.remote_base)
+        workspace.checkout_lock(self.workspace.bom)
+        # Commits fetched by SHA aren't under any ref, yet were pushed
+        workspace.remove("astro")
+        self.assertFalse(os.path.exists(os.path.join(other_path, "astro")))
+
+    def test_checkout_lock(self):
+        self.workspace.checkout_packages(self.specs)
+        bom = self.workspace.bom
+        bom["celestialSources/Pulsar"] = dict(
+            commit=git(os.path.join(self.working_path, "celestialSources"),
+                       "rev-parse", "Pulsar-03-03-00^{commit}").strip(),
+            tag="Pulsar-03-03-00")
+
+        other_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_path)
+        workspace = Workspace(other_path, self.remote_base)
+        workspace.checkout_lock(bom, jobs=4)
+        self.assertEqual(list(workspace.bom),
+                         ["xmlBase", "celestialSources",
+                          "celestialSources/Pulsar", "astro"])
+        for key in ["xmlBase", "celestialSources", "astro"]:
+            head = git(os.path.join(other_path, key), "rev-parse", "HEAD")
+            self.assertEqual(head.strip(), bom[key]["commit"])
+        package_path = os.path.join(other_path, "celestialSources")
+        self.assertEqual(sorted(os.listdir(package_path)),
+                         [".git", "Pulsar", "README"])
+        with open(os.path.join(package_path, "Pulsar", "version.txt")) as f:
+            self.assertEqual(f.read(), "Pulsar 1\n")
+        self.assertEqual(git(package_path, "tag"), "")
+
+    def test_checkout_shallow(self):
+        self.workspace.checkout_packages(
+            [PackageSpec("astro", "astro-04-00-01", fetch="shallow")])
+        astro_path = os.path.join(self.working_path, "astro")
+        self.assertTrue(os.path.exists(
+            os.path.join(astro_path, ".git", "shallow")))
+        self.assertEqual(git(astro_path, "rev-list", "--count", "HEAD"),
+                         "1\n")
+        self.assertEqual(self.workspace.bom["astro"]["tag"], "astro-04-00-01")
+
+        # Another ref in the same package is fetched on demand
+        self.workspace.checkout("astro", "astro-04-00-02",
+                                fetch_strategy="shallow")
+        self.assertEqual(self.workspace.bom["astro"]["tag"], "astro-04-00-02")
+
+        # A full fetch turns the repo into a complete one
+        self.workspace.fetched = []
+        self.workspace.checkout("astro", "astro-04-00-02")
+        self.assertFalse(os.path.exists(
+            os.path.join(astro_path, ".git", "shallow")))
+
+    def test_checkout_targeted(self):
+        workspace = Workspace(self.working_path, self.remote_base,
+                              fetch_strategy="targeted")
+        workspace.checkout("astro", "astro-04-00-01",
+                           refs=["no-such-branch", "astro-04-00-01"])
+        astro_path = os.path.join(self.working_path, "astro")
+        self.assertEqual(git(astro_path, "tag"), "astro-04-00-01\n")
+        self.assertEqual(workspace.bom["astro"]["tag"], "astro-04-00-01")
+
+        # Unknown refs fall back to fetching everything
+        workspace.fetched = []
+        with self.assertRaises(RepomanError):
+            workspace.checkout("astro", "astro-99-00-00")
+        self.assertEqual(git(astro_path, "tag").split(),
+                         ["astro-04-00-01", "astro-04-00-02"])
+
+    def test_checkout_blobless(self):
+        git(os.path.join(self.remote_base, "xmlBase.git"),
+            "config", "uploadpack.allowFilter", "true")
+        workspace = Workspace(self.working_path, self.remote_base,
+                              fetch_strategy="blobless")
+        workspace.checkout("xmlBase", "xmlBase-05-07-00")
+        xml_path = os.path.join(self.working_path, "xmlBase")
+        self.assertEqual(git(xml_path, "config", "remote.origin.promisor"),
+                         "true\n")
+        with open(os.path.join(xml_path, "src", "version.txt")) as f:
+            self.assertEqual(f.read(), "src 0\n")
+
+    def test_checkout_sparse(self):
+        self.workspace.checkout_packages(self.specs)
+        package_path = os.path.join(self.working_path, "celestialSources")
+        self.assertEqual(sorted(os.listdir(package_path)),
+                         [".git", "Pulsar", "README"])
+        with open(os.path.join(package_path, "README")) as f:
+            self.assertEqual(f.read(), "celestialSources 0\n")
+
+        # Dropping the path entries restores the whole tree
+        self.workspace.checkout_packages(self.specs[:2])
+        self.assertEqual(sorted(os.listdir(package_path)),
+                         [".git", "Pulsar", "README", "genericSources",
+                          "src"])
+
+    def test_status(self):
+        self.workspace.checkout_packages(self.specs[:3])
+        self.workspace.checkout("astro", "master")
+        xml_path = os.path.join(self.working_path, "xmlBase")
+        with open(os.path.join(xml_path, "README"), "a") as f:
+            f.write("local change\n")
+        with open(os.path.join(xml_path, "notes.txt"), "w") as f:
+            f.write("untracked\n")
+        specs = self.specs + [PackageSpec("tip", "tip-02-00-00")]
+        statuses = dict((status.name, status) for status in
+                        self.workspace.status(specs, jobs=4))
+        self.assertEqual(sorted(statuses),
+                         ["astro", "celestialSources", "tip", "xmlBase"])
+        xml_status = statuses["xmlBase"]
+        self.assertEqual(xml_status.describe, "xmlBase-05-07-01-dirty")
+        self.assertTrue(xml_status.dirty)
+        self.assertEqual(xml_status.untracked, 1)
+        self.assertTrue(xml_status.at_ref)
+        self.assertIsNone(xml_status.branch)
+        # Paths are staged at their own ref, the base is compared
+        self.assertTrue(statuses["celestialSources"].at_ref)
+        self.assertFalse(statuses["celestialSources"].dirty)
+        astro_status = statuses["astro"]
+        self.assertEqual(astro_status.branch, "master")
+        self.assertEqual((astro_status.ahead, astro_status.behind), (0, 0))
+        self.assertFalse(astro_status.at_ref)
+        self.assertFalse(statuses["tip"].staged)
+
+    def test_cone_patterns(self):
+        self.assertEqual(_cone_patterns([]), ["/*"])
+        self.assertEqual(_cone_patterns(["b/c", "a", "b/c/d", "a/e"]),
+                         ["/*", "!/*/", "/b/", "!/b/*/", "/a/", "/b/c/"])
+
+
+class TestCheckoutSince(TestCase):
+
+    def setUp(self):
+        self.remote_base = tempfile.mkdtemp()
+        self.working_path = tempfile.mkdtemp()
+        make_remote(self.remote_base, "xmlBase",
+                    ["xmlBase-05-07-00", "xmlBase-05-07-01"])
+        make_remote(self.remote_base, "astro",
+                    ["astro-04-00-01", "astro-04-00-02"])
+        make_remote(self.remote_base, "Likelihood", ["Likelihood-01-00-00"])
+        bare_path = make_remote(
+            self.remote_base, "GlastRelease", ["GlastRelease-01-00-00"],
+            files={"packageList.txt": "xmlBase xmlBase-05-07-00\n"
+                                      "astro astro-04-00-01\n"
+                                      "Likelihood Likelihood-01-00-00\n"})
+        # The next release retags xmlBase and drops astro
+        work_path = os.path.join(self.remote_base, "_work", "GlastRelease")
+        with open(os.path.join(work_path, "packageList.txt"), "w") as f:
+            f.write("xmlBase xmlBase-05-07-01\n"
+                    "Likelihood Likelihood-01-00-00\n")
+        git(work_path, "commit", "-q", "-a", "-m", "GlastRelease-01-01-00")
+        git(work_path, "push", "-q", bare_path, "master")
+
+    def tearDown(self):
+        shutil.rmtree(self.remote_base)
+        shutil.rmtree(self.working_path)
+
+    def checkout(self, *args):
+        return CliRunner().invoke(cli, [
+            "--workspace", self.working_path,
+            "--remote-base", self.remote_base,
+            "checkout", "GlastRelease"] + list(args))
+
+    def test_since(self):
+        result = self.checkout("GlastRelease-01-00-00")
+        self.assertEqual(result.exit_code, 0, result.output)
+        result = self.checkout("--since", "GlastRelease-01-00-00")
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("0 added, 1 removed, 1 retagged, 1 unchanged",
+                      result.output)
+        xml_path = os.path.join(self.working_path, "xmlBase")
+        self.assertEqual(git(xml_path, "describe", "--tags").strip(),
+                         "xmlBase-05-07-01")
+        # Without --prune, removed packages are left alone
+        self.assertTrue(os.path.isdir(
+            os.path.join(self.working_path, "astro")))
+
+    def test_since_prune(self):
+        self.checkout("GlastRelease-01-00-00")
+        astro_path = os.path.join(self.working_path, "astro")
+        with open(os.path.join(astro_path, "README"), "w") as f:
+            f.write("changed\n")
+        git(astro_path, "commit", "-q", "-a", "-m", "Never pushed")
+        result = self.checkout("--since", "GlastRelease-01-00-00", "--prune")
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("never pushed", result.output)
+        self.assertTrue(os.path.isdir(astro_path))
+
+        result = self.checkout("--since", "GlastRelease-01-00-00", "--prune",
+                               "--force")
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertFalse(os.path.exists(astro_path))
+
+
+class TestLocalStageCatFile(CatFileBackendMixin, TestLocalStage):
+    pass
+
+
+class TestCheckoutSinceCatFile(CatFileBackendMixin, TestCheckoutSince):
+    pass
+
+
 if __name__ == '__main__':
     unittest.main()